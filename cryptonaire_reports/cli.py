@@ -1,67 +1,479 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, Callable, Optional, Set, Tuple
+
 import click
 
-from cryptonaire_reports.reports.portfolio import Portfolio
+from cryptonaire_reports.utils.parse_functions import parse_duration
 from cryptonaire_reports.utils.parse_functions import parse_exchanges
 from cryptonaire_reports.utils.parse_functions import parse_networks
+from cryptonaire_reports.utils.parse_functions import parse_refresh
+from cryptonaire_reports.utils.config import get_config
+from cryptonaire_reports.utils.config import set_config_path
 from cryptonaire_reports.utils.logger import LoggerConfig
+from cryptonaire_reports.utils.profiler import PROFILE_FORMATS
+from cryptonaire_reports.utils.profiler import Profiler
+from cryptonaire_reports.utils.scheduler import PeriodicTask
+from cryptonaire_reports.utils.timings import Timings
+
+if TYPE_CHECKING:
+    from cryptonaire_reports.reports.portfolio import Portfolio
 
 
 @click.group()
-def crypto_report():
-    pass
+@click.option(
+    "--config",
+    "config_path",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="""Path of the config file. Defaults to the CRYPTONAIRE_CONFIG environment
+    variable, or cryptonaire_reports.config in the current directory.""",
+)
+def crypto_report(config_path: str):
+    set_config_path(config_path)
+
+
+# Options shared by the commands that collect the portfolio
+PORTFOLIO_OPTIONS = [
+    click.option(
+        "--networks",
+        "-n",
+        type=str,
+        default=None,
+        help="""Networks from which we want to extract balances from (Currently
+        supports: Ethereum, Solana). Defaults to None. If set to all, it generates a
+        report with all avaiable networks in the config file""",
+    ),
+    click.option(
+        "--exchanges",
+        "-e",
+        type=str,
+        default=None,
+        help="""Exchanges to extract the information from. Defaults to None. If set to
+        all, it generates a report with the information from all available exchanges
+        (Binance, BingX, Coinbase, ByBit and Gate)""",
+    ),
+    click.option(
+        "--include-manual",
+        "-m",
+        is_flag=True,
+        default=False,
+        help="""Includes the balances of a CSV file located in CSV_PATH.""",
+    ),
+    click.option(
+        "--max-workers",
+        type=click.IntRange(min=1),
+        default=None,
+        help="""Maximum number of exchanges and networks queried at the same time.
+        Defaults to one worker per configured source.""",
+    ),
+    click.option(
+        "--refresh-map",
+        is_flag=True,
+        default=False,
+        help="""Ignores the local CoinMarketCap index and requests the id, name and
+        rank of every symbol again.""",
+    ),
+    click.option(
+        "--no-history",
+        is_flag=True,
+        default=False,
+        help="""Doesn't append this report to the local history used by the history
+        command.""",
+    ),
+    click.option(
+        "--debug",
+        is_flag=True,
+        default=False,
+        help="""Exchange to extract the information from. Defaults to all, which 
+        generates a report with the information from all available exchanges (Binance,
+        BingX, Gate and ByBit)""",
+    ),
+]
+
+# Options shared by the commands that write portfolio reports
+OUTPUT_OPTIONS = [
+    click.option(
+        "--format",
+        "output_format",
+        type=click.Choice(["xlsx", "csv", "parquet", "arrow"], case_sensitive=False),
+        default=None,
+        help="""Format of the report. Defaults to the formatted XLSX. csv returns the
+        raw report, and parquet and arrow return it with typed columns (requires
+        pyarrow).""",
+    ),
+    click.option(
+        "--csv",
+        is_flag=True,
+        default=False,
+        help="""If set, returns the raw report format rather than the formatted XLSX.
+        Same as --format csv""",
+    ),
+]
+
+
+def portfolio_options(command: Callable) -> Callable:
+    for option in reversed(PORTFOLIO_OPTIONS):
+        command = option(command)
+    return command
+
+
+def output_options(command: Callable) -> Callable:
+    for option in reversed(OUTPUT_OPTIONS):
+        command = option(command)
+    return command
+
+
+def create_portfolio(
+    networks: str,
+    exchanges: str,
+    include_manual: bool,
+    max_workers: int,
+    refresh_map: bool,
+    no_history: bool,
+    debug: bool,
+    refresh_sources: Set[str],
+    output_format: Optional[str] = None,
+    csv: bool = False,
+    write_report: bool = True,
+) -> "Portfolio":
+    # Imported here so pandas and the reporting stack are only loaded when needed
+    from cryptonaire_reports.reports.portfolio import Portfolio
+
+    LoggerConfig(log_level="debug" if debug else "info")
+    if csv and output_format not in (None, "csv"):
+        raise click.BadOptionUsage(
+            "csv", f"--csv can't be used together with --format {output_format}"
+        )
+    output_format = (output_format or ("csv" if csv else "xlsx")).lower()
+    # Parses and validates the whole config file before connecting to any source
+    get_config()
+    exchanges = parse_exchanges(exchanges) if exchanges else []
+    networks = parse_networks(networks) if networks else []
+    return Portfolio(
+        exchanges=exchanges,
+        networks=networks,
+        include_manual=include_manual,
+        output_format=output_format if write_report else None,
+        max_workers=max_workers,
+        refresh_map=refresh_map,
+        record_history=not no_history,
+        refresh_sources=refresh_sources,
+    )
 
 
 @click.command()
+@portfolio_options
+@output_options
 @click.option(
-    "--networks",
-    "-n",
+    "--refresh",
     type=str,
     default=None,
-    help="""Networks from which we want to extract balances from (Currently supports:
-    Ethereum, Solana). Defaults to None. If set to all, it generates a report with all 
-    avaiable networks in the config file""",
+    help="""Exchanges and networks whose balances are read again even if the cached
+    ones haven't expired yet, e.g. binance,solana. If set to all, every source is read
+    again.""",
 )
 @click.option(
-    "--exchanges",
-    "-e",
+    "--timings",
+    is_flag=True,
+    default=False,
+    help="""Prints how long every stage, source and API call took once the report is
+    done, with the number of calls, errors, retries and bytes.""",
+)
+@click.option(
+    "--timings-file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="""Writes every span measured by --timings to a JSON trace file, which can be
+    opened with https://ui.perfetto.dev. Implies --timings.""",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Profiles every thread while the report is generated and writes it to a file.",
+)
+@click.option(
+    "--profile-format",
+    type=click.Choice(PROFILE_FORMATS, case_sensitive=False),
+    default=None,
+    help="""Format of the --profile file: pstats (cProfile, the default), collapsed
+    stacks for flame graphs, or speedscope JSON. The last two sample the stacks, so
+    they include the time spent waiting for the APIs.""",
+)
+@click.option(
+    "--profile-memory",
+    is_flag=True,
+    default=False,
+    help="""Traces the memory allocations with tracemalloc and prints the peak and the
+    sites that allocated the most memory once the report is done. Slows the report
+    down.""",
+)
+def portfolio(
+    networks: str,
+    exchanges: str,
+    include_manual: bool,
+    output_format: Optional[str],
+    csv: bool,
+    max_workers: int,
+    refresh_map: bool,
+    no_history: bool,
+    debug: bool,
+    refresh: str,
+    timings: bool,
+    timings_file: Optional[str],
+    profile: Optional[str],
+    profile_format: Optional[str],
+    profile_memory: bool,
+):
+    if profile_format and not profile:
+        raise click.BadOptionUsage(
+            "profile_format", "--profile-format can only be used together with --profile"
+        )
+    timings = timings or timings_file is not None
+    if timings:
+        Timings().enable(trace=timings_file is not None)
+    profiler = None
+    if profile or profile_memory:
+        profiler = Profiler(
+            output_format=(profile_format or "pstats").lower() if profile else None,
+            trace_memory=profile_memory,
+        )
+        profiler.start()
+    try:
+        portfolio = create_portfolio(
+            networks=networks,
+            exchanges=exchanges,
+            include_manual=include_manual,
+            output_format=output_format,
+            csv=csv,
+            max_workers=max_workers,
+            refresh_map=refresh_map,
+            no_history=no_history,
+            debug=debug,
+            refresh_sources=parse_refresh(refresh) if refresh else set(),
+        )
+        portfolio.report()
+    finally:
+        # Also shown when the report fails, since it tells where the time went
+        if profiler:
+            profiler.stop()
+            if profile:
+                profiler.write(profile)
+                click.echo(f"Profile written to {profile}")
+            if profile_memory:
+                click.echo(profiler.format_allocations())
+        if timings:
+            click.echo(Timings().format_summary())
+        if timings_file:
+            Timings().write_trace(timings_file)
+            click.echo(f"Trace written to {timings_file}")
+
+
+@click.command()
+@portfolio_options
+@output_options
+@click.option(
+    "--interval",
+    type=str,
+    default="5m",
+    help="""Time between two reports, e.g. 30s, 5m or 1h. Defaults to 5m.""",
+)
+@click.option(
+    "--jitter",
     type=str,
     default=None,
-    help="""Exchanges to extract the information from. Defaults to None. If set to all, 
-    it generates a report with the information from all available exchanges (Binance,
-    BingX, Coinbase, ByBit and Gate)""",
+    help="""Maximum random deviation of every report from the schedule, e.g. 30s, so
+    several processes don't query the APIs at the same moment. Defaults to a tenth of
+    the interval.""",
 )
 @click.option(
-    "--include-manual",
-    "-m",
+    "--snapshot-only",
     is_flag=True,
     default=False,
-    help="""Includes the balances of a CSV file located in CSV_PATH.""",
+    help="""Only appends every report to the local history, without writing a report
+    file every cycle.""",
 )
+def watch(
+    networks: str,
+    exchanges: str,
+    include_manual: bool,
+    output_format: Optional[str],
+    csv: bool,
+    max_workers: int,
+    refresh_map: bool,
+    no_history: bool,
+    debug: bool,
+    interval: str,
+    jitter: Optional[str],
+    snapshot_only: bool,
+):
+    """Keeps running and generates a portfolio report on a schedule. The clients of
+    the exchanges and networks, their connections and the CoinMarketCap caches stay
+    warm between reports. Stops after the current report on SIGTERM or Ctrl+C."""
+    if snapshot_only and no_history:
+        raise click.BadOptionUsage(
+            "snapshot_only", "--snapshot-only can't be used together with --no-history"
+        )
+    interval_seconds = parse_duration(interval)
+    jitter_seconds = parse_duration(jitter) if jitter else interval_seconds / 10
+    portfolio = create_portfolio(
+        networks=networks,
+        exchanges=exchanges,
+        include_manual=include_manual,
+        output_format=output_format,
+        csv=csv,
+        max_workers=max_workers,
+        refresh_map=refresh_map,
+        no_history=no_history,
+        debug=debug,
+        # Every cycle reads the balances again. The cache is only written, for the
+        # portfolio command
+        refresh_sources=parse_refresh("all"),
+        write_report=not snapshot_only,
+    )
+    PeriodicTask(
+        portfolio.report, interval=interval_seconds, jitter=jitter_seconds
+    ).run()
+
+
+@click.command()
+@portfolio_options
 @click.option(
-    "--csv",
+    "--host",
+    type=str,
+    default="127.0.0.1",
+    help="""Interface the server listens on. Defaults to 127.0.0.1 (only local
+    connections).""",
+)
+@click.option(
+    "--port",
+    type=click.IntRange(min=1, max=65535),
+    default=8000,
+    help="""Port the server listens on. Defaults to 8000.""",
+)
+@click.option(
+    "--ttl",
+    type=str,
+    default="60s",
+    help="""Time a collected portfolio is served before collecting it again, e.g. 30s
+    or 5m. Defaults to 60s.""",
+)
+def serve(
+    networks: str,
+    exchanges: str,
+    include_manual: bool,
+    max_workers: int,
+    refresh_map: bool,
+    no_history: bool,
+    debug: bool,
+    host: str,
+    port: int,
+    ttl: str,
+):
+    """Serves the portfolio as JSON over HTTP in /portfolio, /portfolio/{symbol} and
+    /sources. The portfolio is collected on the first request and kept in memory for
+    --ttl, and simultaneous requests share the same collection."""
+    from cryptonaire_reports.reports.portfolio_server import PortfolioServer
+
+    ttl_seconds = parse_duration(ttl)
+    portfolio = create_portfolio(
+        networks=networks,
+        exchanges=exchanges,
+        include_manual=include_manual,
+        max_workers=max_workers,
+        refresh_map=refresh_map,
+        no_history=no_history,
+        debug=debug,
+        # The balances cache could be older than the TTL of the server
+        refresh_sources=parse_refresh("all"),
+        write_report=False,
+    )
+    PortfolioServer(portfolio, ttl=ttl_seconds, host=host, port=port).serve_forever()
+
+
+@click.command()
+@click.option(
+    "--symbol",
+    "-s",
+    "symbols",
+    multiple=True,
+    help="""Shows the balance, price and value of this symbol over time. Can be used
+    several times.""",
+)
+@click.option(
+    "--by-source",
     is_flag=True,
     default=False,
-    help="""If set, returns the raw report format rather than the formatted XLSX""",
+    help="""Shows the value held in every exchange, network and manual source over
+    time. Combined with --symbol, only those symbols are included.""",
+)
+@click.option(
+    "--since",
+    type=click.DateTime(),
+    default=None,
+    help="""Only includes the reports generated since this date or time (UTC).""",
+)
+@click.option(
+    "--until",
+    type=click.DateTime(),
+    default=None,
+    help="""Only includes the reports generated until this date or time (UTC).""",
 )
 @click.option(
-    "--debug",
+    "--csv",
     is_flag=True,
     default=False,
-    help="""Exchange to extract the information from. Defaults to all, which 
-    generates a report with the information from all available exchanges (Binance,
-    BingX, Gate and ByBit)""",
+    help="""If set, prints the result as CSV rather than as a table""",
 )
-def portfolio(networks: str, exchanges: str, include_manual: bool, csv: bool, debug: bool):
-    LoggerConfig(log_level="debug" if debug else "info")
-    exchanges = parse_exchanges(exchanges) if exchanges else []
-    networks = parse_networks(networks) if networks else []
-    portfolio = Portfolio(
-        exchanges=exchanges, networks=networks, include_manual=include_manual, raw=csv
-    )
-    portfolio.report()
+def history(
+    symbols: Tuple[str, ...],
+    by_source: bool,
+    since: Optional[datetime],
+    until: Optional[datetime],
+    csv: bool,
+):
+    """Shows how the portfolio changed over time, based on the reports generated by
+    the portfolio command. By default, shows the total value of every report."""
+    # Imported here so pandas is only loaded when needed
+    from cryptonaire_reports.utils.snapshot_store import SnapshotStore
+
+    LoggerConfig(log_level="info")
+    store = SnapshotStore()
+    if not store.path.exists():
+        click.echo("No reports found. Run crypto-report portfolio to generate one.")
+        return
+    # Symbols are stored in upper case. The ones given are also looked up as they
+    # are, in case two symbols only differ in case
+    symbol_filter = sorted({*symbols, *(symbol.upper() for symbol in symbols)})
+    if by_source:
+        history_pdf = store.source_breakdown(
+            symbols=symbol_filter, since=since, until=until
+        )
+    elif symbols:
+        history_pdf = store.symbol_balances(
+            symbols=symbol_filter, since=since, until=until
+        )
+    else:
+        history_pdf = store.total_value(since=since, until=until)
+
+    if history_pdf.empty:
+        if symbols:
+            click.echo(f"No data found for {', '.join(symbols)} in the reports.")
+        elif since or until:
+            click.echo("No reports found in the given period.")
+        else:
+            click.echo("No reports found. Run crypto-report portfolio to generate one.")
+        return
+    if csv:
+        click.echo(history_pdf.to_csv(index=False), nl=False)
+    else:
+        click.echo(history_pdf.to_string(index=False))
 
 
 crypto_report.add_command(portfolio)
+crypto_report.add_command(history)
+crypto_report.add_command(watch)
+crypto_report.add_command(serve)
 
 if __name__ == "__main__":
     crypto_report()
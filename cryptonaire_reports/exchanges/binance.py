@@ -1,14 +1,29 @@
+import math
 import structlog
 
-from typing import Tuple, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Iterator
 from binance.spot import Spot
 from binance.api import API
 from cryptonaire_reports.exchanges.exchange import Exchange
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.rate_limiter import TokenBucket
 from cryptonaire_reports.utils.singleton import Singleton
 from cryptonaire_reports.utils.symbol_corrector import symbol_corrector
+from cryptonaire_reports.utils.timings import span
+from cryptonaire_reports.utils.timings import timed
 
 logger = structlog.get_logger()
 
+# Maximum number of positions per page in the Simple Earn position endpoints
+EARN_PAGE_SIZE = 100
+# Request weight of the Simple Earn position endpoints
+EARN_POSITION_WEIGHT = 150
+# Request weight allowed per minute and IP
+WEIGHT_LIMIT_PER_MINUTE = 6000
+# Maximum number of pages requested at the same time
+EARN_MAX_WORKERS = 4
+
 
 class Binance(Exchange, metaclass=Singleton):
 
@@ -22,19 +37,64 @@ class Binance(Exchange, metaclass=Singleton):
             api_secret=self._secret_key,
             base_url="https://api.binance.com",
         )
+        self.weight_limiter = TokenBucket(
+            rate_per_minute=WEIGHT_LIMIT_PER_MINUTE, name="Binance"
+        )
 
     @property
     def name(self) -> str:
         return "Binance"
 
-    def get_spot_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    def _get_all_earn_positions(
+        self, get_position_page: Callable[..., Dict], earn_type: str
+    ) -> List[Dict]:
+        """Retrieves all the pages of a Simple Earn position endpoint. The first page
+        tells the total number of positions, and the remaining pages are requested
+        concurrently while staying under the Binance weight limit.
+
+        Args:
+            get_position_page (Callable[..., Dict]): Spot client method that returns
+                one page of positions
+            earn_type (str): Type of earn product, only used in the logs
+
+        Returns:
+            List[Dict]: All the positions of the endpoint
+        """
+
+        def _get_page(page: int) -> Dict:
+            self.weight_limiter.acquire(EARN_POSITION_WEIGHT)
+            with span(f"Binance.{get_position_page.__name__}", "sdk"):
+                return get_position_page(
+                    recvWindow=30000, current=page, size=EARN_PAGE_SIZE
+                )
+
+        first_page = _get_page(1)
+        all_products = list(first_page.get("rows", []))
+        total_expected = first_page["total"]
+        total_pages = math.ceil(total_expected / EARN_PAGE_SIZE)
+        if total_pages > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(EARN_MAX_WORKERS, total_pages - 1),
+                thread_name_prefix="binance-earn",
+            ) as executor:
+                for page in executor.map(_get_page, range(2, total_pages + 1)):
+                    all_products.extend(page.get("rows", []))
+        logger.info(
+            f"[{self.name.upper()}] Retrieved {len(all_products)} of {total_expected} "
+            f"products from {earn_type} earn in {max(total_pages, 1)} pages"
+        )
+        return all_products
+
+    @timed("source")
+    def get_spot_balances(self) -> BalanceBatch:
         logger.info(f"[{self.name.upper()}] Extracting balances from Spot account...")
         source_name = "Binance (Spot)"
-        spot_balances = []
+        spot_balances = BalanceBatch()
         try:
-            response = self.spot_client.account(
-                recvWindow=30000, omitZeroBalances="true"
-            )
+            with span("Binance.account", "sdk"):
+                response = self.spot_client.account(
+                    recvWindow=30000, omitZeroBalances="true"
+                )
             logger.debug(f"[{self.name.upper()}] Full response: {response}")
             for coin_asset in response["balances"]:
                 coin_ticker = symbol_corrector(coin_asset["asset"])
@@ -52,8 +112,7 @@ class Binance(Exchange, metaclass=Singleton):
                 balance = float(coin_asset["free"]) + float(coin_asset["locked"])
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                spot_balances.append((source_name, coin_ticker, balance, 0, 0))
+                spot_balances.append(source_name, coin_ticker, balance)
             logger.debug(f"[{self.name.upper()}] Spot balances: \n{spot_balances}")
             return spot_balances
         except Exception as e:
@@ -61,31 +120,22 @@ class Binance(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving spot balances from Binance"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_earn_flexible_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    @timed("source")
+    def get_earn_flexible_balances(self) -> BalanceBatch:
         logger.info(
             f"[{self.name.upper()}] Extracting balances from flexible earn account..."
         )
         source_name = "Binance (Flexible Earn)"
-        earn_balances = []
+        earn_balances = BalanceBatch()
         try:
-            all_products = []
-            retrieved_all = False
-            while not retrieved_all:
-                response = self.spot_client.get_flexible_product_position(
-                    recvWindow=30000, size=100
-                )
-                all_products.extend(response["rows"])
-                total_expected = response["total"]
-                if total_expected == len(all_products):
-                    retrieved_all = True
-                    logger.info(
-                        f"[{self.name.upper()}] Retrieved {total_expected} products "
-                        f"from flexible earn"
-                    )
+            all_products = self._get_all_earn_positions(
+                get_position_page=self.spot_client.get_flexible_product_position,
+                earn_type="flexible",
+            )
             logger.debug(f"[{self.name.upper()}] Full response: {all_products}")
-            for product in response["rows"]:
+            for product in all_products:
                 coin_ticker = symbol_corrector(product["asset"])
 
                 if coin_ticker in self.token_ignore_list:
@@ -94,8 +144,7 @@ class Binance(Exchange, metaclass=Singleton):
                 balance = float(product["totalAmount"])
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                earn_balances.append((source_name, coin_ticker, balance, 0, 0))
+                earn_balances.append(source_name, coin_ticker, balance)
             logger.debug(
                 f"[{self.name.upper()}] Flexible Earn balances: \n{earn_balances}"
             )
@@ -105,29 +154,20 @@ class Binance(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving flexible balances from Binance"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_earn_locked_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    @timed("source")
+    def get_earn_locked_balances(self) -> BalanceBatch:
         logger.info(
             f"[{self.name.upper()}] Extracting balances from locked earn account..."
         )
         source_name = "Binance (Locked Earn)"
-        earn_balances = []
+        earn_balances = BalanceBatch()
         try:
-            all_products = []
-            retrieved_all = False
-            while not retrieved_all:
-                response = self.spot_client.get_locked_product_position(
-                    recvWindow=30000, size=100
-                )
-                all_products.extend(response["rows"])
-                total_expected = response["total"]
-                if total_expected == len(all_products):
-                    retrieved_all = True
-                    logger.info(
-                        f"[{self.name.upper()}] Retrieved {total_expected} products "
-                        f"from locked earn"
-                    )
+            all_products = self._get_all_earn_positions(
+                get_position_page=self.spot_client.get_locked_product_position,
+                earn_type="locked",
+            )
             logger.debug(f"[{self.name.upper()}] Full response: {all_products}")
             for product in all_products:
                 coin_ticker = symbol_corrector(product["asset"])
@@ -138,7 +178,7 @@ class Binance(Exchange, metaclass=Singleton):
                 balance = float(product["amount"])
                 if not balance > 0:
                     continue
-                earn_balances.append((source_name, coin_ticker, balance, 0, 0))
+                earn_balances.append(source_name, coin_ticker, balance)
             logger.debug(
                 f"[{self.name.upper()}] Locked Earn balances: \n{earn_balances}"
             )
@@ -148,12 +188,10 @@ class Binance(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving locked balances from Binance"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_balances(self) -> List[Tuple[str, str, float, float, float]]:
-        balances = []
-        balances.extend(self.get_spot_balances())
-        balances.extend(self.get_earn_flexible_balances())
-        balances.extend(self.get_earn_locked_balances())
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        yield self.get_spot_balances()
+        yield self.get_earn_flexible_balances()
+        yield self.get_earn_locked_balances()
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
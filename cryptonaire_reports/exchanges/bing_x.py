@@ -1,14 +1,16 @@
 import hmac
 import json
-import requests
 import structlog
 import time
 
 from hashlib import sha256
-from typing import Tuple, List, Dict, Optional
+from typing import Dict, Optional, Iterator
 from cryptonaire_reports.exchanges.exchange import Exchange
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.http_client import HttpClient
 from cryptonaire_reports.utils.singleton import Singleton
 from cryptonaire_reports.utils.symbol_corrector import symbol_corrector
+from cryptonaire_reports.utils.timings import timed
 
 logger = structlog.get_logger()
 
@@ -44,13 +46,14 @@ class BingX(Exchange, metaclass=Singleton):
         ).hexdigest()
         url = "%s%s?%s&signature=%s" % (API_URL, endpoint, params, signature)
         headers = {"X-BX-APIKEY": self._api_key}
-        response = requests.request(method, url, headers=headers, data=payload)
+        response = HttpClient().request(method, url, headers=headers, data=payload)
         return json.loads(response.text)
 
-    def get_spot_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    @timed("source")
+    def get_spot_balances(self) -> BalanceBatch:
         logger.info(f"[{self.name.upper()}] Extracting balances from Spot account...")
         source_name = "BingX (Spot)"
-        spot_balances = []
+        spot_balances = BalanceBatch()
         try:
             spot_acc_balance = self._api_request(
                 endpoint="/openApi/spot/v1/account/balance"
@@ -65,8 +68,7 @@ class BingX(Exchange, metaclass=Singleton):
                 balance = float(coin_asset["free"]) + float(coin_asset["locked"])
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                spot_balances.append((source_name, coin_ticker, balance, 0, 0))
+                spot_balances.append(source_name, coin_ticker, balance)
             logger.debug(f"[{self.name.upper()}] Spot balances: \n{spot_balances}")
             return spot_balances
         except Exception as e:
@@ -74,18 +76,16 @@ class BingX(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving spot balances from {self.name.upper()}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_wealth_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    def get_wealth_balances(self) -> BalanceBatch:
         logger.warning(
             f"[{self.name.upper()}] BingX doesn't provide wealth balances yet. That information "
             "must be entered manually until the API enables wealth balances."
         )
-        return []
+        return BalanceBatch()
 
-    def get_balances(self) -> List[Tuple[str, str, float, float, float]]:
-        balances = []
-        balances.extend(self.get_spot_balances())
-        balances.extend(self.get_wealth_balances())
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        yield self.get_spot_balances()
+        yield self.get_wealth_balances()
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
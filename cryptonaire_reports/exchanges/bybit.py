@@ -1,9 +1,12 @@
 import structlog
 
-from typing import Tuple, List
+from typing import Iterator
 from cryptonaire_reports.exchanges.exchange import Exchange
+from cryptonaire_reports.utils.balances import BalanceBatch
 from cryptonaire_reports.utils.singleton import Singleton
 from cryptonaire_reports.utils.symbol_corrector import symbol_corrector
+from cryptonaire_reports.utils.timings import span
+from cryptonaire_reports.utils.timings import timed
 from pybit.unified_trading import HTTP
 
 logger = structlog.get_logger()
@@ -23,16 +26,18 @@ class ByBit(Exchange, metaclass=Singleton):
     def name(self) -> str:
         return "ByBit"
 
+    @timed("source")
     def get_unified_trading_balances(
         self,
-    ) -> List[Tuple[str, str, float, float, float]]:
+    ) -> BalanceBatch:
         logger.info(f"[{self.name.upper()}] Extracting balances from Spot account...")
         source_name = "ByBit (Unified Trading)"
-        spot_balances = []
+        spot_balances = BalanceBatch()
         try:
-            unified_account_wallet = self.client.get_wallet_balance(
-                accountType="UNIFIED"
-            )
+            with span("ByBit.get_wallet_balance", "sdk"):
+                unified_account_wallet = self.client.get_wallet_balance(
+                    accountType="UNIFIED"
+                )
             logger.debug(
                 f"[{self.name.upper()}] Full response: {unified_account_wallet}"
             )
@@ -45,8 +50,7 @@ class ByBit(Exchange, metaclass=Singleton):
                 balance = float(coin_asset["equity"])
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                spot_balances.append((source_name, coin_ticker, balance, 0, 0))
+                spot_balances.append(source_name, coin_ticker, balance)
             logger.debug(
                 f"[{self.name.upper()}] Unified trading balances: \n{spot_balances}"
             )
@@ -56,10 +60,8 @@ class ByBit(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving unified trading balances from {self.name.upper()}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_balances(self) -> List[Tuple[str, str, float, float, float]]:
-        balances = []
-        balances.extend(self.get_unified_trading_balances())
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        yield self.get_unified_trading_balances()
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
@@ -1,10 +1,13 @@
 import structlog
 
-from typing import Tuple, List, Dict, Optional
+from typing import Dict, Optional, Iterator
 from coinbase.rest import RESTClient
 from cryptonaire_reports.exchanges.exchange import Exchange
+from cryptonaire_reports.utils.balances import BalanceBatch
 from cryptonaire_reports.utils.singleton import Singleton
 from cryptonaire_reports.utils.symbol_corrector import symbol_corrector
+from cryptonaire_reports.utils.timings import span
+from cryptonaire_reports.utils.timings import timed
 
 logger = structlog.get_logger()
 
@@ -21,13 +24,15 @@ class Coinbase(Exchange, metaclass=Singleton):
     def name(self) -> str:
         return "Coinbase"
 
-    def get_spot_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    @timed("source")
+    def get_spot_balances(self) -> BalanceBatch:
         logger.info(f"[{self.name.upper()}] Extracting balances from Spot account...")
-        spot_balances = []
+        spot_balances = BalanceBatch()
         source_name = f"{self.name} (Spot)"
 
         try:
-            accounts = self.client.get_accounts()
+            with span("Coinbase.get_accounts", "sdk"):
+                accounts = self.client.get_accounts()
             logger.debug(f"[{self.name.upper()}] Full response: {accounts}")
 
             for account in accounts["accounts"]:
@@ -41,8 +46,7 @@ class Coinbase(Exchange, metaclass=Singleton):
                 balance = float(available["value"]) + float(hold["value"])
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                spot_balances.append((source_name, coin_ticker, balance, 0, 0))
+                spot_balances.append(source_name, coin_ticker, balance)
 
             logger.debug(f"[{self.name.upper()}] Spot balances: \n{spot_balances}")
             return spot_balances
@@ -52,10 +56,8 @@ class Coinbase(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving spot balances from {self.name.upper()}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_balances(self) -> List[Tuple[str, str, float, float, float]]:
-        balances = []
-        balances.extend(self.get_spot_balances())
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        yield self.get_spot_balances()
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
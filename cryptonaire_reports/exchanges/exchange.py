@@ -1,8 +1,10 @@
 import abc
-from typing import Tuple, List
-from configparser import ConfigParser
+import hashlib
+from typing import Iterator
 
 import structlog
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.config import get_config
 
 logger = structlog.get_logger()
 
@@ -10,32 +12,44 @@ logger = structlog.get_logger()
 class Exchange:
 
     def __init__(self, exchange_name: str) -> None:
-        config = ConfigParser()
-        config.read("cryptonaire_reports.config")
-        if exchange_name not in config:
+        exchange_config = get_config().exchanges.get(exchange_name)
+        if exchange_config is None:
             logger.warning(f"No keys found for {exchange_name}, skipping exchange")
             self.active = False
         else:
             logger.info(f"API keys found for {exchange_name}")
             self.active = True
-            self._api_key = config.get(exchange_name, "API_KEY")
-            self._secret_key = config.get(exchange_name, "SECRET_KEY")
-            try:
-                self.token_ignore_list = config.get(
-                    "Ignore Tokens", exchange_name.upper()
-                ).split(",")
+            self._api_key = exchange_config.api_key
+            self._secret_key = exchange_config.secret_key
+            self.token_ignore_list = exchange_config.token_ignore_list
+            if self.token_ignore_list:
                 logger.info(
                     f"Token ignore list for {exchange_name}: "
                     f"{",".join(self.token_ignore_list)}"
                 )
-            except:
-                self.token_ignore_list = []
+            else:
                 logger.debug(f"Token ignore list is empty for {exchange_name}")
 
     @property
     def name(self) -> str:
         pass
 
+    @property
+    def cache_key(self) -> str:
+        """Key of the balances of this source in the local cache. It changes when the
+        API key or the ignore list change, without storing the key in the cache."""
+        ignore_list = ",".join(self.token_ignore_list)
+        fingerprint = hashlib.sha256(
+            f"{self._api_key}|{ignore_list}".encode("utf-8")
+        ).hexdigest()
+        return f"{self.name}:{fingerprint[:16]}"
+
     @abc.abstractmethod
-    def get_balances(self) -> Tuple[str, str, float]:
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        """Yields the balances one account at a time, so they can be aggregated while
+        the rest of the accounts are still being read.
+
+        Yields:
+            BalanceBatch: Balances of each account
+        """
         raise NotImplementedError
@@ -1,9 +1,12 @@
-from typing import Tuple, List
+from typing import Iterator
 
 import structlog
 from cryptonaire_reports.exchanges.exchange import Exchange
+from cryptonaire_reports.utils.balances import BalanceBatch
 from cryptonaire_reports.utils.singleton import Singleton
 from cryptonaire_reports.utils.symbol_corrector import symbol_corrector
+from cryptonaire_reports.utils.timings import span
+from cryptonaire_reports.utils.timings import timed
 from gate_api import ApiClient, Configuration
 from gate_api.api.spot_api import SpotApi
 from gate_api.api.earn_uni_api import EarnUniApi
@@ -30,18 +33,20 @@ class Gate(Exchange, metaclass=Singleton):
     def name(self) -> str:
         return "Gate"
 
-    def get_spot_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    @timed("source")
+    def get_spot_balances(self) -> BalanceBatch:
         """Extracts the balance from the spot account on Gate.io
 
         Returns:
-            List[Tuple[str, float]]: List of tuples that cointain (symbol, balance)
+            BalanceBatch: Balances found, one per symbol
         """
         logger.info(f"[{self.name.upper()}] Extracting balances from Spot account...")
         source_name = "Gate (Spot)"
-        spot_balances = []
+        spot_balances = BalanceBatch()
         try:
             coin_asset: SpotAccount
-            response = self.spot_api.list_spot_accounts()
+            with span("Gate.list_spot_accounts", "sdk"):
+                response = self.spot_api.list_spot_accounts()
             logger.debug(f"[{self.name.upper()}] Full response: {response}")
             for coin_asset in response:
                 coin_ticker = symbol_corrector(coin_asset.currency)
@@ -52,8 +57,7 @@ class Gate(Exchange, metaclass=Singleton):
                 balance = float(coin_asset.available) + float(coin_asset.locked)
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                spot_balances.append((source_name, coin_ticker, balance, 0, 0))
+                spot_balances.append(source_name, coin_ticker, balance)
             logger.debug(f"[{self.name.upper()}] Spot balances: \n{spot_balances}")
             return spot_balances
         except Exception as e:
@@ -61,15 +65,17 @@ class Gate(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving spot balances from {self.name.upper()}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_earn_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    @timed("source")
+    def get_earn_balances(self) -> BalanceBatch:
         logger.info(f"[{self.name.upper()}] Extracting balances from Earn account...")
         source_name = "Gate (Earn)"
-        earn_balances = []
+        earn_balances = BalanceBatch()
         try:
             earn_lend: UniLend
-            response = self.earn_uni_api.list_user_uni_lends()
+            with span("Gate.list_user_uni_lends", "sdk"):
+                response = self.earn_uni_api.list_user_uni_lends()
             logger.debug(f"[{self.name.upper()}] Full response: {response}")
             for earn_lend in response:
                 coin_ticker = symbol_corrector(earn_lend.currency)
@@ -80,8 +86,7 @@ class Gate(Exchange, metaclass=Singleton):
                 balance = float(earn_lend.amount)
                 if not balance > 0:
                     continue
-                # Last two elements are backup price and backup market cap
-                earn_balances.append((source_name, coin_ticker, balance, 0, 0))
+                earn_balances.append(source_name, coin_ticker, balance)
             logger.debug(f"[{self.name.upper()}] Earn balances: \n{earn_balances}")
             return earn_balances
         except Exception as e:
@@ -89,17 +94,15 @@ class Gate(Exchange, metaclass=Singleton):
                 f"[{self.name.upper()}] Error while retrieving earn balances from {self.name.upper()}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_balances(self) -> List[Tuple[str, str, float, float, float]]:
+    def iter_balances(self) -> Iterator[BalanceBatch]:
         """Extracts the balances from the following accounts in gate.io:
         - Spot
 
-        Returns:
-            List[Tuple[str, float]]: List of tuples that cointain (symbol, balance)
+        Yields:
+            BalanceBatch: Balances of each account
         """
-        balances = []
-        balances.extend(self.get_spot_balances())
-        balances.extend(self.get_earn_balances())
+        yield self.get_spot_balances()
+        yield self.get_earn_balances()
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
@@ -1,8 +1,10 @@
-import requests
-from typing import List, Tuple
+from typing import Iterator
 
 import structlog
 from cryptonaire_reports.networks.network import Network
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.http_client import HttpClient
+from cryptonaire_reports.utils.timings import timed
 
 logger = structlog.get_logger()
 
@@ -18,31 +20,31 @@ class Ethereum(Network):
     def name(self) -> str:
         return "Ethereum"
 
-    def get_eth_mainnet_balances(self) -> List[Tuple[str, str, float]]:
+    @timed("source")
+    def get_eth_mainnet_balances(self, address: str) -> BalanceBatch:
         logger.info(
-            f"[{self.name.upper()}] Extracting balances from Ethereum Mainnet..."
+            f"[{self.name.upper()}] Extracting balances of {address} from Ethereum "
+            f"Mainnet..."
         )
-        mainnet_balances = []
+        mainnet_balances = BalanceBatch()
         try:
-            for address in self._addresses:
-                source_name = f"Ethereum Wallet"
-                address_info = requests.get(
-                    f"{API_URL}/getAddressInfo/{address}?apiKey=freekey"
-                ).json()
-                # Extract ETH Balance
-                eth_balance = address_info["ETH"]["balance"]
-                mainnet_balances.append((source_name, "ETH", eth_balance, 0, 0))
-                # Extract additional tokens balance
-                for token in address_info["tokens"]:
-                    symbol = token["tokenInfo"]["symbol"]
-                    exploded_balance = int(token["balance"])
-                    decimal_position = token["tokenInfo"]["decimals"]
-                    divider = float("1e+" + decimal_position)
-                    balance = exploded_balance / divider
-
-                    if symbol not in self.token_ignore_list:
-                        # Last two elements are backup price and backup market cap
-                        mainnet_balances.append((source_name, symbol, balance, 0, 0))
+            source_name = f"Ethereum Wallet"
+            address_info = HttpClient().get(
+                f"{API_URL}/getAddressInfo/{address}?apiKey=freekey"
+            ).json()
+            # Extract ETH Balance
+            eth_balance = address_info["ETH"]["balance"]
+            mainnet_balances.append(source_name, "ETH", eth_balance)
+            # Extract additional tokens balance
+            for token in address_info.get("tokens", []):
+                symbol = token["tokenInfo"]["symbol"]
+                exploded_balance = int(token["balance"])
+                decimal_position = token["tokenInfo"]["decimals"]
+                divider = float("1e+" + decimal_position)
+                balance = exploded_balance / divider
+
+                if symbol not in self.token_ignore_list:
+                    mainnet_balances.append(source_name, symbol, balance)
 
             logger.debug(
                 f"[{self.name.upper()}] Ethereum Mainnet balances: \n{mainnet_balances}"
@@ -53,10 +55,9 @@ class Ethereum(Network):
                 f"[{self.name.upper()}] Error while retrieving balances from {self.name.upper()}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(complete=False)
 
-    def get_balances(self) -> List[Tuple[str, str, float, float, float]]:
-        balances = []
-        balances.extend(self.get_eth_mainnet_balances())
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        for address in self._addresses:
+            yield self.get_eth_mainnet_balances(address)
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
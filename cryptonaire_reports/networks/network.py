@@ -1,8 +1,10 @@
 import abc
-from configparser import ConfigParser
-from typing import Tuple
+import hashlib
+from typing import Iterator
 
 import structlog
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.config import get_config
 
 logger = structlog.get_logger()
 
@@ -10,9 +12,9 @@ logger = structlog.get_logger()
 class Network:
 
     def __init__(self, network: str) -> None:
-        config = ConfigParser()
-        config.read("cryptonaire_reports.config")
-        if "Networks" not in config:
+        config = get_config()
+        self.token_ignore_list = []
+        if not config.has_networks_section:
             logger.warning(
                 f"Network configuration not found. If you want to retrieve balances "
                 f"from {network}, you need to add the following section to your config "
@@ -24,31 +26,45 @@ class Network:
             self.active = False
             return
 
-        if config.get("Networks", network):
-            logger.info(f"Network addresses found for {network}")
-            self.active = True
-            addresses = config.get("Networks", network)
-            self._addresses = addresses if isinstance(addresses, list) else [addresses]
-        else:
+        network_config = config.networks.get(network)
+        if network_config is None:
             logger.warning(f"No addresses found for {network}, skipping network")
             self.active = False
+            return
 
-        try:
-            self.token_ignore_list = config.get(
-                "Ignore Tokens", network.upper()
-            ).split(",")
+        logger.info(f"Network addresses found for {network}")
+        self.active = True
+        self._addresses = network_config.addresses
+        self.token_ignore_list = network_config.token_ignore_list
+        if self.token_ignore_list:
             logger.info(
                 f"Token ignore list for {network}: "
                 f"{",".join(self.token_ignore_list)}"
             )
-        except:
-            self.token_ignore_list = []
+        else:
             logger.debug(f"Token ignore list is empty for {network}")
 
     @property
     def name(self) -> str:
         pass
 
+    @property
+    def cache_key(self) -> str:
+        """Key of the balances of this source in the local cache. It changes when the
+        addresses or the ignore list change, without storing them in the cache."""
+        addresses = ",".join(self._addresses)
+        ignore_list = ",".join(self.token_ignore_list)
+        fingerprint = hashlib.sha256(
+            f"{addresses}|{ignore_list}".encode("utf-8")
+        ).hexdigest()
+        return f"{self.name}:{fingerprint[:16]}"
+
     @abc.abstractmethod
-    def get_balances(self) -> Tuple[str, str, float]:
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        """Yields the balances one wallet at a time, so they can be aggregated while
+        the rest of the wallets are still being read.
+
+        Yields:
+            BalanceBatch: Balances of each wallet
+        """
         raise NotImplementedError
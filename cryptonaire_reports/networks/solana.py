@@ -1,70 +1,221 @@
-import requests
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Set, Tuple
 
 import structlog
 from cryptonaire_reports.networks.network import Network
+from cryptonaire_reports.networks.solana_rpc import SolanaRpcClient
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.config import get_config
+from cryptonaire_reports.utils.json_cache import JsonCache
+from cryptonaire_reports.utils.timings import timed
 from dexscreener import DexscreenerClient
 from dexscreener.models import TokenPair
 
 logger = structlog.get_logger()
 
-API_URL = "https://api.mainnet-beta.solana.com"
 PROGRAM_ID = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+# Maximum number of mints per Dex Screener call
+DEX_BATCH_SIZE = 30
+# Maximum number of Dex Screener calls running at the same time
+DEX_MAX_WORKERS = 4
 
 
 class Solana(Network):
 
     def __init__(self) -> None:
         super().__init__("SOLANA")
+        config = get_config().solana
+        self.rpc_client = SolanaRpcClient(
+            url=config.rpc_url, batch_size=config.rpc_batch_size
+        )
+        self.dex_client = DexscreenerClient()
+        # Symbol and decimals of every mint seen. They never change for a mint, so
+        # they never expire
+        self.mint_cache = JsonCache("solana_mints")
+        # Price and market cap of every mint seen. Expired entries are requested
+        # again, since the price is used as a backup price
+        self.market_cache = JsonCache(
+            "solana_mint_markets", ttl=config.mint_ttl_seconds
+        )
 
     @property
     def name(self) -> str:
         return "Solana"
 
-    def get_solana_balances(
-        self,
-    ) -> Tuple[
-        List[Tuple[str, str, float]], List[Tuple[str, str, float, float, float]]
-    ]:
+    @timed("sdk")
+    def _get_token_pairs(self, mints: List[str]) -> Dict[str, Dict]:
+        """Calls Dex Screener to get the symbol and market information of a batch of
+        mints.
+
+        Args:
+            mints (List[str]): Mints to look for. There's a limit of DEX_BATCH_SIZE
+                mints per call.
+
+        Returns:
+            Dict[str, Dict]: Dictionary where the keys are the mints and the values
+                contain the symbol, the price and the market cap of the token
+        """
+        concat_mints = ",".join(mints)
+        logger.debug(f"Call to DEX: {concat_mints}")
+        mint_info = {}
+        token_pair: TokenPair
+        for token_pair in self.dex_client.get_token_pairs(address=concat_mints):
+            mint = token_pair.base_token.address
+            # Tokens can have several pairs, keep the first one
+            if mint not in mints or mint in mint_info:
+                continue
+            mint_info[mint] = {
+                "symbol": token_pair.base_token.symbol,
+                "price_usd": token_pair.price_usd,
+                "market_cap": token_pair.fdv,
+            }
+        return mint_info
+
+    @timed("source")
+    def resolve_mints(
+        self, mint_decimals: Dict[str, int]
+    ) -> Tuple[Dict[str, Dict], Set[str]]:
+        """Gets the symbol and market information of the given mints. The symbol and
+        decimals of the known mints are taken from the local mint cache, and so is
+        their market information if it was requested within MINT_TTL_SECONDS. The rest
+        are requested to Dex Screener in concurrent batches of DEX_BATCH_SIZE mints.
+
+        Args:
+            mint_decimals (Dict[str, int]): Dictionary where the keys are the mints to
+                resolve and the values their decimals
+
+        Returns:
+            Tuple[Dict[str, Dict], Set[str]]: Dictionary where the keys are the mints
+                and the values contain the symbol, decimals, price and market cap of
+                the token, and the unknown mints that couldn't be resolved because
+                their Dex Screener call failed
+        """
+        mint_info = {}
+        failed_mints = set()
+        missing_mints = []
+        unknown_mints = 0
+        for mint in mint_decimals:
+            symbol_info = self.mint_cache.get(mint)
+            market_info = self.market_cache.get(mint)
+            if symbol_info and market_info:
+                mint_info[mint] = self._build_mint_info(symbol_info, market_info)
+            else:
+                missing_mints.append(mint)
+                unknown_mints += int(symbol_info is None)
+        logger.info(
+            f"[{self.name.upper()}] {len(mint_info)} mints found in cache, "
+            f"{len(missing_mints)} will be requested to Dex Screener "
+            f"({unknown_mints} of them unknown)"
+        )
+        if not missing_mints:
+            return mint_info, failed_mints
+
+        batches = [
+            missing_mints[i : i + DEX_BATCH_SIZE]
+            for i in range(0, len(missing_mints), DEX_BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(
+            max_workers=min(DEX_MAX_WORKERS, len(batches)),
+            thread_name_prefix="dexscreener",
+        ) as executor:
+            futures = [
+                executor.submit(self._get_token_pairs, batch) for batch in batches
+            ]
+            for batch, future in zip(batches, futures):
+                batch_failed = False
+                try:
+                    batch_info = future.result()
+                except Exception as e:
+                    logger.error(
+                        f"[{self.name.upper()}] Error while retrieving mint's symbols "
+                        f"from Dex Screener"
+                    )
+                    logger.debug(f"[{self.name.upper()}] Full exception: {e}")
+                    batch_info = {}
+                    batch_failed = True
+                for mint in batch:
+                    if mint in batch_info:
+                        symbol_info = {
+                            "symbol": batch_info[mint]["symbol"],
+                            "decimals": mint_decimals[mint],
+                        }
+                        market_info = {
+                            "price_usd": batch_info[mint]["price_usd"],
+                            "market_cap": batch_info[mint]["market_cap"],
+                        }
+                        self.mint_cache.set(mint, symbol_info)
+                        self.market_cache.set(mint, market_info)
+                    elif symbol_info := self.mint_cache.get(mint):
+                        # Better an outdated price than no price at all
+                        market_entry = self.market_cache.get_entry(mint)
+                        market_info = market_entry["value"] if market_entry else {}
+                    else:
+                        if batch_failed:
+                            failed_mints.add(mint)
+                        continue
+                    mint_info[mint] = self._build_mint_info(symbol_info, market_info)
+        self.mint_cache.save()
+        self.market_cache.save()
+        return mint_info, failed_mints
+
+    @staticmethod
+    def _build_mint_info(symbol_info: Dict, market_info: Dict) -> Dict:
+        return {
+            "symbol": symbol_info["symbol"],
+            "decimals": symbol_info["decimals"],
+            "price_usd": market_info.get("price_usd"),
+            "market_cap": market_info.get("market_cap"),
+        }
+
+    def iter_solana_balances(self) -> Iterator[BalanceBatch]:
         logger.info(f"[{self.name.upper()}] Extracting balances from Solana")
         balances_only = {}  # Map of mint: balances
-        mint_balances = []  # Actual balances for mints. Includes price and market cap
-        sol_balances = []
+        mint_decimals = {}  # Map of mint: decimals
+        mint_balances = BalanceBatch()  # Mint balances, with price and market cap
+        sol_balances = BalanceBatch()
         try:
             source_name = f"Solana"
+            # Two calls per address: SOL balance and token accounts
+            calls = []
             for address in self._addresses:
-                logger.info(f"[{self.name.upper()}] Extracting balances from {address}")
+                calls.append(("getBalance", [f"{address}", {"encoding": "jsonParsed"}]))
+                calls.append(
+                    (
+                        "getTokenAccountsByOwner",
+                        [
+                            f"{address}",
+                            {"programId": f"{PROGRAM_ID}"},
+                            {"encoding": "jsonParsed"},
+                        ],
+                    )
+                )
+            logger.info(
+                f"[{self.name.upper()}] Extracting balances from "
+                f"{len(self._addresses)} addresses"
+            )
+            results = self.rpc_client.call_batch(calls)
+
+            for idx, address in enumerate(self._addresses):
+                balance_result = results[2 * idx]
+                token_accounts_result = results[2 * idx + 1]
+                if balance_result is None or token_accounts_result is None:
+                    logger.error(
+                        f"[{self.name.upper()}] Unable to retrieve balances from "
+                        f"{address}, skipping it"
+                    )
+                    sol_balances.complete = False
+                    continue
                 # SOL Balance
-                payload = {
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "getBalance",
-                    "params": [
-                        f"{address}",
-                        {"encoding": "jsonParsed"},
-                    ],
-                }
-                response = requests.post(API_URL, json=payload).json()
                 # Value is in lamports, which is one billionth of a SOL
-                sol_balance = float(response["result"]["value"]) * 0.000000001
-                sol_balances.append((source_name, "SOL", sol_balance, 0, 0))
+                sol_balance = float(balance_result["value"]) * 0.000000001
+                sol_balances.append(source_name, "SOL", sol_balance)
 
                 # Tokens Balance
-                payload = {
-                    "jsonrpc": "2.0",
-                    "id": 1,
-                    "method": "getTokenAccountsByOwner",
-                    "params": [
-                        f"{address}",
-                        {"programId": f"{PROGRAM_ID}"},
-                        {"encoding": "jsonParsed"},
-                    ],
-                }
-
-                response = requests.post(API_URL, json=payload).json()
-                logger.debug(f"[{self.name.upper()}] Full response: {response}")
+                logger.debug(
+                    f"[{self.name.upper()}] Full response: {token_accounts_result}"
+                )
                 # Extract tokens balance
-                for token in response["result"]["value"]:
+                for token in token_accounts_result["value"]:
                     token_info = token["account"]["data"]["parsed"]["info"]
                     mint = token_info["mint"]
                     exploded_balance = int(token_info["tokenAmount"]["amount"])
@@ -72,69 +223,60 @@ class Solana(Network):
                     divider = float("1e+" + str(decimal_position))
                     balance = exploded_balance / divider
                     if balance > 0:
-                        balances_only[mint] = balance
+                        # The same mint can be held in several addresses
+                        balances_only[mint] = balances_only.get(mint, 0) + balance
+                        mint_decimals[mint] = decimal_position
                 logger.debug(f"[{self.name.upper()}] Balances found: {balances_only}")
 
-                # Use Dex Screener to extract symbol and market information
-                logger.info(
-                    f"[{self.name.upper()}] Extracting mint's symbols from {address}"
+            # The SOL balances are ready before the mints are resolved
+            logger.debug(
+                f"[{self.name.upper()}] Solana SOL balances: \n{str(sol_balances)}"
+            )
+            yield sol_balances
+
+            # Use Dex Screener to extract symbol and market information of all the
+            # mints at once, after all the addresses have been scanned
+            mint_info, failed_mints = self.resolve_mints(mint_decimals=mint_decimals)
+            if failed_mints:
+                # Incomplete, so the balances aren't cached without these mints
+                logger.error(
+                    f"[{self.name.upper()}] Unable to resolve {len(failed_mints)} "
+                    f"mints, their balances are left out of the report"
                 )
-                dex_client = DexscreenerClient()
-                # There's a limit of 30 addresses per call
-                curr_mint_list = []
-                dex_mint_lists = []
-                for mint in balances_only.keys():
-                    curr_mint_list.append(mint)
-                    if len(curr_mint_list) == 30:
-                        dex_mint_lists.append(curr_mint_list)
-                        curr_mint_list = []
-                if len(curr_mint_list) > 0:  # Append the last one if it's not empty
-                    dex_mint_lists.append(curr_mint_list)
-                dex_responses = []
-                for mint_list in dex_mint_lists:  # Operates in batches of 30
-                    concat_mints = ",".join(mint_list)
-                    logger.debug(f"Call to DEX: {concat_mints}")
-                    dex_response = dex_client.get_token_pairs(address=concat_mints)
-                    dex_responses.append(dex_response[0])
-
-                token_pair: TokenPair
-                for token_pair in dex_responses:
-                    symbol = token_pair.base_token.symbol
-
-                    if symbol in self.token_ignore_list:
-                        continue
+                mint_balances.complete = False
+            for mint, balance in balances_only.items():
+                if mint in failed_mints:
+                    continue
+                if mint not in mint_info:
+                    logger.warning(
+                        f"[{self.name.upper()}] Symbol not found for mint {mint}"
+                    )
+                    continue
+                symbol = mint_info[mint]["symbol"]
 
-                    balance = balances_only[token_pair.base_token.address]
-                    # We have access to market information in the same call
-                    price_usd = token_pair.price_usd
-                    market_cap = token_pair.fdv
+                if symbol in self.token_ignore_list:
+                    continue
 
-                    mint_balances.append(
-                        (source_name, symbol, balance, price_usd, market_cap)
-                    )
+                # We have access to market information in the same call. Dex Screener
+                # doesn't always know the market cap
+                price_usd = mint_info[mint]["price_usd"] or 0.0
+                market_cap = mint_info[mint]["market_cap"] or 0.0
+
+                mint_balances.append(
+                    source_name, symbol, balance, price_usd, market_cap
+                )
 
             logger.debug(
                 f"[{self.name.upper()}] Solana mint balances: \n{str(mint_balances)}"
             )
-            logger.debug(
-                f"[{self.name.upper()}] Solana SOL balances: \n{str(sol_balances)}"
-            )
-            return sol_balances, mint_balances
+            yield mint_balances
         except Exception as e:
             logger.error(
                 f"[{self.name.upper()}] Error while retrieving balances from {self.name}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return [], []
-
-    def get_balances(
-        self,
-    ) -> Tuple[
-        List[Tuple[str, str, float]], List[Tuple[str, str, float, float, float]]
-    ]:
-        balances = []
-        sol_balances, mint_balances = self.get_solana_balances()
-        balances.extend(sol_balances)
-        balances.extend(mint_balances)
+            yield BalanceBatch(complete=False)
+
+    def iter_balances(self) -> Iterator[BalanceBatch]:
+        yield from self.iter_solana_balances()
         logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-        return balances
@@ -0,0 +1,83 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import structlog
+from cryptonaire_reports.utils.http_client import HttpClient
+from cryptonaire_reports.utils.timings import count
+from cryptonaire_reports.utils.timings import timed
+
+logger = structlog.get_logger()
+
+API_URL = "https://api.mainnet-beta.solana.com"
+# Default maximum number of calls packed in a single HTTP request
+DEFAULT_BATCH_SIZE = 50
+
+
+class SolanaRpcError(Exception):
+    pass
+
+
+class SolanaRpcClient:
+
+    def __init__(
+        self, url: str = API_URL, batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> None:
+        """Minimal Solana JSON-RPC client that packs many calls into batched requests,
+        so scanning dozens of addresses only takes a few round trips.
+
+        Args:
+            url (str): URL of the JSON-RPC endpoint. Defaults to the mainnet-beta
+                public endpoint.
+            batch_size (int): Maximum number of calls per HTTP request. Defaults to
+                DEFAULT_BATCH_SIZE.
+        """
+        self.url = url
+        self.batch_size = max(1, batch_size)
+
+    def _post_batch(self, payload: List[Dict]) -> List[Dict]:
+        response = HttpClient().post(self.url, json=payload)
+        response.raise_for_status()
+        body = response.json()
+        if not isinstance(body, list):
+            # Errors affecting the whole batch (e.g. rate limits) come as one object
+            raise SolanaRpcError(f"Batch request failed: {body}")
+        return body
+
+    @timed("sdk")
+    def call_batch(self, calls: List[Tuple[str, List]]) -> List[Optional[Any]]:
+        """Sends all the calls to the JSON-RPC endpoint in batches of batch_size, and
+        maps every response back to its call by id.
+
+        Args:
+            calls (List[Tuple[str, List]]): List of (method, params) tuples
+
+        Raises:
+            SolanaRpcError: If a whole batch fails
+
+        Returns:
+            List[Optional[Any]]: Result of each call, in the same order as calls. The
+                result is None if that particular call failed.
+        """
+        results: List[Optional[Any]] = [None] * len(calls)
+        for start in range(0, len(calls), self.batch_size):
+            payload = [
+                {"jsonrpc": "2.0", "id": call_id, "method": method, "params": params}
+                for call_id, (method, params) in enumerate(
+                    calls[start : start + self.batch_size], start=start
+                )
+            ]
+            logger.debug(f"[SOLANA] Sending batch of {len(payload)} RPC calls")
+            for call_response in self._post_batch(payload):
+                call_id = call_response.get("id")
+                if not isinstance(call_id, int) or not 0 <= call_id < len(calls):
+                    logger.debug(f"[SOLANA] Unexpected RPC response: {call_response}")
+                    continue
+                if "error" in call_response:
+                    method, params = calls[call_id]
+                    logger.warning(
+                        f"[SOLANA] RPC call {method} failed with params {params}: "
+                        f"{call_response['error']}"
+                    )
+                    count("Solana RPC failed calls")
+                    continue
+                results[call_id] = call_response.get("result")
+        return results
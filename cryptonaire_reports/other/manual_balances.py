@@ -1,38 +1,58 @@
-from configparser import ConfigParser
-from typing import Tuple, List
+import os
+from typing import List, Optional, Tuple
 
 import structlog
-import pandas as pd
+from cryptonaire_reports.utils.balances import BALANCE_COLUMNS
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.balances import OPTIONAL_MANUAL_COLUMNS
+from cryptonaire_reports.utils.balances import REQUIRED_MANUAL_COLUMNS
+from cryptonaire_reports.utils.balances import parse_balance_row
+from cryptonaire_reports.utils.config import get_config
+from cryptonaire_reports.utils.json_cache import CACHE_DIR
+from cryptonaire_reports.utils.timings import timed
 
 logger = structlog.get_logger()
 
+# Schema of the manual balances file. Every column is read as text and validated
+# afterwards, and any other column is ignored
+MANUAL_COLUMN_DTYPES = {
+    column: str for column in REQUIRED_MANUAL_COLUMNS + OPTIONAL_MANUAL_COLUMNS
+}
+# Binary cache with the parsed balances of the manual file. It's reused while the
+# path, modification time and size of the file don't change
+MANUAL_CACHE_PATH = CACHE_DIR / "manual_balances.npz"
+# Version of the format of the cache. Increase it when the parsing rules change
+MANUAL_CACHE_VERSION = 1
+
 
 class ManualBalances:
 
     def __init__(self) -> None:
-        config = ConfigParser()
-        config.read("cryptonaire_reports.config")
-        if "Manual Balances" not in config:
+        manual_config = get_config().manual_balances
+        if manual_config is None:
             logger.warning(
                 f"Manual balance configuration not found. If you want to add manual "
                 f"balances, you need to add the following section to your config "
                 f"file: \n"
                 f"\t\t\t\t[Manual Balances]\n"
                 f"\t\t\t\tCSV_FILE= <local csv file path>\n"
-                f"Your CSV file should contain three columns: source, symbol, balance"
+                f"Your CSV file should contain three columns: source, symbol, balance. "
+                f"The columns price_backup and market_cap_backup are optional"
             )
             self.active = False
             return
 
-        if config.get("Manual Balances", "CSV_FILE"):
-            self.csv_file_path = config.get("Manual Balances", "CSV_FILE")
+        if manual_config.csv_file:
+            self.active = True
+            self.csv_file_path = manual_config.csv_file
         else:
             logger.warning(
                 f"CSV_FILE configuration not found. Make sure to add the CSV_FILE "
                 f"config to your Manual Balances section: \n"
                 f"\t\t\t\t[Manual Balances]\n"
                 f"\t\t\t\tCSV_FILE= <local csv file path>\n"
-                f"Your CSV file should contain three columns: source, symbol, balance"
+                f"Your CSV file should contain three columns: source, symbol, balance. "
+                f"The columns price_backup and market_cap_backup are optional"
             )
             self.active = False
 
@@ -40,15 +60,185 @@ class ManualBalances:
     def name(self) -> str:
         return "Manual"
 
-    def get_balances(self) -> List[Tuple[str, float]]:
+    def _cache_key(self) -> List[str]:
+        stat = os.stat(self.csv_file_path)
+        return [
+            str(MANUAL_CACHE_VERSION),
+            os.path.abspath(self.csv_file_path),
+            str(stat.st_mtime_ns),
+            str(stat.st_size),
+        ]
+
+    def _load_cache(self, key: List[str]) -> Optional[BalanceBatch]:
+        import numpy as np
+
+        try:
+            with np.load(MANUAL_CACHE_PATH, allow_pickle=False) as cache:
+                if cache["key"].tolist() != key:
+                    return None
+                balances = BalanceBatch.from_columns(
+                    *(cache[column].tolist() for column in BALANCE_COLUMNS)
+                )
+                skipped_lines = int(cache["skipped_lines"])
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(
+                f"[{self.name.upper()}] Unable to read {MANUAL_CACHE_PATH}. Reading "
+                f"{self.csv_file_path} again"
+            )
+            logger.debug(f"[{self.name.upper()}] Full exception: {e}")
+            return None
+        if skipped_lines:
+            logger.warning(
+                f"[{self.name.upper()}] Skipping {skipped_lines} invalid lines of "
+                f"{self.csv_file_path}. Their errors were logged when the file was "
+                f"last modified"
+            )
+        logger.debug(
+            f"[{self.name.upper()}] {len(balances)} balances loaded from "
+            f"{MANUAL_CACHE_PATH}"
+        )
+        return balances
+
+    def _save_cache(
+        self, key: List[str], balances: BalanceBatch, skipped_lines: int
+    ) -> None:
+        import numpy as np
+
+        columns = {
+            "source": np.array(balances.sources, dtype=str),
+            "symbol": np.array(balances.symbols, dtype=str),
+            "balance": np.frombuffer(balances.balances, dtype=np.float64),
+            "price_backup": np.frombuffer(balances.price_backups, dtype=np.float64),
+            "market_cap_backup": np.frombuffer(
+                balances.market_cap_backups, dtype=np.float64
+            ),
+        }
         try:
-            balances_pdf = pd.read_csv(self.csv_file_path)
-            balances = list(balances_pdf.itertuples(index=False, name=None))
-            logger.info(f"[{self.name.upper()}] All balances extracted successfully")
-            return balances
+            MANUAL_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            # Written to a temporary file first, so a crash never leaves a partial
+            # cache behind
+            tmp_path = MANUAL_CACHE_PATH.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_path,
+                key=np.array(key),
+                skipped_lines=np.array(skipped_lines),
+                **columns,
+            )
+            os.replace(tmp_path, MANUAL_CACHE_PATH)
+        except OSError as e:
+            logger.warning(f"[{self.name.upper()}] Unable to write {MANUAL_CACHE_PATH}")
+            logger.debug(f"[{self.name.upper()}] Full exception: {e}")
+
+    def _read_csv(self) -> Tuple[BalanceBatch, int]:
+        # pandas is only needed when manual balances are included
+        import numpy as np
+        import pandas as pd
+
+        try:
+            # Only the known columns are read, all of them as text, so the values are
+            # converted and validated by the same rules regardless of what pandas
+            # would infer for each column
+            balances_pdf = pd.read_csv(
+                self.csv_file_path,
+                usecols=lambda column: column in MANUAL_COLUMN_DTYPES,
+                dtype=MANUAL_COLUMN_DTYPES,
+                keep_default_na=False,
+            )
         except Exception as e:
             logger.error(
                 f"[{self.name.upper()}] Error while retrieving manual balances from {self.csv_file_path}"
             )
             logger.debug(f"[{self.name.upper()}] Full exception: {e}")
-            return []
+            return BalanceBatch(), 0
+
+        missing_columns = [
+            column
+            for column in REQUIRED_MANUAL_COLUMNS
+            if column not in balances_pdf.columns
+        ]
+        if missing_columns:
+            logger.error(
+                f"[{self.name.upper()}] Columns {', '.join(missing_columns)} not found "
+                f"in {self.csv_file_path}"
+            )
+            return BalanceBatch(), 0
+
+        # Validate all the rows at once. Only the rows that fail are parsed one by
+        # one, to log why they're invalid
+        text_pdf = balances_pdf.copy()
+        valid = pd.Series(True, index=balances_pdf.index)
+        for column in ["source", "symbol"]:
+            balances_pdf[column] = balances_pdf[column].str.strip()
+            valid &= balances_pdf[column] != ""
+        for column in REQUIRED_MANUAL_COLUMNS[2:] + OPTIONAL_MANUAL_COLUMNS:
+            if column not in balances_pdf.columns:
+                balances_pdf[column] = 0.0
+                continue
+            text = balances_pdf[column].str.strip()
+            numbers = pd.to_numeric(text, errors="coerce")
+            if column in OPTIONAL_MANUAL_COLUMNS:
+                # Empty backups default to 0
+                numbers = numbers.mask(text == "", 0.0)
+            valid &= np.isfinite(numbers) & (numbers >= 0)
+            balances_pdf[column] = numbers
+
+        valid_pdf = balances_pdf.loc[valid, BALANCE_COLUMNS]
+        skipped_lines = 0
+        if not valid.all():
+            records = []
+            # The first line of the file is the header
+            for line, row in zip(
+                balances_pdf.index[~valid] + 2, text_pdf[~valid].to_dict("records")
+            ):
+                try:
+                    # Values like 1_000 are valid numbers for Python but not for
+                    # pandas
+                    records.append(parse_balance_row(row))
+                except ValueError as e:
+                    skipped_lines += 1
+                    logger.error(
+                        f"[{self.name.upper()}] Skipping line {line} of "
+                        f"{self.csv_file_path}: {e}"
+                    )
+            valid_pdf = pd.concat(
+                [valid_pdf, pd.DataFrame(records, columns=BALANCE_COLUMNS)]
+            )
+
+        # The balances of the same symbol in the same source are added up here, so
+        # long ledgers with many historical lines reach the report as a few rows
+        aggregated_pdf = valid_pdf.groupby(
+            ["source", "symbol"], sort=False, as_index=False
+        ).agg(
+            balance=("balance", "sum"),
+            price_backup=("price_backup", "max"),
+            market_cap_backup=("market_cap_backup", "max"),
+        )
+        balances = BalanceBatch.from_columns(
+            *(aggregated_pdf[column].tolist() for column in BALANCE_COLUMNS)
+        )
+        return balances, skipped_lines
+
+    @timed("source")
+    def get_balances(self) -> BalanceBatch:
+        """Reads the manual balances from the CSV file. Every row is validated before
+        it's added, and malformed rows (e.g. a missing symbol or a balance that isn't a
+        number) are logged and skipped. The balances are added up by source and
+        symbol, and cached until the file changes.
+
+        Returns:
+            BalanceBatch: Valid balances of the CSV file
+        """
+        try:
+            key = self._cache_key()
+        except OSError:
+            key = None
+        balances = self._load_cache(key) if key else None
+        if balances is None:
+            balances, skipped_lines = self._read_csv()
+            # Empty results (e.g. the file is missing or unreadable) aren't cached
+            if key and balances:
+                self._save_cache(key, balances, skipped_lines)
+        logger.info(f"[{self.name.upper()}] All balances extracted successfully")
+        return balances
@@ -1,16 +1,75 @@
-from typing import List, Dict, Set, Tuple
+import importlib.util
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from typing import TYPE_CHECKING, Iterator, List, Dict, Optional, Set, Tuple, Union
 from datetime import datetime
 from pathlib import Path
 
 import structlog
+import numpy as np
 import pandas as pd
+import xlsxwriter
+from cryptonaire_reports.exchanges.exchange import Exchange
+from cryptonaire_reports.networks.network import Network
 from cryptonaire_reports.reports.report import Report
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.balances import IncrementalAggregator
 from cryptonaire_reports.utils.coin_market_cap import CoinMarketCap
+from cryptonaire_reports.utils.config import get_config
+from cryptonaire_reports.utils.http_client import HttpClient
+from cryptonaire_reports.utils.json_cache import JsonCache
+from cryptonaire_reports.utils.prefetcher import Prefetcher
+from cryptonaire_reports.utils.snapshot_store import SnapshotStore
+from cryptonaire_reports.utils.timings import span
+from cryptonaire_reports.utils.timings import timed
+
+if TYPE_CHECKING:
+    import pyarrow as pa
 
 pd.options.display.float_format = "{:.2f}".format
 
 logger = structlog.get_logger()
 
+# Columns returned by CoinMarketCap for each symbol
+COIN_INFO_COLUMNS = [
+    "id",
+    "name",
+    "rank",
+    "price_usd",
+    "max_supply",
+    "circulating_supply",
+    "total_supply",
+    "market_cap",
+    "price_fetched_at",
+]
+# Hidden sheet of the XLSX report with the slices of the pie chart
+CHART_DATA_SHEET = "Chart Data"
+# Maximum number of slices of the pie chart. The smallest symbols are added up in an
+# "Other" slice
+CHART_MAX_SLICES = 15
+# Python equivalent of the number formats of the XLSX report, used to size the columns
+XLSX_TEXT_FORMATS = {
+    "#,##0": "{:,.0f}",
+    "#,##0.00000000": "{:,.8f}",
+    "$#,##0": "${:,.0f}",
+    "$#,##0.00": "${:,.2f}",
+    "$#,##0.0000": "${:,.4f}",
+    "0.00%": "{:.2%}",
+}
+# Formats in which the report can be written. The typed columnar formats need the
+# optional pyarrow dependency
+OUTPUT_FORMATS = ["xlsx", "csv", "parquet", "arrow"]
+ARROW_FORMATS = ["parquet", "arrow"]
+# Compression of the parquet and arrow reports
+ARROW_COMPRESSION = "zstd"
+# Columns of the report with few distinct values, stored dictionary-encoded in the
+# parquet and arrow reports
+DICTIONARY_COLUMNS = ["Symbol", "Exchange(s) / Network(s)", "Full Name"]
+# Columns of the report written as nullable integers in the CSV, parquet and arrow
+# reports, instead of floats
+INTEGER_COLUMNS = ["id", "Coin Rank"]
+
 
 class Portfolio(Report):
 
@@ -19,68 +78,214 @@ class Portfolio(Report):
         exchanges: List[str] = ["all"],
         networks: List[str] = ["all"],
         include_manual: bool = False,
-        raw: bool = False
+        output_format: Optional[str] = "xlsx",
+        max_workers: Optional[int] = None,
+        refresh_map: bool = False,
+        record_history: bool = True,
+        refresh_sources: Optional[Set[str]] = None,
     ) -> None:
         super().__init__(exchanges, networks, include_manual)
         self.coin_market_cap = CoinMarketCap()
-        self.raw_format = raw
+        if output_format in ARROW_FORMATS and not importlib.util.find_spec("pyarrow"):
+            logger.error(
+                f"The {output_format} format needs pyarrow. Install it with: "
+                f"pip install cryptonaire-reports[arrow]"
+            )
+            exit(1)
+        self.output_format = output_format
+        self.max_workers = max_workers
+        self.refresh_map = refresh_map
+        self.record_history = record_history
+        # Class names of the sources whose cached balances must be ignored
+        self.refresh_sources = refresh_sources or set()
+        # Last balances read from each source. They're reused until the TTL of the
+        # source expires, so quick re-runs don't need to query the sources again
+        self.balances_cache = JsonCache("source_balances")
+
+    def _get_cached_balances(
+        self, source: Union[Exchange, Network]
+    ) -> Optional[BalanceBatch]:
+        """Returns the cached balances of a source, unless they're older than the TTL
+        of the source or the source has to be refreshed.
 
-    def get_balances_from_exchanges(self) -> List[Tuple[str, str, float, float, float]]:
-        """Gets the balances from all the configured exchanges.
-        If you've got one coin across different exchanges, there will be one row per
-        exchange. If you've got one coin across different wallets within an exchange
-        (for example, having SOL in Spot and Earn), they will be two separate rows.
+        Args:
+            source (Union[Exchange, Network]): Exchange or network to look for
 
         Returns:
-            pd.DataFrame: Pandas dataframe with the following columns:
-                exchange, symbol, balance
+            Optional[BalanceBatch]: Cached balances, or None if they must be read again
         """
-        balances = []
-        for exchange in self.exchanges:
-            exchange_balance = exchange.get_balances()
-            if not exchange_balance:
+        if type(source).__name__ in self.refresh_sources:
+            return None
+        entry = self.balances_cache.get_entry(source.cache_key)
+        if entry is None:
+            return None
+        ttl = get_config().balances_cache.get_ttl(source.name)
+        try:
+            if self.balances_cache.is_expired(entry, ttl):
+                return None
+            cached_balances = BalanceBatch(entry["value"])
+        except (KeyError, TypeError, ValueError) as e:
+            # E.g. an entry written by an older version. Read the source again
+            logger.warning(f"[{source.name.upper()}] Ignoring invalid cached balances")
+            logger.debug(f"[{source.name.upper()}] Full exception: {e}")
+            return None
+        logger.info(
+            f"[{source.name.upper()}] Using the balances read "
+            f"{time.time() - entry['fetched_at']:.0f}s ago. Use --refresh "
+            f"{source.name.lower()} to read them again"
+        )
+        return cached_balances
+
+    def _stream_source(
+        self, source: Union[Exchange, Network], balances_queue: Queue
+    ) -> None:
+        """Reads the balances of a single exchange or network and puts them in the
+        queue as soon as each account or wallet is read, followed by None once the
+        source is done, even if it fails. Errors are logged, so one failing source
+        doesn't stop the rest of the collection.
+
+        Args:
+            source (Union[Exchange, Network]): Exchange or network to extract from.
+            balances_queue (Queue): Queue where the balances are put
+        """
+        try:
+            self._read_source(source, balances_queue)
+        finally:
+            # stream_balances waits for the None of every source
+            balances_queue.put(None)
+
+    def _read_source(
+        self, source: Union[Exchange, Network], balances_queue: Queue
+    ) -> None:
+        cached_balances = self._get_cached_balances(source)
+        if cached_balances is not None:
+            balances_queue.put(cached_balances)
+            return
+
+        start = time.perf_counter()
+        # The rows are kept to update the cache once the source is done
+        fetched_balances = BalanceBatch()
+        try:
+            with span(source.name, "source") as source_span:
+                for source_balances in source.iter_balances():
+                    fetched_balances.extend(source_balances)
+                    balances_queue.put(source_balances)
+                source_span.failed = not fetched_balances.complete
+        except Exception as e:
+            logger.error(
+                f"[{source.name.upper()}] Unexpected error while collecting balances"
+            )
+            logger.debug(f"[{source.name.upper()}] Full exception: {e}")
+        else:
+            # Balances with errors would hide the missing accounts until they expire
+            if fetched_balances.complete:
+                self.balances_cache.set(
+                    source.cache_key, [list(record) for record in fetched_balances]
+                )
+            elapsed = time.perf_counter() - start
+            if not fetched_balances:
                 logger.debug(
-                    f"[{exchange.name.upper()}] Balance data not found. Skipping."
+                    f"[{source.name.upper()}] Balance data not found after "
+                    f"{elapsed:.2f}s. Skipping."
+                )
+            else:
+                logger.info(
+                    f"[{source.name.upper()}] Data collection completed successfully "
+                    f"in {elapsed:.2f}s"
                 )
-                continue
-            logger.info(
-                f"[{exchange.name.upper()}] Data collection completed successfully"
-            )
-            balances.extend(exchange_balance)
-        return balances
-
-    def get_balances_from_networks(self) -> List[Tuple[str, str, float, float, float]]:
-        """Gets the balances from all the configured networks.
-        If you've got one coin across different networks, there will be one row per
-        network.
 
-        Returns:
-            pd.DataFrame: Pandas dataframe with the following columns:
-                network, symbol, balance
+    def stream_balances(self) -> Iterator[BalanceBatch]:
+        """Yields the balances of the manual file and of all the configured exchanges
+        and networks as soon as they're read. The sources are queried concurrently, so
+        the balances of the fast sources are available while the slow ones are still
+        responding, and the total collection time is roughly the one of the slowest
+        source instead of the sum of all of them.
+        If you've got one coin across different exchanges or networks, there will be
+        one row per source. If you've got one coin across different wallets within an
+        exchange (for example, having SOL in Spot and Earn), they will be two separate
+        rows.
+
+        Yields:
+            BalanceBatch: Balances of one account, wallet or file
         """
-        balances = []
-        for network in self.networks:
-            network_balance = network.get_balances()
-            if not network_balance:
+        # The manual balances are local, so they're the first ones available
+        manual_balances = self.get_balances_from_manual_file()
+        if manual_balances:
+            yield manual_balances
+
+        sources = self.exchanges + self.networks
+        if not sources:
+            return
+        max_workers = self.max_workers or len(sources)
+        logger.info(
+            f"Collecting balances from {len(sources)} sources using {max_workers} "
+            f"workers..."
+        )
+        start = time.perf_counter()
+        balances_queue = Queue()
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="collector"
+        ) as executor:
+            futures = [
+                executor.submit(self._stream_source, source, balances_queue)
+                for source in sources
+            ]
+            running_sources = len(sources)
+            while running_sources:
+                source_balances = balances_queue.get()
+                if source_balances is None:
+                    running_sources -= 1
+                elif source_balances:
+                    yield source_balances
+        for source, future in zip(sources, futures):
+            if future.exception():
+                logger.error(
+                    f"[{source.name.upper()}] Unexpected error while collecting "
+                    f"balances"
+                )
                 logger.debug(
-                    f"[{network.name.upper()}] Balance data not found. Skipping."
+                    f"[{source.name.upper()}] Full exception: {future.exception()}"
                 )
-                continue
-            logger.info(
-                f"[{network.name.upper()}] Data collection completed successfully"
-            )
-            balances.extend(network_balance)
-        return balances
+        self.balances_cache.save()
+        logger.info(
+            f"Balances collected from all sources in {time.perf_counter() - start:.2f}s"
+        )
+        HttpClient().log_stats()
 
-    def get_balances_from_manual_file(
-        self,
-    ) -> List[Tuple[str, str, float, float, float]]:
+    @timed("stage")
+    def collect_balances(self) -> Tuple[IncrementalAggregator, Dict[str, Dict]]:
+        """Aggregates the balances by symbol while they're streamed from the sources,
+        so only one row per symbol is kept in memory. The additional info of every
+        new symbol is requested in the background as soon as the symbol is found,
+        instead of waiting for the slowest source.
+
+        Returns:
+            Tuple[IncrementalAggregator, Dict[str, Dict]]: Aggregated balances and
+                additional info of the symbols (see extract_additional_coin_info)
+        """
+        aggregator = IncrementalAggregator()
+        prefetcher = Prefetcher(
+            fetch=self.extract_additional_coin_info, name="CoinMarketCap"
+        )
+        for balances in self.stream_balances():
+            new_symbols = aggregator.add(balances)
+            if new_symbols:
+                prefetcher.add(new_symbols)
+        logger.info(
+            f"{aggregator.rows} balances aggregated into {len(aggregator)} symbols"
+        )
+        with span("Portfolio.wait_for_coin_info", "stage"):
+            coin_info = prefetcher.result()
+        return aggregator, coin_info
+
+    def get_balances_from_manual_file(self) -> BalanceBatch:
         if not self.manual:
-            return []
+            return BalanceBatch()
         balances = self.manual.get_balances()
         f"[{self.manual.name.upper()}] Data collection completed successfully"
         return balances
 
+    @timed("coinmarketcap")
     def extract_additional_coin_info(self, symbols: Set[str]) -> Dict[str, Dict]:
         """Given a list of symbols, uses the CoinMarketCap API to extract additional
         information from the token. For each token, these columns are added:
@@ -91,6 +296,7 @@ class Portfolio(Report):
         - max_supply
         - total_supply
         - circulating_supply
+        - price_fetched_at
 
         Args:
             symbols (Set[str]): Set of all the tokens that we want to enrich.
@@ -101,19 +307,50 @@ class Portfolio(Report):
             Dict[str, Dict]: Dictionary where the keys are the symbols and the values
                 are dictionaries with all the columns mentioned before.
         """
-        return self.coin_market_cap.get_coin_info(coin_list=symbols)
+        return self.coin_market_cap.get_coin_info(
+            coin_list=symbols, refresh_map=self.refresh_map
+        )
 
     @staticmethod
-    def combine_balances(row: pd.DataFrame) -> pd.Series:
-        result = {}
-        result["source"] = "|".join(set(row["source"]))
-        result["balance"] = row["balance"].sum()
-        result["price_backup"] = row["price_backup"].max()
-        result["market_cap_backup"] = row["market_cap_backup"].max()
-        return pd.Series(
-            result,
-            index=["source", "balance", "price_backup", "market_cap_backup"],
+    def enrich_balances(
+        aggregated_pdf: pd.DataFrame, coin_info_pdf: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Joins the aggregated balances with the CoinMarketCap info, and calculates
+        the total value and portfolio percentage of each symbol.
+
+        Args:
+            aggregated_pdf (pd.DataFrame): Balances returned by
+                IncrementalAggregator.to_dataframe
+            coin_info_pdf (pd.DataFrame): Pandas dataframe indexed by symbol with the
+                info returned by extract_additional_coin_info
+
+        Returns:
+            pd.DataFrame: Pandas dataframe indexed by symbol with all the report
+                columns
+        """
+        # Missing columns (e.g. no prices found at all) are added as empty columns,
+        # which also keeps the column order of the report stable
+        report_pdf = aggregated_pdf.join(
+            coin_info_pdf.reindex(columns=COIN_INFO_COLUMNS)
+        )
+        # Some balances have price and market cap info
+        report_pdf["price_usd"] = report_pdf["price_usd"].fillna(
+            report_pdf.pop("price_backup")
+        )
+        report_pdf["market_cap"] = report_pdf["market_cap"].fillna(
+            report_pdf.pop("market_cap_backup")
+        )
+        # Calculate total value and percentage
+        report_pdf["total_value_usd"] = report_pdf["balance"] * report_pdf["price_usd"]
+        report_pdf["portfolio_percentage"] = (
+            report_pdf["total_value_usd"] / report_pdf["total_value_usd"].sum()
         )
+        # Time when each price was requested to CoinMarketCap. Prices served from the
+        # quote cache can be a few minutes old
+        report_pdf["price_updated"] = pd.to_datetime(
+            report_pdf.pop("price_fetched_at"), unit="s"
+        ).dt.strftime("%Y-%m-%d %H:%M:%S")
+        return report_pdf
 
     @staticmethod
     def get_rename_map() -> Dict[str, str]:
@@ -130,50 +367,110 @@ class Portfolio(Report):
             "price_usd": "Price (USD)",
             "total_value_usd": "Total Value (USD)",
             "portfolio_percentage": "Portfolio Percentage",
+            "price_updated": "Price Updated (UTC)",
         }
 
+    @timed("stage")
     def write_csv_report(self, report_pdf: pd.DataFrame, path: Path) -> None:
         curr_date = datetime.now().strftime("%Y%m%d_%H%M%S")
 
         output_file_name = f"crypto_portfolio_report_{curr_date}.csv"
 
         logger.info(f"Writing report to {path / output_file_name}...")
-        report_pdf.to_csv(
+        # Floats are written with their shortest exact representation, so reading the
+        # report back gives the same numbers. Always written by pandas, so the file
+        # doesn't depend on whether pyarrow is installed
+        report_pdf = report_pdf.astype({column: "Int64" for column in INTEGER_COLUMNS})
+        report_pdf.to_csv(path / output_file_name, index=False, encoding="utf-8")
+        logger.info(f"Report generated successfully: {path / output_file_name}")
+
+    @staticmethod
+    def to_arrow_table(report_pdf: pd.DataFrame) -> "pa.Table":
+        """Converts the report into a typed arrow table. The columns with few
+        distinct values are dictionary-encoded, the ids and ranks are integers and the
+        time of the prices is a timestamp.
+
+        Args:
+            report_pdf (pd.DataFrame): Report with the readable column names
+
+        Returns:
+            pa.Table: Arrow table with the same columns as the report
+        """
+        import pyarrow as pa
+
+        report_pdf = report_pdf.astype({column: "Int64" for column in INTEGER_COLUMNS})
+        report_pdf["Price Updated (UTC)"] = pd.to_datetime(
+            report_pdf["Price Updated (UTC)"], format="%Y-%m-%d %H:%M:%S"
+        )
+        table = pa.Table.from_pandas(report_pdf, preserve_index=False)
+        for column in DICTIONARY_COLUMNS:
+            idx = table.schema.get_field_index(column)
+            table = table.set_column(
+                idx, column, table.column(idx).dictionary_encode()
+            )
+        return table
+
+    @timed("stage")
+    def write_parquet_report(self, report_pdf: pd.DataFrame, path: Path) -> None:
+        import pyarrow.parquet as pq
+
+        curr_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        output_file_name = f"crypto_portfolio_report_{curr_date}.parquet"
+
+        logger.info(f"Writing report to {path / output_file_name}...")
+        pq.write_table(
+            self.to_arrow_table(report_pdf),
             path / output_file_name,
-            index=False,
-            float_format="{:f}".format,
-            encoding="utf-8",
+            compression=ARROW_COMPRESSION,
         )
         logger.info(f"Report generated successfully: {path / output_file_name}")
 
+    @timed("stage")
+    def write_arrow_report(self, report_pdf: pd.DataFrame, path: Path) -> None:
+        import pyarrow as pa
+
+        curr_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+
+        output_file_name = f"crypto_portfolio_report_{curr_date}.arrow"
+
+        logger.info(f"Writing report to {path / output_file_name}...")
+        table = self.to_arrow_table(report_pdf)
+        options = pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION)
+        with pa.ipc.new_file(
+            path / output_file_name, table.schema, options=options
+        ) as writer:
+            writer.write_table(table)
+        logger.info(f"Report generated successfully: {path / output_file_name}")
+
+    @timed("stage")
     def write_excel_report(self, report_pdf: pd.DataFrame, path: Path) -> None:
         logger.info(f"Generating XLSX report")
         curr_date = datetime.now().strftime("%Y%m%d_%H%M%S")
         output_file_name = f"crypto_portfolio_report_{curr_date}.xlsx"
 
-        # Remove all the tokens that have less than $1
-        report_pdf = report_pdf[report_pdf["Total Value (USD)"] >= 1.00]
-        excluded_tokens = report_pdf[report_pdf["Total Value (USD)"] < 1.00]["Symbol"].unique()
-        logger.info(
-            f"Excluding tokens {','.join(excluded_tokens)} from report since their "
-            f"balance is less than $1.00"
-        )
+        # Remove all the tokens that have less than $1. The rows are written by
+        # position, sorted by total value, instead of building a filtered and a sorted
+        # copy of the report
+        total_values = report_pdf["Total Value (USD)"].to_numpy()
+        included = total_values >= 1.00
+        excluded_tokens = report_pdf["Symbol"].to_numpy()[~included]
+        if len(excluded_tokens):
+            logger.info(
+                f"Excluding tokens {','.join(excluded_tokens)} from report since their "
+                f"balance is less than $1.00"
+            )
+        positions = np.flatnonzero(included)
+        positions = positions[np.argsort(total_values[positions], kind="stable")]
+        total_rows = len(positions)
 
         ##### GENERATE XLSX FILE WITH XLSXWRITER #####
-        # Skip the header to be able to create a custom header format instead of using
-        # the pandas default one
-        writer = pd.ExcelWriter(path=path / output_file_name, engine='xlsxwriter')
-        report_pdf.sort_values(by=["Total Value (USD)"]).to_excel(
-            writer, 
-            sheet_name='Portfolio', 
-            startrow=1, 
-            index=False, 
-            header=False
+        # Rows are flushed to disk as soon as they're written, so the memory used
+        # doesn't grow with the size of the report. They must be written in order
+        workbook = xlsxwriter.Workbook(
+            path / output_file_name, {"constant_memory": True}
         )
-        workbook  = writer.book
-        worksheet = writer.sheets['Portfolio']
-        total_rows = report_pdf.shape[0]
-        total_cols = report_pdf.shape[1]
+        worksheet = workbook.add_worksheet("Portfolio")
 
         # Format the data
         columns_format = {
@@ -190,6 +487,7 @@ class Portfolio(Report):
             "Market Cap": {"num_format": "$#,##0"},
             "Total Value (USD)": {"num_format": "$#,##0.00"},
             "Portfolio Percentage": {"num_format": "0.00%", "align": "center"},
+            "Price Updated (UTC)": {"align": "center"},
         }
         global_format = {"font_name": "Avenir Next LT Pro"}
         header_format = workbook.add_format(
@@ -203,34 +501,55 @@ class Portfolio(Report):
             }
         )
 
-        column_lengths = []
+        columns = []
         for idx, column in enumerate(columns_format):
-            series = report_pdf[column]
+            values = report_pdf[column].to_numpy()
+            # Python objects are much faster to write than numpy scalars, and the type
+            # of every column is known, so the generic write() isn't needed to guess it
+            write = (
+                worksheet.write_number
+                if values.dtype.kind in "fiu"
+                else worksheet.write_string
+            )
+            columns.append((values.tolist(), write))
             format = workbook.add_format({**columns_format[column], **global_format})
             max_len = (
                 max(
                     (
-                        series.astype(str).map(len).max(),  # len of largest item
-                        len(str(series.name)),  # len of column name/header
+                        self.get_max_text_length(
+                            values[positions], columns_format[column]
+                        ),  # len of largest item
+                        len(column),  # len of column name/header
                     )
                 )
                 + 7  # adding a little extra space
             )
-            column_lengths.append(max_len)
             worksheet.set_column(idx, idx, max_len, format)
 
             # Write the header
             worksheet.write(0, idx, column, header_format)
 
+        # Write the data. Empty values (NaN) are left blank, like pandas does
+        for row, position in enumerate(positions, start=1):
+            for idx, (values, write) in enumerate(columns):
+                value = values[position]
+                if value == value:
+                    write(row, idx, value)
+
         # Generate the pie chart
         chart = workbook.add_chart({"type": "pie"})
 
         # Configure the series
+        chart_rows = self.write_chart_data(
+            workbook,
+            symbols=report_pdf["Symbol"].to_numpy()[positions],
+            percentages=report_pdf["Portfolio Percentage"].to_numpy()[positions],
+        )
         chart.add_series(
             {
                 "name": "Cryptocurrency Percentage",
-                "categories": f"=Portfolio!$A$2:$A${total_rows + 1}",
-                "values": f"=Portfolio!$L$2:$L${total_rows + 1}",
+                "categories": f"='{CHART_DATA_SHEET}'!$A$2:$A${chart_rows + 1}",
+                "values": f"='{CHART_DATA_SHEET}'!$B$2:$B${chart_rows + 1}",
                 "data_labels": {
                     "value": True,
                     "category": True,
@@ -246,7 +565,7 @@ class Portfolio(Report):
         chart.set_size({'width': 1080, 'height': 1080})
 
         # Add a title.
-        total_usd = '${:0,.2f}'.format(report_pdf["Total Value (USD)"].sum())
+        total_usd = '${:0,.2f}'.format(total_values[positions].sum())
         chart.set_title(
             {
                 "name": f"Crypto Portfolio - {datetime.now().strftime("%Y/%m/%d")}\nTotal value: {total_usd}",
@@ -269,67 +588,122 @@ class Portfolio(Report):
             {"x_offset": 0, "y_offset": 0}
         )
 
-        # Close the Pandas Excel writer and output the Excel file.
-        writer.close()
-        writer.handles = None
+        # Output the Excel file.
+        workbook.close()
 
         logger.info(f"Report generated successfully: {path / output_file_name}")
 
-    def report(self):
-        # Extract all the balances from the exchanges and networks
-        exchange_balances = self.get_balances_from_exchanges()
-        network_balances = self.get_balances_from_networks()
-        manual_balances = self.get_balances_from_manual_file()
-        balances = exchange_balances + network_balances + manual_balances
-        balances_pdf = pd.DataFrame(
-            balances,
-            columns=[
-                "source",
-                "symbol",
-                "balance",
-                "price_backup",
-                "market_cap_backup",
-            ],
-        )
-        # Group by ticker symbol and sum the balances
-        groupped_balances_pdf = balances_pdf.groupby(by=["symbol"]).apply(
-            self.combine_balances
-        )
+    @staticmethod
+    def get_max_text_length(values: np.ndarray, column_format: Dict) -> int:
+        """Calculates the length of the longest value of a column once written in the
+        XLSX report. Numbers are as long as their largest absolute value formatted
+        like the cell, so only one pass over the column is needed.
 
-        # Extract additional information, including latest price, from each coin
-        symbols = set(groupped_balances_pdf.index.tolist())
-        coin_info_dict = self.extract_additional_coin_info(symbols=symbols)
-        coin_info_pdf = pd.DataFrame.from_dict(coin_info_dict, orient="index")
-        coin_info_pdf.index.name = "symbol"
+        Args:
+            values (np.ndarray): Values of the column
+            column_format (Dict): XLSX format of the column
 
-        # Join the balances with the additional info and calculate total value and percentage
-        report_pdf = groupped_balances_pdf.join(coin_info_pdf)
-        # Some balances have price and market cap info
-        report_pdf["price_usd"] = (
-            report_pdf[["price_usd", "price_backup"]]
-            .bfill(
-                axis=1,
+        Returns:
+            int: Length of the longest value, or 0 if the column is empty
+        """
+        if values.dtype.kind in "fiu":
+            # NaN when the column is empty or has no values
+            largest = pd.Series(values).abs().max()
+            if largest != largest:
+                return 0
+            text_format = XLSX_TEXT_FORMATS.get(column_format.get("num_format"), "{}")
+            return len(text_format.format(largest))
+        lengths = pd.Series(values, dtype="string").str.len()
+        return int(lengths.max()) if lengths.notna().any() else 0
+
+    @staticmethod
+    def write_chart_data(
+        workbook: "xlsxwriter.Workbook", symbols: np.ndarray, percentages: np.ndarray
+    ) -> int:
+        """Writes the slices of the pie chart to a hidden sheet. Only the
+        CHART_MAX_SLICES - 1 largest symbols get their own slice, and the rest are
+        added up in an "Other" slice, so the chart stays readable in large portfolios.
+
+        Args:
+            workbook (xlsxwriter.Workbook): Workbook of the report
+            symbols (np.ndarray): Symbols, sorted by ascending value
+            percentages (np.ndarray): Portfolio percentage of each symbol
+
+        Returns:
+            int: Number of slices written
+        """
+        worksheet = workbook.add_worksheet(CHART_DATA_SHEET)
+        worksheet.hide()
+        worksheet.write_row(0, 0, ["Symbol", "Portfolio Percentage"])
+
+        row = 1
+        if len(symbols) > CHART_MAX_SLICES:
+            tail = len(symbols) - CHART_MAX_SLICES + 1
+            worksheet.write_row(row, 0, ["Other", float(np.nansum(percentages[:tail]))])
+            symbols, percentages = symbols[tail:], percentages[tail:]
+            row += 1
+        for symbol, percentage in zip(symbols, percentages):
+            worksheet.write_row(row, 0, [symbol, percentage])
+            row += 1
+        return row - 1
+
+    def build_report(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Collects the balances of all the sources and enriches them with the
+        CoinMarketCap info.
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: Report indexed by symbol (see
+                enrich_balances), and the balance and value of every symbol in every
+                source, with the following columns: source, symbol, balance,
+                total_value_usd
+        """
+        # Aggregate the balances by symbol while they're collected, and meanwhile
+        # extract additional information, including latest price, from each coin
+        aggregator, coin_info_dict = self.collect_balances()
+        with span("Portfolio.aggregate", "stage"):
+            coin_info_pdf = pd.DataFrame.from_dict(coin_info_dict, orient="index")
+            coin_info_pdf.index.name = "symbol"
+
+            # Join the balances with the additional info and calculate total value
+            # and percentage
+            report_pdf = self.enrich_balances(aggregator.to_dataframe(), coin_info_pdf)
+
+            source_balances_pdf = aggregator.to_source_dataframe()
+            prices = source_balances_pdf["symbol"].map(report_pdf["price_usd"])
+            source_balances_pdf["total_value_usd"] = (
+                source_balances_pdf["balance"] * prices
             )
-            .iloc[:, 0]
-        )
-        report_pdf["market_cap"] = (
-            report_pdf[["market_cap", "market_cap_backup"]].bfill(axis=1).iloc[:, 0]
-        )
-        report_pdf.drop(["price_backup", "market_cap_backup"], axis=1, inplace=True)
-        # Calculate total value and percentage
-        report_pdf["total_value_usd"] = report_pdf["balance"] * report_pdf["price_usd"]
-        report_pdf["portfolio_percentage"] = report_pdf[["total_value_usd"]].apply(
-            lambda x: x / x.sum()
-        )
+        return report_pdf, source_balances_pdf
+
+    def snapshot(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """Builds the report and appends it to the history, unless it's disabled.
+
+        Returns:
+            Tuple[pd.DataFrame, pd.DataFrame]: Same as build_report
+        """
+        report_pdf, source_balances_pdf = self.build_report()
+        if self.record_history:
+            SnapshotStore().append(report_pdf, source_balances_pdf)
+        return report_pdf, source_balances_pdf
+
+    @timed("stage")
+    def report(self):
+        report_pdf, _ = self.snapshot()
+        # Only the snapshot is needed, e.g. when the report is generated on a schedule
+        if self.output_format is None:
+            return
 
         # Rename columns to a more readable format
         report_pdf.reset_index(inplace=True)
         report_pdf = report_pdf.rename(columns=self.get_rename_map())
 
-        # Write out Excel file (formatted) or CSV file (raw)
+        # Write out Excel file (formatted), CSV file (raw) or parquet/arrow file (typed)
         output_dir = Path("reports/portfolio")
         output_dir.mkdir(parents=True, exist_ok=True)
-        if self.raw_format:
-            self.write_csv_report(report_pdf=report_pdf, path=output_dir)
-        else:
-            self.write_excel_report(report_pdf=report_pdf, path=output_dir)
+        writers = {
+            "xlsx": self.write_excel_report,
+            "csv": self.write_csv_report,
+            "parquet": self.write_parquet_report,
+            "arrow": self.write_arrow_report,
+        }
+        writers[self.output_format](report_pdf=report_pdf, path=output_dir)
@@ -0,0 +1,161 @@
+import json
+import signal
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+from urllib.parse import unquote, urlsplit
+
+import structlog
+from cryptonaire_reports.reports.portfolio import Portfolio
+from cryptonaire_reports.utils.result_cache import SingleFlightCache
+
+logger = structlog.get_logger()
+
+# Digits of the floats in the responses. The pandas default (10) would round prices
+# of small tokens
+JSON_DOUBLE_PRECISION = 15
+
+
+class PortfolioServer:
+
+    def __init__(self, portfolio: Portfolio, ttl: float, host: str, port: int) -> None:
+        """Local HTTP service that returns the portfolio report as JSON. The report is
+        kept in memory for ttl seconds, and concurrent requests that find it expired
+        wait for a single collection instead of starting one each.
+
+        Endpoints:
+            GET /portfolio: Every symbol of the report, sorted by total value
+            GET /portfolio/{symbol}: One symbol of the report
+            GET /sources: Value held in every exchange, network and manual source
+
+        Args:
+            portfolio (Portfolio): Portfolio used to collect the report
+            ttl (float): Seconds a collected report is served before collecting a
+                new one
+            host (str): Interface the server listens on
+            port (int): Port the server listens on
+        """
+        self.portfolio = portfolio
+        self.host = host
+        self.port = port
+        self.cache = SingleFlightCache(self.collect, ttl=ttl, name="SERVER")
+
+    def collect(self) -> Dict:
+        """Collects the report and prepares the content of every endpoint.
+
+        Raises:
+            RuntimeError: If the collection was aborted
+
+        Returns:
+            Dict: Dictionary with the report by symbol (portfolio), the rows of every
+                symbol (symbols), the value by source (sources) and the collection time
+                (generated_at)
+        """
+        try:
+            report_pdf, source_balances_pdf = self.portfolio.snapshot()
+        except SystemExit:
+            # Fatal errors of a collection (e.g. CoinMarketCap rate limits) exit the
+            # process, which must not bring down the server
+            raise RuntimeError("The collection of the portfolio was aborted")
+
+        report_pdf = report_pdf.sort_values("total_value_usd", ascending=False)
+        portfolio = json.loads(
+            report_pdf.reset_index().to_json(
+                orient="records", double_precision=JSON_DOUBLE_PRECISION
+            )
+        )
+        sources_pdf = (
+            source_balances_pdf.groupby("source", as_index=False)
+            .agg(total_value_usd=("total_value_usd", "sum"), symbols=("symbol", "size"))
+            .sort_values("total_value_usd", ascending=False)
+        )
+        sources = json.loads(
+            sources_pdf.to_json(
+                orient="records", double_precision=JSON_DOUBLE_PRECISION
+            )
+        )
+        return {
+            "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "total_value_usd": float(report_pdf["total_value_usd"].sum()),
+            "portfolio": portfolio,
+            "symbols": {row["symbol"]: row for row in portfolio},
+            "sources": sources,
+        }
+
+    def handle(self, path: str) -> Tuple[HTTPStatus, Dict]:
+        """Answers a GET request.
+
+        Args:
+            path (str): Path of the request, e.g. /portfolio/BTC
+
+        Returns:
+            Tuple[HTTPStatus, Dict]: Status and body of the response
+        """
+        parts = [unquote(part) for part in urlsplit(path).path.split("/") if part]
+        if not parts or parts[0] not in ("portfolio", "sources") or len(parts) > 2:
+            return HTTPStatus.NOT_FOUND, {
+                "error": "Use /portfolio, /portfolio/{symbol} or /sources"
+            }
+        if parts[0] == "sources" and len(parts) > 1:
+            return HTTPStatus.NOT_FOUND, {"error": "Use /sources"}
+
+        try:
+            report, _ = self.cache.get()
+        except Exception as e:
+            logger.error(f"[SERVER] Unable to collect the portfolio: {e}")
+            return HTTPStatus.SERVICE_UNAVAILABLE, {
+                "error": "Unable to collect the portfolio. Check the server logs"
+            }
+
+        metadata = {
+            "generated_at": report["generated_at"],
+            "total_value_usd": report["total_value_usd"],
+        }
+        if parts[0] == "sources":
+            return HTTPStatus.OK, {**metadata, "sources": report["sources"]}
+        if len(parts) == 1:
+            return HTTPStatus.OK, {**metadata, "portfolio": report["portfolio"]}
+        # Symbols are case insensitive, unless two symbols only differ in case
+        symbol = report["symbols"].get(parts[1]) or report["symbols"].get(
+            parts[1].upper()
+        )
+        if symbol is None:
+            return HTTPStatus.NOT_FOUND, {
+                "error": f"Symbol {parts[1]} not found in the portfolio"
+            }
+        return HTTPStatus.OK, {"generated_at": report["generated_at"], **symbol}
+
+    def serve_forever(self) -> None:
+        """Serves requests until the process receives SIGTERM or SIGINT."""
+        server = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                status, body = server.handle(self.path)
+                content = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(f"[SERVER] {self.address_string()} {format % args}")
+
+        def stop(signum: int, frame) -> None:
+            raise KeyboardInterrupt
+
+        httpd = ThreadingHTTPServer((self.host, self.port), RequestHandler)
+        # Requests still being answered don't keep the process alive on shutdown
+        httpd.daemon_threads = True
+        previous_handler = signal.signal(signal.SIGTERM, stop)
+        logger.info(f"[SERVER] Listening on http://{self.host}:{self.port}")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            logger.info(f"[SERVER] Shutting down")
+        finally:
+            httpd.server_close()
+            signal.signal(signal.SIGTERM, previous_handler)
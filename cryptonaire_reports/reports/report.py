@@ -5,8 +5,8 @@ import structlog
 from cryptonaire_reports.other.manual_balances import ManualBalances
 from cryptonaire_reports.exchanges.exchange import Exchange
 from cryptonaire_reports.networks.network import Network
-from cryptonaire_reports.utils.mappings import EXCHANGE_MAP
-from cryptonaire_reports.utils.mappings import NETWORKS_MAP
+from cryptonaire_reports.utils.mappings import EXCHANGE_REGISTRY
+from cryptonaire_reports.utils.mappings import NETWORK_REGISTRY
 
 
 logger = structlog.get_logger()
@@ -35,27 +35,30 @@ class Report:
             f"Looking for API keys of the following exchanges: {','.join(exchanges)}"
         )
         if "all" in exchanges:
-            for exchange_class in EXCHANGE_MAP:
+            for exchange_class in EXCHANGE_REGISTRY.load_all():
                 exchange_instance = exchange_class()
                 if exchange_instance.active:
                     self.exchanges.append(exchange_instance)
         else:
+            selected_classes = set()
             for exchange in exchanges:
-                for exchange_class, exchange_keys in EXCHANGE_MAP.items():
-                    if exchange in exchange_keys:
-                        exchange_instance = exchange_class()
-                        if exchange_instance.active:
-                            self.exchanges.append(exchange_instance)
-                        else:
-                            logger.warning(
-                                f"Exchange {exchange} API keys were not found in "
-                                "cryptonaire_reports.config file. Add the following line "
-                                "to be able to retrieve the information: \n"
-                                f"\t\t\t\t[{exchange_instance.name}]\n"
-                                "\t\t\t\tAPI_KEY=<YOUR API KEY>\n"
-                                "\t\t\t\tSECRET_KEY=<YOUR SECRET KEY>\n"
-                            )
-                        continue
+                exchange_class = EXCHANGE_REGISTRY.load(exchange)
+                if exchange_class in selected_classes:
+                    # Same exchange selected with two different aliases
+                    continue
+                selected_classes.add(exchange_class)
+                exchange_instance = exchange_class()
+                if exchange_instance.active:
+                    self.exchanges.append(exchange_instance)
+                else:
+                    logger.warning(
+                        f"Exchange {exchange} API keys were not found in "
+                        "cryptonaire_reports.config file. Add the following line "
+                        "to be able to retrieve the information: \n"
+                        f"\t\t\t\t[{exchange_instance.name}]\n"
+                        "\t\t\t\tAPI_KEY=<YOUR API KEY>\n"
+                        "\t\t\t\tSECRET_KEY=<YOUR SECRET KEY>\n"
+                    )
         if not self.exchanges:
             logger.warning(f"Unable to retrieve data from any exchange. Exiting.")
 
@@ -64,27 +67,31 @@ class Report:
             f"Looking for addresses of the following networks: {','.join(networks)}"
         )
         if "all" in networks:
-            for network_class in NETWORKS_MAP:
+            for network_class in NETWORK_REGISTRY.load_all():
                 network_instance = network_class()
                 if network_instance.active:
                     self.networks.append(network_instance)
         else:
+            selected_classes = set()
             for network in networks:
-                for network_class, network_keys in NETWORKS_MAP.items():
-                    if network in network_keys:
-                        network_instance = network_class()
-                        if network_instance.active:
-                            self.networks.append(network_instance)
-                        else:
-                            logger.warning(
-                                f"Network {network} was not found in "
-                                "cryptonaire_reports.config file. Add the following line "
-                                "to be able to retrieve the information: \n"
-                                f"\t\t\t\t[Networks]\n"
-                                "\t\t\t\t{{network_instance.name}} = <Address 1>\n"
-                                "\t\t\t\t                            <Address 2>\n"
-                            )
-                        continue
+                network_class = NETWORK_REGISTRY.load(network)
+                if network_class in selected_classes:
+                    # Same network selected with two different aliases, which would
+                    # count its balances twice
+                    continue
+                selected_classes.add(network_class)
+                network_instance = network_class()
+                if network_instance.active:
+                    self.networks.append(network_instance)
+                else:
+                    logger.warning(
+                        f"Network {network} was not found in "
+                        "cryptonaire_reports.config file. Add the following line "
+                        "to be able to retrieve the information: \n"
+                        f"\t\t\t\t[Networks]\n"
+                        "\t\t\t\t{{network_instance.name}} = <Address 1>\n"
+                        "\t\t\t\t                            <Address 2>\n"
+                    )
         if not self.networks:
             logger.warning(f"Unable to retrieve data from any network.")
 
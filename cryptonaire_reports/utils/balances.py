@@ -0,0 +1,287 @@
+import math
+import sys
+import threading
+from array import array
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Union,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Columns of the balances, in the same order as the fields of BalanceRecord
+BALANCE_COLUMNS = ["source", "symbol", "balance", "price_backup", "market_cap_backup"]
+# Columns that every manual balance must have. The backup columns are optional
+REQUIRED_MANUAL_COLUMNS = ["source", "symbol", "balance"]
+# Optional columns of the manual balances, used when CoinMarketCap lacks the symbol
+OPTIONAL_MANUAL_COLUMNS = ["price_backup", "market_cap_backup"]
+
+
+class BalanceRecord(NamedTuple):
+    """Balance of a symbol in one source (exchange wallet, network or manual entry).
+    The backup price and market cap are only set by the sources that already know
+    them, and are used when CoinMarketCap doesn't have the symbol."""
+
+    source: str
+    symbol: str
+    balance: float
+    price_backup: float = 0.0
+    market_cap_backup: float = 0.0
+
+
+class BalanceBatch:
+    """Columnar container of balances. The numeric columns are stored in arrays of
+    doubles and the source and symbol names are interned, so collecting thousands of
+    balances doesn't create one tuple and one string per row.
+    A batch is incomplete when some of its balances couldn't be read, e.g. because an
+    account of the exchange failed, so it's never cached."""
+
+    __slots__ = (
+        "sources",
+        "symbols",
+        "balances",
+        "price_backups",
+        "market_cap_backups",
+        "complete",
+    )
+
+    def __init__(
+        self, records: Iterable[BalanceRecord] = (), complete: bool = True
+    ) -> None:
+        self.sources: List[str] = []
+        self.symbols: List[str] = []
+        self.balances = array("d")
+        self.price_backups = array("d")
+        self.market_cap_backups = array("d")
+        self.complete = complete
+        self.extend(records)
+
+    @classmethod
+    def from_columns(
+        cls,
+        sources: Iterable[str],
+        symbols: Iterable[str],
+        balances: Sequence[float],
+        price_backups: Sequence[float],
+        market_cap_backups: Sequence[float],
+    ) -> "BalanceBatch":
+        """Builds a batch from whole columns, e.g. the columns of a dataframe or
+        numpy arrays, without going through one record per balance.
+
+        Args:
+            sources (Iterable[str]): Source of every balance
+            symbols (Iterable[str]): Symbol of every balance
+            balances (Sequence[float]): Balances
+            price_backups (Sequence[float]): Backup prices
+            market_cap_backups (Sequence[float]): Backup market caps
+
+        Returns:
+            BalanceBatch: Batch with the given balances
+        """
+        batch = cls()
+        batch.sources = [sys.intern(source) for source in sources]
+        batch.symbols = [sys.intern(symbol) for symbol in symbols]
+        batch.balances = array("d", balances)
+        batch.price_backups = array("d", price_backups)
+        batch.market_cap_backups = array("d", market_cap_backups)
+        return batch
+
+    def __len__(self) -> int:
+        return len(self.balances)
+
+    def __iter__(self) -> Iterator[BalanceRecord]:
+        return map(
+            BalanceRecord._make,
+            zip(
+                self.sources,
+                self.symbols,
+                self.balances,
+                self.price_backups,
+                self.market_cap_backups,
+            ),
+        )
+
+    def __repr__(self) -> str:
+        return f"BalanceBatch({list(self)})"
+
+    def append(
+        self,
+        source: str,
+        symbol: str,
+        balance: float,
+        price_backup: float = 0.0,
+        market_cap_backup: float = 0.0,
+    ) -> None:
+        self.sources.append(sys.intern(source))
+        self.symbols.append(sys.intern(symbol))
+        self.balances.append(balance)
+        self.price_backups.append(price_backup)
+        self.market_cap_backups.append(market_cap_backup)
+
+    def extend(self, records: Union["BalanceBatch", Iterable[BalanceRecord]]) -> None:
+        """Adds all the balances of another batch, or of an iterable of records.
+
+        Args:
+            records (Union[BalanceBatch, Iterable[BalanceRecord]]): Balances to add
+        """
+        if isinstance(records, BalanceBatch):
+            self.sources.extend(records.sources)
+            self.symbols.extend(records.symbols)
+            self.balances.extend(records.balances)
+            self.price_backups.extend(records.price_backups)
+            self.market_cap_backups.extend(records.market_cap_backups)
+            self.complete = self.complete and records.complete
+            return
+        for record in records:
+            self.append(*record)
+
+
+def _parse_name(row: Dict[str, Any], column: str) -> str:
+    value = row[column]
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f"{column} must be a non-empty text, got {value!r}")
+    return value.strip()
+
+
+def _parse_number(
+    row: Dict[str, Any], column: str, default: Optional[float] = None
+) -> float:
+    value = row.get(column)
+    # Empty cells are read as NaN
+    if default is not None and (value is None or value != value or value == ""):
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{column} must be a number, got {value!r}")
+    if not math.isfinite(number):
+        raise ValueError(f"{column} must be a finite number, got {value!r}")
+    if number < 0:
+        raise ValueError(f"{column} can't be negative, got {value!r}")
+    return number
+
+
+def parse_balance_row(row: Dict[str, Any]) -> BalanceRecord:
+    """Validates a balance coming from an untyped input, like the manual balances CSV
+    file, and converts it into a BalanceRecord.
+
+    Args:
+        row (Dict[str, Any]): Dictionary with REQUIRED_MANUAL_COLUMNS and, optionally,
+            price_backup and market_cap_backup
+
+    Raises:
+        ValueError: If a value is missing or has the wrong type
+
+    Returns:
+        BalanceRecord: Validated balance
+    """
+    return BalanceRecord(
+        source=_parse_name(row, "source"),
+        symbol=_parse_name(row, "symbol"),
+        balance=_parse_number(row, "balance"),
+        price_backup=_parse_number(row, "price_backup", default=0.0),
+        market_cap_backup=_parse_number(row, "market_cap_backup", default=0.0),
+    )
+
+
+class IncrementalAggregator:
+    """Aggregates balances by symbol as they arrive, so the raw balances of every
+    source don't need to be kept in memory until all the sources have finished. The
+    balances are added up, the backup price and market cap keep their maximum, and
+    the balance of every symbol is also kept per source."""
+
+    def __init__(self) -> None:
+        # Map of symbol: [balance, price_backup, market_cap_backup, {source: balance}]
+        self._totals: Dict[str, List] = {}
+        self._lock = threading.Lock()
+        self.rows = 0
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def add(self, balances: Union[BalanceBatch, Iterable[BalanceRecord]]) -> List[str]:
+        """Merges balances into the running totals.
+
+        Args:
+            balances (Union[BalanceBatch, Iterable[BalanceRecord]]): Balances to add
+
+        Returns:
+            List[str]: Symbols that hadn't been seen before, in order of appearance
+        """
+        if isinstance(balances, BalanceBatch):
+            balances = zip(
+                balances.sources,
+                balances.symbols,
+                balances.balances,
+                balances.price_backups,
+                balances.market_cap_backups,
+            )
+        new_symbols = []
+        with self._lock:
+            for source, symbol, balance, price_backup, market_cap_backup in balances:
+                self.rows += 1
+                totals = self._totals.get(symbol)
+                if totals is None:
+                    self._totals[symbol] = [
+                        balance,
+                        price_backup,
+                        market_cap_backup,
+                        {source: balance},
+                    ]
+                    new_symbols.append(symbol)
+                    continue
+                totals[0] += balance
+                totals[1] = max(totals[1], price_backup)
+                totals[2] = max(totals[2], market_cap_backup)
+                source_balances = totals[3]
+                source_balances[source] = source_balances.get(source, 0.0) + balance
+        return new_symbols
+
+    def to_dataframe(self) -> "pd.DataFrame":
+        """Builds a dataframe with the aggregated balances.
+
+        Returns:
+            pd.DataFrame: Pandas dataframe indexed by symbol (sorted) with the
+                following columns: source, balance, price_backup, market_cap_backup
+        """
+        import pandas as pd
+
+        with self._lock:
+            symbols = sorted(self._totals)
+            totals = [self._totals[symbol] for symbol in symbols]
+        return pd.DataFrame(
+            {
+                # Sorted so the report is deterministic
+                "source": ["|".join(sorted(total[3])) for total in totals],
+                "balance": [total[0] for total in totals],
+                "price_backup": [total[1] for total in totals],
+                "market_cap_backup": [total[2] for total in totals],
+            },
+            index=pd.Index(symbols, name="symbol"),
+        )
+
+    def to_source_dataframe(self) -> "pd.DataFrame":
+        """Builds a dataframe with the balance of every symbol in every source.
+
+        Returns:
+            pd.DataFrame: Pandas dataframe with the following columns: source,
+                symbol, balance
+        """
+        import pandas as pd
+
+        with self._lock:
+            rows = [
+                (source, symbol, balance)
+                for symbol, totals in self._totals.items()
+                for source, balance in totals[3].items()
+            ]
+        return pd.DataFrame(rows, columns=["source", "symbol", "balance"])
@@ -1,34 +1,130 @@
-import time
-from configparser import ConfigParser
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from typing import List, Dict, Set
 
 import structlog
 from coinmarketcapapi import CoinMarketCapAPI
 from coinmarketcapapi import CoinMarketCapAPIError
 from coinmarketcapapi import Response
+from cryptonaire_reports.utils.config import get_config
+from cryptonaire_reports.utils.json_cache import JsonCache
+from cryptonaire_reports.utils.rate_limiter import TokenBucket
 from cryptonaire_reports.utils.singleton import Singleton
+from cryptonaire_reports.utils.timings import count
+from cryptonaire_reports.utils.timings import span
 
 logger = structlog.get_logger()
 
+# Error codes returned when the requests limit is reached
+RATE_LIMIT_ERROR_CODES = [429, 1008]
+# Maximum number of times a request is retried after reaching the requests limit
+MAX_RATE_LIMIT_RETRIES = 3
+# Maximum number of ids requested in a single call to the quotes latest endpoint
+QUOTES_BATCH_SIZE = 100
+# Maximum number of quotes latest calls running at the same time
+QUOTES_MAX_WORKERS = 4
+SECONDS_PER_DAY = 24 * 60 * 60
+
 
 class CoinMarketCap(metaclass=Singleton):
 
     def __init__(self) -> None:
-        config = ConfigParser()
-        config.read("cryptonaire_reports.config")
-        if "CoinMarketCap" not in config:
-            logger.error(
-                f"CoinMarketCap configuration missing in cryptonaire_reports.config"
-            )
+        config = get_config().coin_market_cap
+        if config is None:
+            logger.error(f"CoinMarketCap configuration missing in {get_config().path}")
             exit(1)
         try:
-            self.api = CoinMarketCapAPI(api_key=config.get("CoinMarketCap", "API_KEY"))
+            self.api = CoinMarketCapAPI(api_key=config.api_key)
         except:
             logger.error(
                 f"[CoinMarketCap] Error while configuring the CoinMarketCap API. Double"
                 f"check that the API key is valid."
             )
             exit(1)
+        # Throttles all the requests so they stay within the plan limits. The burst
+        # is kept to half of the limit, since the API counts requests per minute
+        self.rate_limiter = TokenBucket(
+            rate_per_minute=config.rate_limit_per_minute,
+            capacity=max(1, config.rate_limit_per_minute // 2),
+            name="CoinMarketCap",
+        )
+        # Local index of symbol -> id, name and rank. These values barely change, so
+        # there's no need to request them from the API in every run
+        self.coin_map_index = JsonCache(
+            "coin_map", ttl=config.map_ttl_days * SECONDS_PER_DAY
+        )
+        # Symbols that are known to be missing in CoinMarketCap. A single unknown
+        # symbol makes the whole cryptocurrency map request fail, so they're excluded
+        # up front. New listings are picked up once the entries expire
+        self.unknown_symbols = JsonCache(
+            "unknown_symbols", ttl=config.unknown_symbol_ttl_days * SECONDS_PER_DAY
+        )
+        # Local cache of the latest quotes, so several reports generated within a few
+        # minutes don't request the same prices again. Expired quotes can still be
+        # served for quote_max_stale seconds while they're refreshed in the background
+        self.quote_cache = JsonCache("quotes", ttl=config.quote_ttl_seconds)
+        self.quote_max_stale = config.quote_max_stale_seconds
+        self._refreshing_ids: Set[str] = set()
+        self._refreshing_lock = threading.Lock()
+        self._refresh_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="quote-refresh"
+        )
+
+    @staticmethod
+    def _get_retry_wait(error_response: Response) -> float:
+        """Calculates how long to wait after reaching the requests limit. The minute
+        limits reset at the start of every minute of the API clock, so the status
+        timestamp of the error tells how many seconds are left until the reset.
+
+        Args:
+            error_response (Response): Response of the failed request
+
+        Returns:
+            float: Seconds to wait before sending the next request
+        """
+        try:
+            timestamp = datetime.fromisoformat(error_response.timestamp)
+            return 60 - timestamp.second - timestamp.microsecond / 1_000_000 + 1
+        except (AttributeError, TypeError, ValueError):
+            return 61
+
+    def _call_api(self, endpoint: str, **kwargs) -> Response:
+        """Calls a CoinMarketCap API endpoint once the rate limiter allows it. If the
+        requests limit is reached anyway, the rate limiter is paused until the limit
+        resets and the request is retried, up to MAX_RATE_LIMIT_RETRIES times.
+
+        Args:
+            endpoint (str): Name of the CoinMarketCapAPI method to call
+            **kwargs: Parameters of the request
+
+        Raises:
+            CoinMarketCapAPIError: If the request fails for a reason other than the
+                requests limit, or the limit is still reached after all the retries.
+
+        Returns:
+            Response: Response of the API
+        """
+        for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+            self.rate_limiter.acquire()
+            try:
+                with span(f"CoinMarketCap.{endpoint}", "coinmarketcap"):
+                    return getattr(self.api, endpoint)(**kwargs)
+            except CoinMarketCapAPIError as e:
+                error_response: Response = e.rep
+                if (
+                    error_response.error_code not in RATE_LIMIT_ERROR_CODES
+                    or attempt == MAX_RATE_LIMIT_RETRIES
+                ):
+                    raise
+                wait = self._get_retry_wait(error_response)
+                count("CoinMarketCap rate limit retries")
+                logger.warning(
+                    f"[CoinMarketCap] API limit reached. Waiting {wait:.0f} seconds to "
+                    f"resume (retry {attempt + 1} of {MAX_RATE_LIMIT_RETRIES})..."
+                )
+                self.rate_limiter.pause(wait)
 
     def extract_cryptocurrency_map_from_api(self, coin_list: Set[str]) -> List[Dict]:
         """Calls the cryptocurrency_map endpoint from CoinMarketCap API and retrieves
@@ -42,8 +138,8 @@ class CoinMarketCap(metaclass=Singleton):
             List[Dict]: List that contains the cryptocurrency map for all coins
         """
         try:
-            coin_market_cap_map_response: Response = self.api.cryptocurrency_map(
-                symbol=",".join(coin_list)
+            coin_market_cap_map_response: Response = self._call_api(
+                "cryptocurrency_map", symbol=",".join(coin_list)
             )
             logger.info(
                 f"[CoinMarketCap] Cryptocurrency map information for "
@@ -57,23 +153,31 @@ class CoinMarketCap(metaclass=Singleton):
             error_response: Response = e.rep
             logger.debug(f"[CoinMarketCap] Full error: {error_response}")
             if error_response.error_code == 400:
-                # Bad request, one or more coins were not found. Try one by one
+                # Bad request, one or more coins were not found. Split the coins in
+                # two halves and try again with each of them, so only the halves
+                # that contain unknown coins keep being split
                 if len(coin_list) == 1:
                     # This particular coin was not found, return []
+                    symbol = next(iter(coin_list))
                     logger.error(
-                        f"[CoinMarketCap] The coin {next(iter(coin_list))} was not "
-                        f"found in CoinMarketCap. All the information will be missing."
+                        f"[CoinMarketCap] The coin {symbol} was not found in "
+                        f"CoinMarketCap. All the information will be missing."
                     )
+                    self.unknown_symbols.set(symbol.upper(), True)
                     return []
                 else:
                     logger.warning(
                         f"[CoinMarketCap] Failed to fetch cryptocurrency map info for "
-                        "all the coins in one API call. Trying making one call per coin"
+                        f"{len(coin_list)} coins in one API call. Splitting them in "
+                        f"two halves to find the ones that are not available"
                     )
+                    count("CoinMarketCap map splits")
+                    sorted_coins = sorted(coin_list)
+                    middle = len(sorted_coins) // 2
                     batch_responses = []
-                    for symbol in coin_list:
+                    for half in (sorted_coins[:middle], sorted_coins[middle:]):
                         res = self.extract_cryptocurrency_map_from_api(
-                            coin_list={symbol}
+                            coin_list=set(half)
                         )
                         batch_responses.extend(res)
                     return batch_responses
@@ -85,13 +189,13 @@ class CoinMarketCap(metaclass=Singleton):
                     f"cryptocurrency map is forbidden or unauthorized"
                 )
                 exit(1)
-            elif error_response.error_code in [429, 1008]:
-                # Request limit reached
-                logger.warning(
-                    f"[CoinMarketCap] API limit reached. Waiting 60 seconds to resume..."
+            elif error_response.error_code in RATE_LIMIT_ERROR_CODES:
+                # Request limit still reached after all the retries
+                logger.error(
+                    f"[CoinMarketCap] API limit still reached after "
+                    f"{MAX_RATE_LIMIT_RETRIES} retries. Please try again later"
                 )
-                time.sleep(61)
-                return self.extract_cryptocurrency_map_from_api(coin_list=coin_list)
+                exit(1)
             elif error_response.error_code == 500:
                 # Internal server error
                 logger.error(
@@ -119,7 +223,8 @@ class CoinMarketCap(metaclass=Singleton):
             List[Dict]: Price info for the requested id
         """
         try:
-            latest_quote = self.api.cryptocurrency_quotes_latest(id=id).data.get(id)
+            response: Response = self._call_api("cryptocurrency_quotes_latest", id=id)
+            latest_quote = response.data.get(id)
             return latest_quote
         except CoinMarketCapAPIError as e:
             error_response: Response = e.rep
@@ -135,13 +240,13 @@ class CoinMarketCap(metaclass=Singleton):
                     f"cryptocurrency map is forbidden or unauthorized"
                 )
                 exit(1)
-            elif error_response.error_code in [429, 1008]:
-                # Request limit reached
-                logger.warning(
-                    f"[CoinMarketCap] API limit reached. Waiting 60 seconds to resume..."
+            elif error_response.error_code in RATE_LIMIT_ERROR_CODES:
+                # Request limit still reached after all the retries
+                logger.error(
+                    f"[CoinMarketCap] API limit still reached after "
+                    f"{MAX_RATE_LIMIT_RETRIES} retries. Please try again later"
                 )
-                time.sleep(61)
-                return self.extract_quotes_latest_from_api(id=id)
+                exit(1)
             elif error_response.error_code == 500:
                 # Internal server error
                 logger.error(
@@ -158,30 +263,278 @@ class CoinMarketCap(metaclass=Singleton):
                 )
                 exit(1)
 
-    def get_coin_info(self, coin_list: Set[str]) -> List[Dict]:
+    def extract_quotes_latest_batch_from_api(self, ids: List[str]) -> Dict[str, Dict]:
+        """Calls the cryptocurrency_quotes_latest endpoint from CoinMarketCap API with
+        a batch of ids and retrieves the latest price data for all of them in a single
+        call. If some of the ids can't be retrieved, only those ids are requested
+        again, one call per id.
+
+        Args:
+            ids (List[str]): CoinMarketCap coin ids. It shouldn't contain more than
+                QUOTES_BATCH_SIZE ids.
+
+        Returns:
+            Dict[str, Dict]: Dictionary where the keys are the ids and the values the
+                price info for that id. Ids without price info are not included.
+        """
+        try:
+            response: Response = self._call_api(
+                "cryptocurrency_quotes_latest", id=",".join(ids)
+            )
+            quotes = {id: response.data[id] for id in ids if response.data.get(id)}
+            failed_ids = [id for id in ids if id not in quotes]
+        except CoinMarketCapAPIError as e:
+            error_response: Response = e.rep
+            logger.debug(f"[CoinMarketCap] Full error: {error_response}")
+            if error_response.error_code == 400:
+                # Bad request, one or more ids are invalid. The error message names
+                # them, so we can request the rest of the batch again without them
+                invalid_ids = set(
+                    re.findall(r"\d+", str(error_response.error_message))
+                ) & set(ids)
+                valid_ids = [id for id in ids if id not in invalid_ids]
+                if not invalid_ids or len(ids) == 1:
+                    quotes, failed_ids = {}, ids
+                else:
+                    logger.warning(
+                        f"[CoinMarketCap] Latest quotes batch failed due to ids "
+                        f"{','.join(invalid_ids)}. Retrying the batch without them"
+                    )
+                    quotes = (
+                        self.extract_quotes_latest_batch_from_api(valid_ids)
+                        if valid_ids
+                        else {}
+                    )
+                    # The rest of the batch was already retried in the recursive call
+                    failed_ids = [id for id in ids if id in invalid_ids]
+            elif error_response.error_code in [401, 403]:
+                # Forbidden or unauthorized access
+                logger.error(
+                    f"[CoinMarketCap] Failed to retrieve info from API. Access to the "
+                    f"latest quotes is forbidden or unauthorized"
+                )
+                exit(1)
+            elif error_response.error_code in RATE_LIMIT_ERROR_CODES:
+                # Request limit still reached after all the retries
+                logger.error(
+                    f"[CoinMarketCap] API limit still reached after "
+                    f"{MAX_RATE_LIMIT_RETRIES} retries. Please try again later"
+                )
+                exit(1)
+            elif error_response.error_code == 500:
+                # Internal server error
+                logger.error(
+                    f"[CoinMarketCap] There is a problem with the CoinMarketCap API. "
+                    f"Please try again later"
+                )
+                exit(1)
+            else:
+                # Unknown error
+                logger.error(
+                    f"[CoinMarketCap] Unknown error happened. Please create an issue "
+                    f"in the Github project to solve this problem. Include the "
+                    f"following in your request: {error_response}"
+                )
+                exit(1)
+
+        if len(ids) > 1:
+            # Retry only the ids that failed, each of them on its own
+            count("CoinMarketCap quote retries", len(failed_ids))
+            for id in failed_ids:
+                latest_quote = self.extract_quotes_latest_from_api(id=id)
+                if latest_quote:
+                    quotes[id] = latest_quote
+        return quotes
+
+    def get_latest_quotes(self, ids: List[str]) -> Dict[str, Dict]:
+        """Retrieves the latest price data for all the given ids. The ids are split
+        in batches of QUOTES_BATCH_SIZE that are requested concurrently.
+
+        Args:
+            ids (List[str]): CoinMarketCap coin ids
+
+        Returns:
+            Dict[str, Dict]: Dictionary where the keys are the ids and the values the
+                price info for that id. Ids without price info are not included.
+        """
+        batches = [
+            ids[i : i + QUOTES_BATCH_SIZE]
+            for i in range(0, len(ids), QUOTES_BATCH_SIZE)
+        ]
+        if not batches:
+            return {}
+        logger.info(
+            f"[CoinMarketCap] Requesting latest quotes for {len(ids)} coins in "
+            f"{len(batches)} batches"
+        )
+        quotes = {}
+        with ThreadPoolExecutor(
+            max_workers=min(QUOTES_MAX_WORKERS, len(batches)),
+            thread_name_prefix="coinmarketcap",
+        ) as executor:
+            for batch_quotes in executor.map(
+                self.extract_quotes_latest_batch_from_api, batches
+            ):
+                quotes.update(batch_quotes)
+        return quotes
+
+    @staticmethod
+    def _parse_quote(latest_quote: Dict) -> Dict:
+        """Extracts the fields used in the reports from a latest quote response.
+
+        Args:
+            latest_quote (Dict): Price info returned by the quotes latest endpoint
+
+        Returns:
+            Dict: Dictionary with the price, supplies and market cap of the coin
+        """
+        return {
+            "price_usd": float(latest_quote.get("quote").get("USD").get("price")),
+            "max_supply": int(latest_quote.get("max_supply") or -1),
+            "circulating_supply": int(latest_quote.get("circulating_supply") or -1),
+            "total_supply": int(latest_quote.get("total_supply") or -1),
+            "market_cap": int(
+                latest_quote.get("quote").get("USD").get("market_cap") or -1
+            ),
+        }
+
+    def refresh_quotes(self, ids: List[str]) -> Dict[str, Dict]:
+        """Requests the latest quotes for the given ids and stores them in the quote
+        cache.
+
+        Args:
+            ids (List[str]): CoinMarketCap coin ids
+
+        Returns:
+            Dict[str, Dict]: Dictionary where the keys are the ids and the values the
+                quote cache entries, with the parsed quote under "value" and the time
+                it was requested under "fetched_at".
+        """
+        latest_quotes = self.get_latest_quotes(ids=ids)
+        for id, latest_quote in latest_quotes.items():
+            self.quote_cache.set(id, self._parse_quote(latest_quote))
+        if latest_quotes:
+            self.quote_cache.save()
+        return {id: self.quote_cache.get_entry(id) for id in latest_quotes}
+
+    def _refresh_quotes_in_background(self, ids: List[str]) -> None:
+        with self._refreshing_lock:
+            ids = [id for id in ids if id not in self._refreshing_ids]
+            self._refreshing_ids.update(ids)
+        if not ids:
+            return
+
+        def _refresh() -> None:
+            try:
+                self.refresh_quotes(ids=ids)
+                logger.debug(f"[CoinMarketCap] Refreshed {len(ids)} stale quotes")
+            finally:
+                with self._refreshing_lock:
+                    self._refreshing_ids.difference_update(ids)
+
+        self._refresh_executor.submit(_refresh)
+
+    def get_cached_quotes(self, ids: List[str]) -> Dict[str, Dict]:
+        """Retrieves the latest quotes for the given ids, using the quote cache
+        whenever possible:
+        - Quotes within QUOTE_TTL_SECONDS are served from the cache.
+        - Expired quotes within QUOTE_MAX_STALE_SECONDS are served from the cache
+          while they're refreshed in the background.
+        - The rest of the quotes are requested to the API.
+
+        Args:
+            ids (List[str]): CoinMarketCap coin ids
+
+        Returns:
+            Dict[str, Dict]: Dictionary where the keys are the ids and the values the
+                quote cache entries, with the parsed quote under "value" and the time
+                it was requested under "fetched_at".
+        """
+        quotes = {}
+        stale_ids = []
+        missing_ids = []
+        for id in ids:
+            entry = self.quote_cache.get_entry(id)
+            if entry is None or self.quote_cache.is_expired(
+                entry, ttl=self.quote_cache.ttl + self.quote_max_stale
+            ):
+                missing_ids.append(id)
+                continue
+            quotes[id] = entry
+            if self.quote_cache.is_expired(entry):
+                stale_ids.append(id)
+        logger.info(
+            f"[CoinMarketCap] Quotes in cache: {len(quotes) - len(stale_ids)} fresh, "
+            f"{len(stale_ids)} stale. {len(missing_ids)} will be requested to the API"
+        )
+        if missing_ids:
+            quotes.update(self.refresh_quotes(ids=missing_ids))
+        if stale_ids:
+            self._refresh_quotes_in_background(ids=stale_ids)
+        return quotes
+
+    def get_coin_info(
+        self, coin_list: Set[str], refresh_map: bool = False
+    ) -> List[Dict]:
         """Given a list of coins / ticker symbols, extracts additional information
-        using the CoinMarketCap API.
+        using the CoinMarketCap API. The id, name and rank of each symbol are taken
+        from the local index when available, and only the missing or expired symbols
+        are requested to the cryptocurrency map endpoint.
 
         Args:
             coin_list (Set[str]): List of all the coins we want to extract info from.
+            refresh_map (bool): If True, ignores the local index and the known unknown
+                symbols and requests the cryptocurrency map of all the coins. Defaults
+                to False.
 
         Returns:
             List[Dict]: Dictionary where the keys are the ticker symbols and the value
                 is a dictionary with all the requested information
         """
-        cryptocurrency_map = self.extract_cryptocurrency_map_from_api(coin_list)
+        coin_info = {}
+        missing_coins = set()
+        unknown_coins = set()
+        for coin in coin_list:
+            if refresh_map:
+                missing_coins.add(coin)
+            elif self.unknown_symbols.get(coin.upper()):
+                unknown_coins.add(coin)
+            elif cached_map := self.coin_map_index.get(coin.upper()):
+                coin_info[coin.upper()] = dict(cached_map)
+            else:
+                missing_coins.add(coin)
+        if unknown_coins:
+            logger.warning(
+                f"[CoinMarketCap] Skipping symbols that were not found in previous "
+                f"runs: {','.join(sorted(unknown_coins))}"
+            )
+        logger.info(
+            f"[CoinMarketCap] {len(coin_info)} symbols found in the local index, "
+            f"{len(missing_coins)} will be requested to the API"
+        )
+
+        cryptocurrency_map = []
+        if missing_coins:
+            cryptocurrency_map = self.extract_cryptocurrency_map_from_api(missing_coins)
+            self.unknown_symbols.save()
 
         # Results can contain duplicates. We only want to keep the first instance of
         # each symbol
-        coin_info = {}
+        new_coins = set()
         for coin_map in cryptocurrency_map:
-            if coin_map["symbol"].upper() in coin_info:
+            symbol = coin_map["symbol"].upper()
+            if symbol in coin_info:
                 continue
-            coin_info[coin_map["symbol"].upper()] = {
+            coin_info[symbol] = {
                 "id": coin_map.get("id"),
                 "name": coin_map.get("name"),
                 "rank": int(coin_map.get("rank") or -1),
             }
+            new_coins.add(symbol)
+        for symbol in new_coins:
+            self.coin_map_index.set(symbol, dict(coin_info[symbol]))
+        if new_coins:
+            self.coin_map_index.save()
         not_found = set([coin.upper() for coin in coin_list]) - set(coin_info.keys())
         if not_found:
             logger.warning(
@@ -191,26 +544,17 @@ class CoinMarketCap(metaclass=Singleton):
             logger.info(
                 f"[CoinMarketCap] Basic information found for: {', '.join(coin_list)}"
             )
+        cached_quotes = self.get_cached_quotes(
+            ids=[str(crypto_map["id"]) for crypto_map in coin_info.values()]
+        )
         for symbol, crypto_map in coin_info.items():
-            latest_quote = self.extract_quotes_latest_from_api(id=str(crypto_map["id"]))
-            if not latest_quote:
+            cached_quote = cached_quotes.get(str(crypto_map["id"]))
+            if not cached_quote:
                 logger.warning(f"[CoinMarketCap] Price data not found for {symbol}")
             else:
                 logger.info(f"[CoinMarketCap] Price data found for {symbol}")
-                coin_info[symbol]["price_usd"] = float(
-                    latest_quote.get("quote").get("USD").get("price")
-                )
-                coin_info[symbol]["max_supply"] = int(
-                    latest_quote.get("max_supply") or -1
-                )
-                coin_info[symbol]["circulating_supply"] = int(
-                    latest_quote.get("circulating_supply") or -1
-                )
-                coin_info[symbol]["total_supply"] = int(
-                    latest_quote.get("total_supply") or -1
-                )
-                coin_info[symbol]["market_cap"] = int(
-                    latest_quote.get("quote").get("USD").get("market_cap") or -1
-                )
+                coin_info[symbol].update(cached_quote["value"])
+                # Time when the price was requested, to know how fresh it is
+                coin_info[symbol]["price_fetched_at"] = cached_quote["fetched_at"]
         logger.debug(f"[CoinMarketCap] Additional Info Extracted: {coin_info}")
         return coin_info
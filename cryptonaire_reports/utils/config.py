@@ -0,0 +1,325 @@
+import os
+from configparser import ConfigParser
+from dataclasses import dataclass
+from dataclasses import field
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+CONFIG_FILE = "cryptonaire_reports.config"
+# Prefix of the environment variables that override the config file. The variable
+# CRYPTONAIRE_<SECTION>_<KEY> overrides KEY in SECTION, where the section name is
+# upper case with spaces replaced by underscores (e.g. CRYPTONAIRE_BINANCE_API_KEY or
+# CRYPTONAIRE_MANUAL_BALANCES_CSV_FILE). CRYPTONAIRE_CONFIG sets the config path.
+ENV_PREFIX = "CRYPTONAIRE_"
+CONFIG_PATH_ENV = f"{ENV_PREFIX}CONFIG"
+
+EXCHANGE_SECTIONS = ["Binance", "BingX", "ByBit", "Coinbase", "Gate"]
+NETWORK_KEYS = ["ETHEREUM", "SOLANA"]
+KNOWN_SECTIONS = [
+    "CoinMarketCap",
+    *EXCHANGE_SECTIONS,
+    "Networks",
+    "Solana",
+    "Manual Balances",
+    "Balances Cache",
+    "Ignore Tokens",
+]
+
+
+@dataclass(frozen=True)
+class ExchangeConfig:
+    api_key: str
+    secret_key: str
+    token_ignore_list: List[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class NetworkConfig:
+    addresses: List[str]
+    token_ignore_list: List[str] = field(default_factory=list)
+
+
+@dataclass(frozen=True)
+class CoinMarketCapConfig:
+    api_key: str
+    rate_limit_per_minute: float = 30
+    map_ttl_days: float = 7
+    unknown_symbol_ttl_days: float = 7
+    quote_ttl_seconds: float = 300
+    quote_max_stale_seconds: float = 900
+
+
+@dataclass(frozen=True)
+class SolanaConfig:
+    rpc_url: str = "https://api.mainnet-beta.solana.com"
+    rpc_batch_size: int = 50
+    mint_ttl_seconds: float = 300
+
+
+@dataclass(frozen=True)
+class ManualBalancesConfig:
+    csv_file: str
+
+
+@dataclass(frozen=True)
+class BalancesCacheConfig:
+    ttl_seconds: float = 300
+    # TTL of specific sources, e.g. BINANCE or SOLANA, in seconds
+    source_ttl_seconds: Dict[str, float] = field(default_factory=dict)
+
+    def get_ttl(self, source_name: str) -> float:
+        return self.source_ttl_seconds.get(source_name.upper(), self.ttl_seconds)
+
+
+@dataclass(frozen=True)
+class CryptonaireConfig:
+    path: str
+    coin_market_cap: Optional[CoinMarketCapConfig] = None
+    exchanges: Dict[str, ExchangeConfig] = field(default_factory=dict)
+    networks: Dict[str, NetworkConfig] = field(default_factory=dict)
+    has_networks_section: bool = False
+    solana: SolanaConfig = field(default_factory=SolanaConfig)
+    manual_balances: Optional[ManualBalancesConfig] = None
+    balances_cache: BalancesCacheConfig = field(default_factory=BalancesCacheConfig)
+
+
+_config_path: Optional[str] = None
+
+
+def _env_section_name(section: str) -> str:
+    return section.upper().replace(" ", "_")
+
+
+def _apply_env_overrides(parser: ConfigParser) -> None:
+    # Longest names first, so MANUAL_BALANCES isn't taken as a key of another section
+    sections = sorted(
+        set(KNOWN_SECTIONS) | set(parser.sections()),
+        key=lambda x: len(_env_section_name(x)),
+        reverse=True,
+    )
+    for env_name, value in os.environ.items():
+        if not env_name.startswith(ENV_PREFIX) or env_name == CONFIG_PATH_ENV:
+            continue
+        name = env_name[len(ENV_PREFIX) :]
+        for section in sections:
+            section_prefix = f"{_env_section_name(section)}_"
+            if name.startswith(section_prefix) and len(name) > len(section_prefix):
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                parser.set(section, name[len(section_prefix) :], value)
+                logger.debug(f"[CONFIG] {section} overridden by {env_name}")
+                break
+        else:
+            logger.warning(f"[CONFIG] Environment variable {env_name} ignored")
+
+
+def _parse_list(value: str, separator: Optional[str] = None) -> List[str]:
+    return [x.strip() for x in value.split(separator) if x.strip()]
+
+
+class _OutOfRangeError(ValueError):
+    """Raised by the option parsers when a number is outside of its valid range"""
+
+
+def _positive_float(value: str) -> float:
+    parsed = float(value)
+    # Written this way so NaN is rejected as well
+    if not parsed > 0:
+        raise _OutOfRangeError("it must be greater than 0")
+    return parsed
+
+
+def _positive_int(value: str) -> int:
+    parsed = int(value)
+    if parsed <= 0:
+        raise _OutOfRangeError("it must be greater than 0")
+    return parsed
+
+
+def _non_negative_float(value: str) -> float:
+    parsed = float(value)
+    if not parsed >= 0:
+        raise _OutOfRangeError("it must be 0 or greater")
+    return parsed
+
+
+def _parse_options(
+    parser: ConfigParser,
+    section: str,
+    options: Dict[str, Callable],
+    errors: List[str],
+) -> Dict:
+    parsed = {}
+    for option, parse in options.items():
+        if not parser.has_option(section, option):
+            continue
+        value = parser.get(section, option)
+        try:
+            parsed[option.lower()] = parse(value)
+        except _OutOfRangeError as e:
+            errors.append(f"[{section}] {option} has an invalid value: {value}, {e}")
+        except ValueError:
+            errors.append(f"[{section}] {option} has an invalid value: {value}")
+    return parsed
+
+
+def _parse_config(parser: ConfigParser, path: str) -> CryptonaireConfig:
+    errors = []
+    for section in parser.sections():
+        if section not in KNOWN_SECTIONS:
+            logger.warning(f"[CONFIG] Unknown section [{section}] will be ignored")
+
+    def _ignore_list(name: str) -> List[str]:
+        return _parse_list(parser.get("Ignore Tokens", name, fallback=""), ",")
+
+    coin_market_cap = None
+    if parser.has_section("CoinMarketCap"):
+        if not parser.get("CoinMarketCap", "API_KEY", fallback=""):
+            errors.append("[CoinMarketCap] API_KEY is missing")
+        else:
+            coin_market_cap = CoinMarketCapConfig(
+                api_key=parser.get("CoinMarketCap", "API_KEY"),
+                **_parse_options(
+                    parser,
+                    "CoinMarketCap",
+                    {
+                        # A rate of 0 would disable the rate limiter
+                        "RATE_LIMIT_PER_MINUTE": _positive_float,
+                        "MAP_TTL_DAYS": _non_negative_float,
+                        "UNKNOWN_SYMBOL_TTL_DAYS": _non_negative_float,
+                        "QUOTE_TTL_SECONDS": _non_negative_float,
+                        "QUOTE_MAX_STALE_SECONDS": _non_negative_float,
+                    },
+                    errors,
+                ),
+            )
+
+    exchanges = {}
+    for exchange in EXCHANGE_SECTIONS:
+        if not parser.has_section(exchange):
+            continue
+        missing = [
+            key
+            for key in ["API_KEY", "SECRET_KEY"]
+            if not parser.get(exchange, key, fallback="")
+        ]
+        if missing:
+            errors.append(f"[{exchange}] {', '.join(missing)} missing")
+            continue
+        exchanges[exchange] = ExchangeConfig(
+            api_key=parser.get(exchange, "API_KEY"),
+            secret_key=parser.get(exchange, "SECRET_KEY"),
+            token_ignore_list=_ignore_list(exchange.upper()),
+        )
+
+    networks = {}
+    for network in NETWORK_KEYS:
+        # Multiple addresses are set one per line
+        addresses = _parse_list(parser.get("Networks", network, fallback=""))
+        if addresses:
+            networks[network] = NetworkConfig(
+                addresses=addresses, token_ignore_list=_ignore_list(network)
+            )
+
+    solana = SolanaConfig(
+        **_parse_options(
+            parser,
+            "Solana",
+            {
+                "RPC_URL": str,
+                "RPC_BATCH_SIZE": _positive_int,
+                "MINT_TTL_SECONDS": _non_negative_float,
+            },
+            errors,
+        )
+    )
+
+    manual_balances = None
+    if parser.has_section("Manual Balances"):
+        manual_balances = ManualBalancesConfig(
+            csv_file=parser.get("Manual Balances", "CSV_FILE", fallback="")
+        )
+
+    # Every option other than TTL_SECONDS is the TTL of a single source
+    source_names = [name.upper() for name in [*EXCHANGE_SECTIONS, *NETWORK_KEYS]]
+    source_ttl_options = {}
+    if parser.has_section("Balances Cache"):
+        for option in parser.options("Balances Cache"):
+            if option.upper() in source_names:
+                source_ttl_options[option.upper()] = _non_negative_float
+            elif option.upper() != "TTL_SECONDS":
+                logger.warning(f"[CONFIG] Unknown option {option} in [Balances Cache]")
+    source_ttl_seconds = _parse_options(
+        parser, "Balances Cache", source_ttl_options, errors
+    )
+    balances_cache = BalancesCacheConfig(
+        **_parse_options(
+            parser, "Balances Cache", {"TTL_SECONDS": _non_negative_float}, errors
+        ),
+        source_ttl_seconds={
+            name.upper(): ttl for name, ttl in source_ttl_seconds.items()
+        },
+    )
+
+    if errors:
+        for error in errors:
+            logger.error(f"[CONFIG] {error}")
+        logger.error(f"[CONFIG] Invalid configuration in {path}. Exiting.")
+        exit(1)
+
+    return CryptonaireConfig(
+        path=path,
+        coin_market_cap=coin_market_cap,
+        exchanges=exchanges,
+        networks=networks,
+        has_networks_section=parser.has_section("Networks"),
+        solana=solana,
+        manual_balances=manual_balances,
+        balances_cache=balances_cache,
+    )
+
+
+@lru_cache(maxsize=None)
+def load_config(path: str) -> CryptonaireConfig:
+    """Parses and validates a config file, applying the CRYPTONAIRE_* environment
+    overrides. The result is cached, so the file is only parsed once per path and
+    process.
+
+    Args:
+        path (str): Path of the config file
+
+    Returns:
+        CryptonaireConfig: Parsed configuration
+    """
+    parser = ConfigParser()
+    if not parser.read(path):
+        logger.warning(f"[CONFIG] Config file {path} not found")
+    _apply_env_overrides(parser)
+    config = _parse_config(parser, path)
+    logger.debug(f"[CONFIG] Configuration loaded from {path}")
+    return config
+
+
+def set_config_path(path: Optional[str]) -> None:
+    """Sets the config file used by get_config. If it's not set, the path is taken
+    from CRYPTONAIRE_CONFIG, or defaults to cryptonaire_reports.config in the current
+    directory.
+
+    Args:
+        path (Optional[str]): Path of the config file
+    """
+    global _config_path
+    _config_path = path
+
+
+def get_config() -> CryptonaireConfig:
+    """Returns the configuration of the current config file.
+
+    Returns:
+        CryptonaireConfig: Parsed configuration
+    """
+    return load_config(_config_path or os.environ.get(CONFIG_PATH_ENV, CONFIG_FILE))
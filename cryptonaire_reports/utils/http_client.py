@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import requests
+import structlog
+from requests.adapters import HTTPAdapter
+from cryptonaire_reports.utils.singleton import Singleton
+from cryptonaire_reports.utils.timings import span
+
+logger = structlog.get_logger()
+
+# Default (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 30)
+# Number of hosts whose connection pools are kept alive
+POOL_CONNECTIONS = 10
+# Maximum number of open connections per host. Requests wait for a free connection
+# instead of opening new ones
+POOL_MAXSIZE_PER_HOST = 8
+
+
+class HttpClient(metaclass=Singleton):
+
+    def __init__(self) -> None:
+        """HTTP client shared by all the exchanges and networks that don't have an SDK.
+        It keeps the connections alive between requests, limits the connections per
+        host, sets default timeouts and keeps track of latency, bytes and status codes
+        per host. The bytes are the ones of the decompressed responses."""
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=POOL_CONNECTIONS,
+            pool_maxsize=POOL_MAXSIZE_PER_HOST,
+            pool_block=True,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept-Encoding": "gzip, deflate"})
+        self._stats = self._new_stats()
+        self._stats_lock = threading.Lock()
+
+    @staticmethod
+    def _new_stats() -> Dict[str, Dict[str, float]]:
+        return defaultdict(
+            lambda: {"requests": 0, "errors": 0, "bytes": 0, "seconds": 0.0}
+        )
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Tuple[float, float] = DEFAULT_TIMEOUT,
+        **kwargs,
+    ) -> requests.Response:
+        """Sends a request using the pooled session and logs its metrics.
+
+        Args:
+            method (str): HTTP method
+            url (str): URL of the request
+            timeout (Tuple[float, float]): Connect and read timeouts in seconds.
+                Defaults to DEFAULT_TIMEOUT.
+            **kwargs: Any other argument accepted by requests.Session.request
+
+        Returns:
+            requests.Response: Response of the request
+        """
+        # The query is left out of the logs since it can contain keys or signatures
+        split_url = urlsplit(url)
+        host = split_url.netloc
+        with span(f"HTTP {host}", "http") as current_span:
+            current_span.args.update(method=method, path=split_url.path)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.RequestException:
+                self._record(host, time.perf_counter() - start, 0, error=True)
+                logger.debug(f"[HTTP] {method} {host}{split_url.path} failed")
+                raise
+            elapsed = time.perf_counter() - start
+            size = len(response.content)
+            self._record(host, elapsed, size, error=not response.ok)
+            current_span.bytes = size
+            current_span.failed = not response.ok
+            current_span.args["status"] = response.status_code
+        logger.debug(
+            f"[HTTP] {method} {host}{split_url.path} status={response.status_code} "
+            f"bytes={size} latency={elapsed:.3f}s"
+        )
+        return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def _record(self, host: str, elapsed: float, size: int, error: bool) -> None:
+        with self._stats_lock:
+            host_stats = self._stats[host]
+            host_stats["requests"] += 1
+            host_stats["errors"] += int(error)
+            host_stats["bytes"] += size
+            host_stats["seconds"] += elapsed
+
+    def log_stats(self) -> None:
+        """Logs the number of requests, errors, decompressed bytes and time spent per
+        host since the previous call, and resets them. The client is shared by every
+        report of the process, so each watch or serve cycle logs its own requests."""
+        with self._stats_lock:
+            stats, self._stats = self._stats, self._new_stats()
+        for host, host_stats in sorted(stats.items()):
+            logger.info(
+                f"[HTTP] {host}: {host_stats['requests']} requests, "
+                f"{host_stats['errors']} errors, {host_stats['bytes']} bytes "
+                f"decompressed, {host_stats['seconds']:.2f}s"
+            )
@@ -0,0 +1,116 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+CACHE_DIR = Path(".cryptonaire_cache")
+
+
+class JsonCache:
+
+    def __init__(self, name: str, ttl: Optional[float] = None) -> None:
+        """Persistent key-value store backed by a JSON file in CACHE_DIR. Every entry
+        keeps the timestamp of when it was stored, so entries older than the TTL are
+        treated as missing.
+
+        Args:
+            name (str): Name of the cache. It's used as the file name.
+            ttl (Optional[float]): Seconds an entry stays valid. If None, the entries
+                never expire. Defaults to None.
+        """
+        self.name = name
+        self.path = CACHE_DIR / f"{name}.json"
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as cache_file:
+                entries = json.load(cache_file)
+            logger.debug(f"[CACHE] Loaded {len(entries)} entries from {self.path}")
+            return entries
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"[CACHE] Unable to read {self.path}. Ignoring its content")
+            logger.debug(f"[CACHE] Full exception: {e}")
+            return {}
+
+    def is_expired(self, entry: Dict, ttl: Optional[float] = None) -> bool:
+        """Checks if an entry is older than the given TTL (or the cache TTL if it's
+        not provided).
+
+        Args:
+            entry (Dict): Entry returned by get_entry
+            ttl (Optional[float]): Seconds an entry stays valid. Defaults to the TTL
+                of the cache.
+
+        Returns:
+            bool: True if the entry is expired
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is None:
+            return False
+        return time.time() - entry["fetched_at"] > ttl
+
+    def get_entry(self, key: str) -> Optional[Dict]:
+        """Returns the raw entry for a key, regardless of its age.
+
+        Args:
+            key (str): Key to look for
+
+        Returns:
+            Optional[Dict]: Dictionary with the stored "value" and the "fetched_at"
+                timestamp, or None if the key is not in the cache.
+        """
+        with self._lock:
+            return self._entries.get(key)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the value stored for a key, only if it hasn't expired.
+
+        Args:
+            key (str): Key to look for
+
+        Returns:
+            Optional[Any]: Stored value, or None if it's missing or expired
+        """
+        entry = self.get_entry(key)
+        if entry is None or self.is_expired(entry):
+            return None
+        return entry["value"]
+
+    def set(self, key: str, value: Any, fetched_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = {
+                "value": value,
+                "fetched_at": time.time() if fetched_at is None else fetched_at,
+            }
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def save(self) -> None:
+        """Writes the cache to disk. The file is replaced atomically, so a run that
+        gets interrupted never leaves a half-written cache behind."""
+        try:
+            with self._lock:
+                content = json.dumps(self._entries)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(
+                f".{os.getpid()}.{threading.get_ident()}.tmp"
+            )
+            tmp_path.write_text(content, encoding="utf-8")
+            os.replace(tmp_path, self.path)
+            logger.debug(f"[CACHE] Saved {self.name} cache to {self.path}")
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"[CACHE] Unable to write {self.path}")
+            logger.debug(f"[CACHE] Full exception: {e}")
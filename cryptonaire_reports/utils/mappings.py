@@ -1,20 +1,92 @@
-from cryptonaire_reports.exchanges.binance import Binance
-from cryptonaire_reports.exchanges.bing_x import BingX
-from cryptonaire_reports.exchanges.bybit import ByBit
-from cryptonaire_reports.exchanges.coinbase import Coinbase
-from cryptonaire_reports.exchanges.gate import Gate
-from cryptonaire_reports.networks.ethereum import Ethereum
-from cryptonaire_reports.networks.solana import Solana
-
-EXCHANGE_MAP = {
-    Binance: ["binance"],
-    BingX: ["bing-x", "bingx", "bing_x"],
-    ByBit: ["bybit", "by-bit"],
-    Coinbase: ["coinbase", "coin_base"],
-    Gate: ["gate", "gate-io", "gate_io"],
-}
-
-NETWORKS_MAP = {
-    Ethereum: ["ethereum", "eth"],
-    Solana: ["sol", "solana"],
-}
+import importlib
+from typing import Dict, List, Type
+
+
+class SourceRegistry:
+
+    def __init__(self, sources: Dict[str, List[str]]) -> None:
+        """Maps the aliases of each exchange or network to the import path of its
+        class. The class (and its SDK) is only imported when the source is selected,
+        which keeps the CLI startup fast.
+
+        Args:
+            sources (Dict[str, List[str]]): Dictionary where the keys are the import
+                paths of the classes, with the format "module:ClassName", and the
+                values are the aliases of the source.
+        """
+        self._sources = sources
+        self._classes: Dict[str, Type] = {}
+
+    @property
+    def names(self) -> List[str]:
+        """Class names of all the sources, e.g. Binance"""
+        return [import_path.split(":")[1] for import_path in self._sources]
+
+    @property
+    def aliases(self) -> List[str]:
+        """All the aliases accepted for the sources in the registry"""
+        return [alias for aliases in self._sources.values() for alias in aliases]
+
+    def _import(self, import_path: str) -> Type:
+        if import_path not in self._classes:
+            module_name, class_name = import_path.split(":")
+            module = importlib.import_module(module_name)
+            self._classes[import_path] = getattr(module, class_name)
+        return self._classes[import_path]
+
+    def load(self, alias: str) -> Type:
+        """Imports and returns the class of the source with the given alias.
+
+        Args:
+            alias (str): Alias of the source, e.g. bing_x
+
+        Raises:
+            KeyError: If no source uses that alias
+
+        Returns:
+            Type: Class of the source
+        """
+        for import_path, aliases in self._sources.items():
+            if alias in aliases:
+                return self._import(import_path)
+        raise KeyError(alias)
+
+    def get_name(self, alias: str) -> str:
+        """Returns the class name of the source with the given alias, without
+        importing it.
+
+        Args:
+            alias (str): Alias of the source, e.g. bing_x
+
+        Raises:
+            KeyError: If no source uses that alias
+
+        Returns:
+            str: Class name of the source, e.g. BingX
+        """
+        for import_path, aliases in self._sources.items():
+            if alias in aliases:
+                return import_path.split(":")[1]
+        raise KeyError(alias)
+
+    def load_all(self) -> List[Type]:
+        """Imports and returns the classes of all the sources in the registry."""
+        return [self._import(import_path) for import_path in self._sources]
+
+
+EXCHANGE_REGISTRY = SourceRegistry(
+    {
+        "cryptonaire_reports.exchanges.binance:Binance": ["binance"],
+        "cryptonaire_reports.exchanges.bing_x:BingX": ["bing-x", "bingx", "bing_x"],
+        "cryptonaire_reports.exchanges.bybit:ByBit": ["bybit", "by-bit"],
+        "cryptonaire_reports.exchanges.coinbase:Coinbase": ["coinbase", "coin_base"],
+        "cryptonaire_reports.exchanges.gate:Gate": ["gate", "gate-io", "gate_io"],
+    }
+)
+
+NETWORK_REGISTRY = SourceRegistry(
+    {
+        "cryptonaire_reports.networks.ethereum:Ethereum": ["ethereum", "eth"],
+        "cryptonaire_reports.networks.solana:Solana": ["sol", "solana"],
+    }
+)
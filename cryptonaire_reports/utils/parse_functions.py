@@ -1,15 +1,18 @@
+import re
 from typing import Set
 
 import structlog
-from cryptonaire_reports.utils.mappings import EXCHANGE_MAP, NETWORKS_MAP
+from cryptonaire_reports.utils.mappings import EXCHANGE_REGISTRY, NETWORK_REGISTRY
 
 logger = structlog.get_logger()
 
+# Seconds of every unit accepted in durations, e.g. 30s, 5m or 1h
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
 
 def parse_exchanges(exchanges_input: str) -> Set[str]:
     exchange_set: Set = {x.lower() for x in exchanges_input.split(",")}
-    flat_list = ["all"]
-    [flat_list.extend(x) for x in EXCHANGE_MAP.values()]
+    flat_list = ["all", *EXCHANGE_REGISTRY.aliases]
     supported_exchanges_codes = set(flat_list)
     if not exchange_set <= supported_exchanges_codes:
         not_supported = []
@@ -18,7 +21,8 @@ def parse_exchanges(exchanges_input: str) -> Set[str]:
                 not_supported.append(exchange)
         logger.error(
             f"The following exchange codes are not supported: {','.join(not_supported)}.\n"
-            f"\t\t\t\tCurrently supported exchanges are {', '.join(EXCHANGE_MAP.values())}.\n"
+            f"\t\t\t\tCurrently supported exchanges are "
+            f"{', '.join(EXCHANGE_REGISTRY.names)}.\n"
             f"\t\t\t\tPlease use one of the following: {', '.join(flat_list)}."
         )
         exit(1)
@@ -28,8 +32,7 @@ def parse_exchanges(exchanges_input: str) -> Set[str]:
 
 def parse_networks(networks_input: str) -> Set[str]:
     network_set: Set = {x.lower() for x in networks_input.split(",")}
-    flat_list = ["all"]
-    [flat_list.extend(x) for x in NETWORKS_MAP.values()]
+    flat_list = ["all", *NETWORK_REGISTRY.aliases]
     supported_networks = set(flat_list)
     if not network_set <= supported_networks:
         not_supported = []
@@ -38,9 +41,63 @@ def parse_networks(networks_input: str) -> Set[str]:
                 not_supported.append(network)
         logger.error(
             f"The following networks are not supported: {','.join(not_supported)}.\n"
-            f"\t\t\t\tCurrently supported networks are {', '.join(NETWORKS_MAP)}.\n"
+            f"\t\t\t\tCurrently supported networks are "
+            f"{', '.join(NETWORK_REGISTRY.names)}.\n"
             f"\t\t\t\tPlease use one of the following: {', '.join(flat_list)}."
         )
         exit(1)
 
     return network_set
+
+
+def parse_refresh(refresh_input: str) -> Set[str]:
+    """Parses the exchanges and networks whose balances must be requested again even
+    if they're cached.
+
+    Args:
+        refresh_input (str): Comma separated list of exchange and network aliases, or
+            all
+
+    Returns:
+        Set[str]: Class names of the sources to refresh, e.g. Binance or Solana
+    """
+    refresh_set: Set = {x.strip().lower() for x in refresh_input.split(",")}
+    if "all" in refresh_set:
+        return {*EXCHANGE_REGISTRY.names, *NETWORK_REGISTRY.names}
+    source_names = set()
+    not_supported = []
+    for alias in refresh_set:
+        if alias in EXCHANGE_REGISTRY.aliases:
+            source_names.add(EXCHANGE_REGISTRY.get_name(alias))
+        elif alias in NETWORK_REGISTRY.aliases:
+            source_names.add(NETWORK_REGISTRY.get_name(alias))
+        else:
+            not_supported.append(alias)
+    if not_supported:
+        flat_list = ["all", *EXCHANGE_REGISTRY.aliases, *NETWORK_REGISTRY.aliases]
+        logger.error(
+            f"The following sources can't be refreshed: {','.join(not_supported)}.\n"
+            f"\t\t\t\tPlease use one of the following: {', '.join(flat_list)}."
+        )
+        exit(1)
+    return source_names
+
+
+def parse_duration(duration_input: str) -> float:
+    """Parses a duration like 90, 30s, 5m, 1.5h or 1d.
+
+    Args:
+        duration_input (str): Number followed by an optional unit (s, m, h or d).
+            Numbers without unit are seconds
+
+    Returns:
+        float: Duration in seconds
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", duration_input.lower())
+    if not match or float(match.group(1)) <= 0:
+        logger.error(
+            f"Invalid duration: {duration_input}.\n"
+            f"\t\t\t\tUse a positive number followed by s, m, h or d, e.g. 30s or 5m."
+        )
+        exit(1)
+    return float(match.group(1)) * DURATION_UNITS[match.group(2) or "s"]
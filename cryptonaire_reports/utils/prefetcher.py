@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class Prefetcher:
+
+    def __init__(self, fetch: Callable[[Set[str]], Dict[str, Any]], name: str) -> None:
+        """Fetches information about keys in the background while they're still being
+        discovered, e.g. the CoinMarketCap info of the symbols found by the sources
+        that already answered while the slow ones are still responding.
+        A single background worker takes all the keys added since its last fetch, so
+        the keys are naturally batched: one fetch runs while the next batch builds up.
+
+        Args:
+            fetch (Callable[[Set[str]], Dict[str, Any]]): Function that receives a set
+                of keys and returns a dictionary with the information of each key
+            name (str): Name used in the logs
+        """
+        self.name = name
+        self._fetch = fetch
+        self._pending: Set[str] = set()
+        self._requested: Set[str] = set()
+        self._results: Dict[str, Any] = {}
+        self._futures: List[Future] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=f"prefetch-{name.lower()}"
+        )
+
+    def add(self, keys: Iterable[str]) -> None:
+        """Schedules keys to be fetched. Keys that were already added are ignored.
+
+        Args:
+            keys (Iterable[str]): Keys to fetch
+        """
+        with self._lock:
+            new_keys = set(keys) - self._requested
+            if not new_keys:
+                return
+            self._requested |= new_keys
+            self._pending |= new_keys
+            self._futures.append(self._executor.submit(self._fetch_pending))
+
+    def _fetch_pending(self) -> None:
+        with self._lock:
+            keys, self._pending = self._pending, set()
+        # An earlier task already took these keys
+        if not keys:
+            return
+        logger.debug(f"[{self.name}] Prefetching {len(keys)} keys")
+        results = self._fetch(keys)
+        with self._lock:
+            self._results.update(results)
+
+    def result(self) -> Dict[str, Any]:
+        """Waits for all the scheduled fetches to finish.
+
+        Raises:
+            Exception: Any exception raised by the fetch function
+
+        Returns:
+            Dict[str, Any]: Information of all the keys added
+        """
+        self._executor.shutdown(wait=True)
+        for future in self._futures:
+            future.result()
+        return self._results
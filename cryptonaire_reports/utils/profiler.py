@@ -0,0 +1,246 @@
+import cProfile
+import json
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Formats in which the profile can be written
+PROFILE_FORMATS = ["pstats", "collapsed", "speedscope"]
+# Seconds between two samples of the stacks of every thread, used by the collapsed
+# and speedscope formats
+SAMPLE_INTERVAL_SECONDS = 0.005
+# Frames kept per allocation by tracemalloc. Only the innermost one is reported, and
+# every extra frame makes tracing slower
+MEMORY_TRACE_FRAMES = 1
+# Number of allocation sites shown in the memory summary
+TOP_ALLOCATION_SITES = 15
+# Files whose allocations are left out of the memory summary, e.g. the code of the
+# imported modules
+IGNORED_ALLOCATION_FILES = [
+    "<frozen importlib._bootstrap>",
+    "<frozen importlib._bootstrap_external>",
+    "<unknown>",
+]
+
+# Function, file and first line of a frame
+FrameKey = Tuple[str, str, int]
+
+
+def _format_file(filename: str) -> str:
+    # The package and module are enough to find the file, e.g. reports/portfolio.py
+    return "/".join(Path(filename).parts[-2:])
+
+
+class StackSampler:
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS) -> None:
+        """Samples the stack of every thread from a background thread. Threads that
+        are waiting, e.g. for an API to answer, are sampled as well, so the profile
+        shows where the wall time goes and not only the CPU time.
+
+        Args:
+            interval (float): Seconds between two samples. Defaults to
+                SAMPLE_INTERVAL_SECONDS.
+        """
+        self.interval = interval
+        # Map of (thread name, stack from the root frame): seconds
+        self.samples: Dict[Tuple[str, Tuple[FrameKey, ...]], float] = defaultdict(float)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="stack-sampler", daemon=True
+        )
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        last_sample = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            # Every sample stands for the time since the previous one, which can be
+            # longer than the interval when the process is busy
+            elapsed, last_sample = now - last_sample, now
+            thread_names = {
+                thread.ident: thread.name for thread in threading.enumerate()
+            }
+            for ident, frame in sys._current_frames().items():
+                if ident == self._thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        (code.co_qualname, code.co_filename, code.co_firstlineno)
+                    )
+                    frame = frame.f_back
+                thread_name = thread_names.get(ident, str(ident))
+                self.samples[(thread_name, tuple(reversed(stack)))] += elapsed
+
+    def write_collapsed(self, path: Path) -> None:
+        """Writes the samples as collapsed stacks, one line per stack with the
+        thread, the frames from the root and the microseconds spent in it. Can be
+        opened with https://www.speedscope.app or flamegraph.pl.
+
+        Args:
+            path (Path): Path of the file
+        """
+        lines = []
+        for (thread_name, stack), seconds in self.samples.items():
+            frames = [
+                f"{name} ({_format_file(filename)}:{line})"
+                for name, filename, line in stack
+            ]
+            lines.append(f"{';'.join([thread_name, *frames])} {round(seconds * 1e6)}")
+        Path(path).write_text("\n".join(sorted(lines)) + "\n")
+
+    def write_speedscope(self, path: Path) -> None:
+        """Writes the samples in the speedscope file format, with one profile per
+        thread. Can be opened with https://www.speedscope.app.
+
+        Args:
+            path (Path): Path of the JSON file
+        """
+        frame_indexes: Dict[FrameKey, int] = {}
+        profiles: Dict[str, Dict[str, List]] = defaultdict(
+            lambda: {"samples": [], "weights": []}
+        )
+        for (thread_name, stack), seconds in self.samples.items():
+            sample = [
+                frame_indexes.setdefault(frame, len(frame_indexes)) for frame in stack
+            ]
+            profiles[thread_name]["samples"].append(sample)
+            profiles[thread_name]["weights"].append(seconds)
+        speedscope = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": "crypto-report portfolio",
+            "exporter": "cryptonaire-reports",
+            "shared": {
+                "frames": [
+                    {"name": name, "file": filename, "line": line}
+                    for name, filename, line in frame_indexes
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": thread_name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(profile["weights"]),
+                    **profile,
+                }
+                for thread_name, profile in sorted(profiles.items())
+            ],
+        }
+        Path(path).write_text(json.dumps(speedscope))
+
+
+class Profiler:
+
+    def __init__(
+        self, output_format: Optional[str] = "pstats", trace_memory: bool = False
+    ) -> None:
+        """Profiles the code run between start and stop, in every thread. The pstats
+        format uses cProfile, which records every function call, and the collapsed
+        and speedscope formats sample the stacks of every thread instead.
+        Optionally, tracemalloc traces the memory allocations, which makes the run
+        noticeably slower.
+
+        Args:
+            output_format (Optional[str]): One of PROFILE_FORMATS, or None to only
+                trace the memory. Defaults to pstats.
+            trace_memory (bool): Whether to trace the memory allocations. Defaults to
+                False.
+        """
+        self.output_format = output_format
+        self.trace_memory = trace_memory
+        self._profile: Optional[cProfile.Profile] = None
+        self._sampler: Optional[StackSampler] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self._peak_memory = 0
+
+    def start(self) -> None:
+        if self.trace_memory:
+            tracemalloc.start(MEMORY_TRACE_FRAMES)
+        if self.output_format == "pstats":
+            self._profile = cProfile.Profile()
+            try:
+                # Since Python 3.12 it records the calls of every thread
+                self._profile.enable()
+            except ValueError as e:
+                logger.error(f"[PROFILE] Unable to start the profiler: {e}")
+                exit(1)
+        elif self.output_format is not None:
+            self._sampler = StackSampler()
+            self._sampler.start()
+
+    def stop(self) -> None:
+        if self._profile:
+            self._profile.disable()
+        if self._sampler:
+            self._sampler.stop()
+        if self.trace_memory and tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot().filter_traces(
+                [
+                    tracemalloc.Filter(False, filename)
+                    for filename in [
+                        *IGNORED_ALLOCATION_FILES,
+                        tracemalloc.__file__,
+                        # Stacks kept by the sampler
+                        __file__,
+                    ]
+                ]
+            )
+            self._peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def write(self, path: Path) -> None:
+        """Writes the profile in its format.
+
+        Args:
+            path (Path): Path of the file
+        """
+        if self._profile:
+            self._profile.dump_stats(path)
+        elif self._sampler and self.output_format == "collapsed":
+            self._sampler.write_collapsed(path)
+        elif self._sampler:
+            self._sampler.write_speedscope(path)
+        logger.info(f"[PROFILE] {self.output_format} profile written to {path}")
+
+    def format_allocations(self) -> str:
+        """Formats the peak of the traced memory and the sites that allocated most of
+        the memory still in use when the profiler stopped, e.g. caches and the report
+        dataframes.
+
+        Returns:
+            str: Table with one row per allocation site
+        """
+        if self._snapshot is None:
+            return "Memory allocations were not traced"
+        statistics = self._snapshot.statistics("lineno")
+        in_use = sum(statistic.size for statistic in statistics)
+        lines = [
+            f"Memory: {self._peak_memory / 1024**2:.1f} MB traced at the peak, "
+            f"{in_use / 1024**2:.1f} MB still in use at the end",
+            f"{'Allocation site':<60} {'Size (MB)':>10} {'Blocks':>9}",
+        ]
+        for statistic in statistics[:TOP_ALLOCATION_SITES]:
+            frame = statistic.traceback[0]
+            site = f"{_format_file(frame.filename)}:{frame.lineno}"
+            lines.append(
+                f"{site:<60} {statistic.size / 1024**2:>10.2f} {statistic.count:>9}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,84 @@
+import threading
+import time
+from typing import Optional
+
+import structlog
+from cryptonaire_reports.utils.timings import count
+
+logger = structlog.get_logger()
+
+
+class TokenBucket:
+
+    def __init__(
+        self, rate_per_minute: float, capacity: Optional[float] = None, name: str = ""
+    ) -> None:
+        """Thread-safe token bucket used to throttle the requests sent to an API
+        before they hit its rate limit. The bucket refills continuously at
+        rate_per_minute tokens per minute, and holds at most capacity tokens, which is
+        the maximum burst allowed.
+
+        Args:
+            rate_per_minute (float): Number of tokens added to the bucket per minute.
+                Usually the requests per minute allowed by the API plan.
+            capacity (Optional[float]): Maximum number of tokens stored in the bucket.
+                Defaults to rate_per_minute.
+            name (str): Name used in the logs. Defaults to "".
+        """
+        self.name = name
+        self.rate_per_second = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._last_refill
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate_per_second)
+        self._last_refill = now
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Takes tokens from the bucket, blocking until they are available.
+
+        Args:
+            tokens (float): Number of tokens needed by the request, e.g. the weight
+                of the endpoint. Defaults to 1.
+
+        Returns:
+            float: Seconds the caller was blocked
+        """
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= tokens:
+                    self._tokens -= tokens
+                    break
+                wait = max(
+                    self._paused_until - now,
+                    (tokens - self._tokens) / self.rate_per_second,
+                )
+            time.sleep(wait)
+            waited += wait
+        if waited:
+            count(f"{self.name} throttled seconds", waited)
+        if waited > 1:
+            logger.debug(f"[{self.name}] Request throttled for {waited:.2f}s")
+        return waited
+
+    def pause(self, seconds: float) -> None:
+        """Stops handing out tokens for the given number of seconds and empties the
+        bucket. Used when the API reports that the limit was reached anyway, e.g.
+        because other processes share the same API key.
+
+        Args:
+            seconds (float): Seconds until the API accepts requests again
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._last_refill = now
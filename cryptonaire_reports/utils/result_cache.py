@@ -0,0 +1,67 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Optional, Tuple
+
+import structlog
+
+logger = structlog.get_logger()
+
+
+class SingleFlightCache:
+
+    def __init__(self, load: Callable[[], Any], ttl: float, name: str) -> None:
+        """Keeps the result of an expensive function in memory for ttl seconds. When
+        the result is missing or expired, only the first caller runs the function,
+        and everybody asking for it meanwhile waits for that same result, so a burst
+        of requests triggers a single call.
+
+        Args:
+            load (Callable[[], Any]): Function that computes the result
+            ttl (float): Seconds the result is reused
+            name (str): Name used in the logs
+        """
+        self.name = name
+        self.ttl = ttl
+        self._load = load
+        self._lock = threading.Lock()
+        self._value: Optional[Any] = None
+        self._loaded_at = 0.0
+        self._in_flight: Optional[Future] = None
+
+    def get(self) -> Tuple[Any, float]:
+        """Returns the cached result, computing it first if it's missing or expired.
+
+        Raises:
+            Exception: Any exception raised by the load function. Callers that were
+                waiting for the same result receive it as well.
+
+        Returns:
+            Tuple[Any, float]: Result and time.time() when it was computed
+        """
+        with self._lock:
+            if self._value is not None and time.time() - self._loaded_at < self.ttl:
+                return self._value, self._loaded_at
+            future = self._in_flight
+            if future is None:
+                future = self._in_flight = Future()
+                leader = True
+            else:
+                leader = False
+        if not leader:
+            logger.debug(f"[{self.name}] Waiting for the result being computed")
+            return future.result()
+
+        try:
+            value = self._load()
+        except BaseException as e:
+            with self._lock:
+                self._in_flight = None
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._value = value
+            self._loaded_at = time.time()
+            self._in_flight = None
+        future.set_result((value, self._loaded_at))
+        return value, self._loaded_at
@@ -0,0 +1,112 @@
+import random
+import signal
+import threading
+import time
+from typing import Callable, Optional
+
+import structlog
+
+logger = structlog.get_logger()
+
+# Signals that stop the scheduler once the running cycle finishes
+STOP_SIGNALS = [signal.SIGTERM, signal.SIGINT]
+
+
+class PeriodicTask:
+
+    def __init__(
+        self,
+        task: Callable[[], None],
+        interval: float,
+        jitter: float = 0.0,
+        name: str = "WATCH",
+    ) -> None:
+        """Runs a task on a fixed schedule in the current process, so everything the
+        task keeps warm between runs (clients, connection pools, caches) is reused.
+        Every cycle starts interval +/- jitter seconds after the previous one started,
+        and the first one after a random delay of up to jitter seconds, so several
+        processes started at the same time don't hit the APIs at the same moment.
+
+        Args:
+            task (Callable[[], None]): Function called in every cycle
+            interval (float): Seconds between the start of two cycles
+            jitter (float): Maximum random deviation of every cycle, in seconds.
+                Defaults to 0.
+            name (str): Name used in the logs. Defaults to WATCH.
+        """
+        self.task = task
+        self.interval = interval
+        self.jitter = min(jitter, interval)
+        self.name = name
+        self._stop = threading.Event()
+
+    def stop(self, signum: Optional[int] = None, frame=None) -> None:
+        """Stops the scheduler. The running cycle, if any, is allowed to finish, so
+        reports are never left half written.
+
+        Args:
+            signum (Optional[int]): Signal received, when used as a signal handler
+            frame: Current stack frame, when used as a signal handler
+        """
+        if signum is not None:
+            logger.info(
+                f"[{self.name}] Received {signal.Signals(signum).name}. Stopping after "
+                f"the current cycle"
+            )
+        self._stop.set()
+
+    def run(self, max_cycles: Optional[int] = None) -> int:
+        """Runs the task until the process receives SIGTERM or SIGINT, or until
+        max_cycles cycles have run. Errors of a cycle are logged and don't stop the
+        following ones.
+
+        Args:
+            max_cycles (Optional[int]): Maximum number of cycles. Defaults to no limit.
+
+        Returns:
+            int: Number of cycles run
+        """
+        previous_handlers = {
+            signum: signal.signal(signum, self.stop) for signum in STOP_SIGNALS
+        }
+        cycles = 0
+        try:
+            self._stop.wait(random.uniform(0, self.jitter))
+            while not self._stop.is_set():
+                started_at = time.monotonic()
+                cycles += 1
+                logger.info(f"[{self.name}] Starting cycle {cycles}")
+                try:
+                    self.task()
+                except SystemExit:
+                    # Errors that end a single run (e.g. a CoinMarketCap rate limit)
+                    # exit the process, but the next cycle may succeed
+                    logger.error(f"[{self.name}] Cycle {cycles} was aborted")
+                except Exception as e:
+                    logger.error(f"[{self.name}] Cycle {cycles} failed")
+                    logger.debug(f"[{self.name}] Full exception: {e}")
+                elapsed = time.monotonic() - started_at
+                if self._stop.is_set() or (
+                    max_cycles is not None and cycles >= max_cycles
+                ):
+                    logger.info(
+                        f"[{self.name}] Cycle {cycles} finished in {elapsed:.2f}s"
+                    )
+                    break
+                delay = self.interval + random.uniform(-self.jitter, self.jitter)
+                wait = max(delay - elapsed, 0.0)
+                if not wait:
+                    logger.warning(
+                        f"[{self.name}] Cycle {cycles} took {elapsed:.2f}s, longer "
+                        f"than the interval. Starting the next one right away"
+                    )
+                logger.info(
+                    f"[{self.name}] Cycle {cycles} finished in {elapsed:.2f}s. Next "
+                    f"one in {wait:.0f}s"
+                )
+                self._stop.wait(wait)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        logger.info(f"[{self.name}] Stopped after {cycles} cycles")
+        return cycles
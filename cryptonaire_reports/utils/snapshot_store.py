@@ -0,0 +1,227 @@
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import structlog
+from cryptonaire_reports.utils.timings import timed
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = structlog.get_logger()
+
+# Local database where a snapshot of every portfolio report is appended
+DEFAULT_DB_PATH = Path("reports/portfolio/history.sqlite")
+# Format of the timestamps. Stored as text in UTC, so they sort chronologically and
+# the indexes can be used for range queries
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    taken_at TEXT NOT NULL,
+    total_value_usd REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS snapshots_taken_at ON snapshots (taken_at);
+
+CREATE TABLE IF NOT EXISTS balances (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    taken_at TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    balance REAL NOT NULL,
+    price_usd REAL,
+    total_value_usd REAL
+);
+CREATE INDEX IF NOT EXISTS balances_taken_at_symbol ON balances (taken_at, symbol);
+CREATE INDEX IF NOT EXISTS balances_symbol_taken_at ON balances (symbol, taken_at);
+
+CREATE TABLE IF NOT EXISTS source_balances (
+    snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+    taken_at TEXT NOT NULL,
+    source TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    balance REAL NOT NULL,
+    total_value_usd REAL
+);
+CREATE INDEX IF NOT EXISTS source_balances_taken_at_source
+    ON source_balances (taken_at, source);
+"""
+
+
+def format_timestamp(timestamp: datetime) -> str:
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.strftime(TIMESTAMP_FORMAT)
+
+
+class SnapshotStore:
+
+    def __init__(self, path: Path = DEFAULT_DB_PATH) -> None:
+        """Append-only store with a snapshot of every portfolio report, used to answer
+        time-series queries (total value, balance of a symbol or value per source over
+        time) without opening every report that was generated.
+
+        Args:
+            path (Path): Path of the SQLite database. Defaults to DEFAULT_DB_PATH.
+        """
+        self.path = Path(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.path)
+        # Readers don't block the writer, e.g. a history query during a report
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(SCHEMA)
+        return connection
+
+    @timed("stage")
+    def append(
+        self,
+        report_pdf: "pd.DataFrame",
+        source_balances_pdf: "pd.DataFrame",
+        taken_at: Optional[datetime] = None,
+    ) -> int:
+        """Appends a snapshot of a report.
+
+        Args:
+            report_pdf (pd.DataFrame): Pandas dataframe indexed by symbol with, at
+                least, the following columns: balance, price_usd, total_value_usd
+            source_balances_pdf (pd.DataFrame): Pandas dataframe with the following
+                columns: source, symbol, balance, total_value_usd
+            taken_at (Optional[datetime]): Time of the snapshot. Defaults to now.
+
+        Returns:
+            int: Id of the snapshot
+        """
+        taken_at = format_timestamp(taken_at or datetime.now(timezone.utc))
+        # SQLite stores NaN values (e.g. symbols without price) as NULL
+        balance_rows = [
+            (taken_at, symbol, *values)
+            for symbol, *values in report_pdf[
+                ["balance", "price_usd", "total_value_usd"]
+            ].itertuples(name=None)
+        ]
+        source_rows = [
+            (taken_at, *values)
+            for values in source_balances_pdf[
+                ["source", "symbol", "balance", "total_value_usd"]
+            ].itertuples(index=False, name=None)
+        ]
+        total_value_usd = float(report_pdf["total_value_usd"].sum())
+
+        with closing(self._connect()) as connection, connection:
+            snapshot_id = connection.execute(
+                "INSERT INTO snapshots (taken_at, total_value_usd) VALUES (?, ?)",
+                (taken_at, total_value_usd),
+            ).lastrowid
+            connection.executemany(
+                f"INSERT INTO balances (snapshot_id, taken_at, symbol, balance, "
+                f"price_usd, total_value_usd) VALUES ({snapshot_id}, ?, ?, ?, ?, ?)",
+                balance_rows,
+            )
+            connection.executemany(
+                f"INSERT INTO source_balances (snapshot_id, taken_at, source, symbol, "
+                f"balance, total_value_usd) VALUES ({snapshot_id}, ?, ?, ?, ?, ?)",
+                source_rows,
+            )
+        logger.info(
+            f"[HISTORY] Snapshot {snapshot_id} with {len(balance_rows)} symbols saved "
+            f"to {self.path}"
+        )
+        return snapshot_id
+
+    @staticmethod
+    def _filters(
+        since: Optional[datetime],
+        until: Optional[datetime],
+        symbols: Optional[List[str]] = None,
+    ) -> Tuple[str, List]:
+        conditions = []
+        params = []
+        if since:
+            conditions.append("taken_at >= ?")
+            params.append(format_timestamp(since))
+        if until:
+            conditions.append("taken_at <= ?")
+            params.append(format_timestamp(until))
+        if symbols:
+            conditions.append(f"symbol IN ({', '.join('?' * len(symbols))})")
+            params.extend(symbols)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return where, params
+
+    def _query(self, sql: str, params: List) -> "pd.DataFrame":
+        import pandas as pd
+
+        with closing(self._connect()) as connection:
+            return pd.read_sql_query(sql, connection, params=params)
+
+    def total_value(
+        self, since: Optional[datetime] = None, until: Optional[datetime] = None
+    ) -> "pd.DataFrame":
+        """Total value of the portfolio in every snapshot.
+
+        Args:
+            since (Optional[datetime]): Only include snapshots taken since this time
+            until (Optional[datetime]): Only include snapshots taken until this time
+
+        Returns:
+            pd.DataFrame: Pandas dataframe with the following columns: taken_at,
+                total_value_usd
+        """
+        where, params = self._filters(since, until)
+        return self._query(
+            f"SELECT taken_at, total_value_usd FROM snapshots {where} "
+            f"ORDER BY taken_at",
+            params,
+        )
+
+    def symbol_balances(
+        self,
+        symbols: List[str],
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> "pd.DataFrame":
+        """Balance, price and value of the given symbols in every snapshot.
+
+        Args:
+            symbols (List[str]): Symbols to look for
+            since (Optional[datetime]): Only include snapshots taken since this time
+            until (Optional[datetime]): Only include snapshots taken until this time
+
+        Returns:
+            pd.DataFrame: Pandas dataframe with the following columns: taken_at,
+                symbol, balance, price_usd, total_value_usd
+        """
+        where, params = self._filters(since, until, symbols)
+        return self._query(
+            f"SELECT taken_at, symbol, balance, price_usd, total_value_usd "
+            f"FROM balances {where} ORDER BY taken_at, symbol",
+            params,
+        )
+
+    def source_breakdown(
+        self,
+        symbols: Optional[List[str]] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> "pd.DataFrame":
+        """Value held in every source in every snapshot.
+
+        Args:
+            symbols (Optional[List[str]]): Only include these symbols. Defaults to all.
+            since (Optional[datetime]): Only include snapshots taken since this time
+            until (Optional[datetime]): Only include snapshots taken until this time
+
+        Returns:
+            pd.DataFrame: Pandas dataframe with the following columns: taken_at,
+                source, total_value_usd
+        """
+        where, params = self._filters(since, until, symbols)
+        return self._query(
+            f"SELECT taken_at, source, SUM(total_value_usd) AS total_value_usd "
+            f"FROM source_balances {where} "
+            f"GROUP BY snapshot_id, source ORDER BY taken_at, source",
+            params,
+        )
@@ -0,0 +1,259 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List
+
+from cryptonaire_reports.utils.singleton import Singleton
+
+# Categories of the spans, in the order they're shown in the summary
+SPAN_CATEGORIES = ["stage", "source", "sdk", "http", "coinmarketcap"]
+
+
+class Span:
+    """Span being measured. The args are added to its event in the trace, and the
+    bytes are also added up in the summary."""
+
+    __slots__ = ("args", "bytes", "failed")
+
+    def __init__(self) -> None:
+        self.args: Dict[str, Any] = {}
+        self.bytes = 0
+        self.failed = False
+
+
+class Timings(metaclass=Singleton):
+
+    def __init__(self) -> None:
+        """Collects how long the stages of a report, the sources and every API call
+        take, how many calls failed, and counters like retries. It's disabled by
+        default, so the spans only cost a flag check unless --timings is used.
+        Spans can be recorded from any thread."""
+        self.enabled = False
+        self.trace = False
+        self._lock = threading.Lock()
+        self.reset()
+
+    def enable(self, trace: bool = False) -> None:
+        """Starts recording spans, discarding the ones recorded so far.
+
+        Args:
+            trace (bool): Also keeps every single span, to write them with
+                write_trace. Defaults to False.
+        """
+        self.reset()
+        self.enabled = True
+        self.trace = trace
+
+    def reset(self) -> None:
+        with self._lock:
+            self._origin = time.perf_counter()
+            # Map of span name: category, calls, errors, seconds, max_seconds, bytes
+            self._stats: Dict[str, Dict[str, Any]] = {}
+            self._counters: Dict[str, float] = {}
+            self._events: List[Dict[str, Any]] = []
+            self._threads: Dict[int, str] = {}
+
+    @contextmanager
+    def span(self, name: str, category: str) -> Iterator[Span]:
+        """Measures the code within the context. Exceptions raised within it mark the
+        span as failed.
+
+        Args:
+            name (str): Name of the span, e.g. Binance.get_spot_balances
+            category (str): One of SPAN_CATEGORIES
+
+        Yields:
+            Span: Span where the bytes, the args or the failure can be set
+        """
+        span = Span()
+        if not self.enabled:
+            yield span
+            return
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.failed = True
+            raise
+        finally:
+            self._record(name, category, start, time.perf_counter(), span)
+
+    def _record(
+        self, name: str, category: str, start: float, end: float, span: Span
+    ) -> None:
+        elapsed = end - start
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = {
+                    "category": category,
+                    "calls": 0,
+                    "errors": 0,
+                    "seconds": 0.0,
+                    "max_seconds": 0.0,
+                    "bytes": 0,
+                }
+            stats["calls"] += 1
+            stats["errors"] += int(span.failed)
+            stats["seconds"] += elapsed
+            stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+            stats["bytes"] += span.bytes
+            if not self.trace:
+                return
+            thread = threading.current_thread()
+            self._threads[thread.ident] = thread.name
+            args = dict(span.args)
+            if span.bytes:
+                args["bytes"] = span.bytes
+            if span.failed:
+                args["failed"] = True
+            # Chrome trace event of a complete span, with times in microseconds
+            self._events.append(
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round((start - self._origin) * 1_000_000),
+                    "dur": round(elapsed * 1_000_000),
+                    "pid": os.getpid(),
+                    "tid": thread.ident,
+                    "args": args,
+                }
+            )
+
+    def count(self, name: str, value: float = 1) -> None:
+        """Adds a value to a counter, e.g. the number of retries.
+
+        Args:
+            name (str): Name of the counter
+            value (float): Value to add. Defaults to 1.
+        """
+        if not self.enabled or not value:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def summary(self) -> Dict[str, Any]:
+        """Aggregates the spans recorded since the timings were enabled.
+
+        Returns:
+            Dict[str, Any]: Dictionary with the seconds elapsed since the timings were
+                enabled (wall_seconds), the stats of every span sorted by category
+                and total time (spans), and the counters (counters)
+        """
+        with self._lock:
+            spans = [{"name": name, **stats} for name, stats in self._stats.items()]
+            counters = dict(sorted(self._counters.items()))
+            wall_seconds = time.perf_counter() - self._origin
+        spans.sort(
+            key=lambda span: (
+                SPAN_CATEGORIES.index(span["category"]),
+                -span["seconds"],
+            )
+        )
+        return {
+            "wall_seconds": round(wall_seconds, 6),
+            "spans": [
+                {
+                    **span,
+                    "seconds": round(span["seconds"], 6),
+                    "max_seconds": round(span["max_seconds"], 6),
+                }
+                for span in spans
+            ],
+            "counters": counters,
+        }
+
+    def format_summary(self) -> str:
+        """Formats the summary as a table. Spans that run in parallel (e.g. the
+        sources) overlap, so their times can add up to more than the wall time.
+
+        Returns:
+            str: Table with one row per span, followed by the counters
+        """
+        summary = self.summary()
+        name_width = max([len(span["name"]) for span in summary["spans"]] + [4])
+        lines = [
+            f"Timings: {summary['wall_seconds']:.2f}s in total",
+            f"{'Span':<{name_width}}  {'Category':<13} {'Calls':>6} {'Errors':>6} "
+            f"{'Total (s)':>9} {'Avg (ms)':>9} {'Max (ms)':>9} {'Bytes':>11}",
+        ]
+        for span in summary["spans"]:
+            average_ms = span["seconds"] / span["calls"] * 1000
+            lines.append(
+                f"{span['name']:<{name_width}}  {span['category']:<13} "
+                f"{span['calls']:>6} {span['errors']:>6} {span['seconds']:>9.2f} "
+                f"{average_ms:>9.1f} {span['max_seconds'] * 1000:>9.1f} "
+                f"{span['bytes'] or '':>11}"
+            )
+        for name, value in summary["counters"].items():
+            lines.append(f"{name}: {value:g}")
+        return "\n".join(lines)
+
+    def write_trace(self, path: Path) -> None:
+        """Writes every span in the Chrome trace event format, which can be opened
+        with https://ui.perfetto.dev or chrome://tracing. The summary is included as
+        well.
+
+        Args:
+            path (Path): Path of the JSON file
+        """
+        with self._lock:
+            events = list(self._events)
+            threads = dict(self._threads)
+        metadata = [
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": os.getpid(),
+                "tid": ident,
+                "args": {"name": name},
+            }
+            for ident, name in threads.items()
+        ]
+        trace = {
+            "traceEvents": metadata + events,
+            "displayTimeUnit": "ms",
+            "summary": self.summary(),
+        }
+        Path(path).write_text(json.dumps(trace))
+
+
+def span(name: str, category: str):
+    """Shortcut of Timings().span."""
+    return Timings().span(name, category)
+
+
+def count(name: str, value: float = 1) -> None:
+    """Shortcut of Timings().count."""
+    Timings().count(name, value)
+
+
+def timed(category: str) -> Callable:
+    """Decorator that measures every call of a function in a span named after its
+    qualified name, e.g. Binance.get_spot_balances. Sources catch their own errors and
+    return incomplete balances instead, which also marks the span as failed.
+
+    Args:
+        category (str): One of SPAN_CATEGORIES
+
+    Returns:
+        Callable: Decorator
+    """
+
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(function.__qualname__, category) as current_span:
+                result = function(*args, **kwargs)
+                if getattr(result, "complete", True) is False:
+                    current_span.failed = True
+                return result
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,153 @@
+"""Benchmarks the aggregation and enrichment of the portfolio report with synthetic
+balances, and compares them with the previous groupby().apply() implementation. The
+balances are streamed to the aggregator in small batches, like the accounts of the
+sources.
+
+Usage:
+    python scripts/bench_aggregation.py [--rows 100000] [--symbols 5000] [--runs 5]
+"""
+
+import argparse
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+from cryptonaire_reports.reports.portfolio import Portfolio
+from cryptonaire_reports.utils.balances import BalanceBatch
+from cryptonaire_reports.utils.balances import IncrementalAggregator
+
+SOURCES = ["BINANCE", "BYBIT", "COINBASE", "GATE", "ETHEREUM", "SOLANA", "Ledger"]
+# Number of balances per streamed batch
+BATCH_SIZE = 100
+
+
+def generate_balances(rows: int, symbols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    symbol_names = np.array([f"SYM{i}" for i in range(symbols)])
+    # A tenth of the balances come with backup prices, like the manual balances
+    has_backup = rng.random(rows) < 0.1
+    return pd.DataFrame(
+        {
+            "source": rng.choice(SOURCES, rows),
+            "symbol": rng.choice(symbol_names, rows),
+            "balance": rng.random(rows) * 100,
+            "price_backup": np.where(has_backup, rng.random(rows) * 10, 0.0),
+            "market_cap_backup": np.where(has_backup, rng.random(rows) * 1e6, 0.0),
+        }
+    )
+
+
+def generate_coin_info(symbols: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Only 80% of the symbols are found in CoinMarketCap
+    found = [f"SYM{i}" for i in range(symbols) if rng.random() < 0.8]
+    coin_info_pdf = pd.DataFrame(
+        {
+            "id": range(len(found)),
+            "name": found,
+            "rank": range(len(found)),
+            "price_usd": rng.random(len(found)) * 1000,
+            "max_supply": 1e9,
+            "circulating_supply": 1e8,
+            "total_supply": 1e9,
+            "market_cap": rng.random(len(found)) * 1e9,
+            "price_fetched_at": time.time(),
+        },
+        index=pd.Index(found, name="symbol"),
+    )
+    return coin_info_pdf
+
+
+def legacy_pipeline(
+    balances_pdf: pd.DataFrame, coin_info_pdf: pd.DataFrame
+) -> pd.DataFrame:
+    def combine_balances(row: pd.DataFrame) -> pd.Series:
+        result = {}
+        result["source"] = "|".join(set(row["source"]))
+        result["balance"] = row["balance"].sum()
+        result["price_backup"] = row["price_backup"].max()
+        result["market_cap_backup"] = row["market_cap_backup"].max()
+        return pd.Series(
+            result,
+            index=["source", "balance", "price_backup", "market_cap_backup"],
+        )
+
+    groupped_balances_pdf = balances_pdf.groupby(by=["symbol"]).apply(
+        combine_balances
+    )
+    report_pdf = groupped_balances_pdf.join(coin_info_pdf)
+    report_pdf["price_usd"] = (
+        report_pdf[["price_usd", "price_backup"]].bfill(axis=1).iloc[:, 0]
+    )
+    report_pdf["market_cap"] = (
+        report_pdf[["market_cap", "market_cap_backup"]].bfill(axis=1).iloc[:, 0]
+    )
+    report_pdf.drop(["price_backup", "market_cap_backup"], axis=1, inplace=True)
+    report_pdf["total_value_usd"] = report_pdf["balance"] * report_pdf["price_usd"]
+    report_pdf["portfolio_percentage"] = report_pdf[["total_value_usd"]].apply(
+        lambda x: x / x.sum()
+    )
+    return report_pdf
+
+
+def split_in_batches(balances_pdf: pd.DataFrame) -> List[BalanceBatch]:
+    records = list(balances_pdf.itertuples(index=False, name=None))
+    return [
+        BalanceBatch(records[i : i + BATCH_SIZE])
+        for i in range(0, len(records), BATCH_SIZE)
+    ]
+
+
+def streaming_pipeline(
+    batches: List[BalanceBatch], coin_info_pdf: pd.DataFrame
+) -> pd.DataFrame:
+    aggregator = IncrementalAggregator()
+    for batch in batches:
+        aggregator.add(batch)
+    return Portfolio.enrich_balances(aggregator.to_dataframe(), coin_info_pdf)
+
+
+def best_time(function: Callable, runs: int, *args) -> float:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--symbols", type=int, default=5_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--skip-legacy", action="store_true", help="Only time the current pipeline"
+    )
+    args = parser.parse_args(argv)
+
+    balances_pdf = generate_balances(args.rows, args.symbols)
+    coin_info_pdf = generate_coin_info(args.symbols)
+    print(f"{args.rows} balances across {args.symbols} symbols, best of {args.runs}")
+
+    batches = split_in_batches(balances_pdf)
+    streaming = best_time(streaming_pipeline, args.runs, batches, coin_info_pdf)
+    print(f"streaming: {streaming * 1000:.1f} ms")
+    if not args.skip_legacy:
+        legacy = best_time(legacy_pipeline, args.runs, balances_pdf, coin_info_pdf)
+        print(f"legacy:    {legacy * 1000:.1f} ms ({legacy / streaming:.1f}x slower)")
+
+        # Both pipelines must agree on the numbers
+        expected = legacy_pipeline(balances_pdf, coin_info_pdf)
+        result = streaming_pipeline(batches, coin_info_pdf)
+        columns = ["balance", "price_usd", "market_cap", "portfolio_percentage"]
+        pd.testing.assert_frame_equal(
+            result[columns], expected[columns], check_dtype=False
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
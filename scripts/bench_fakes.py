@@ -0,0 +1,648 @@
+"""Local stand-ins for every API used by the portfolio report, so it can be
+benchmarked offline. The APIs with an SDK (Binance, ByBit, Coinbase, Gate, Dex
+Screener and CoinMarketCap) are replaced by in-process stubs of their SDK clients,
+and the ones called through HttpClient (BingX, ethplorer and the Solana RPC) by local
+HTTP servers, one per API, so the real connection pools, timeouts and JSON parsing
+are exercised. Every fake has its own latency and error rate, and counts the calls
+it receives.
+
+The fakes serve a synthetic portfolio whose holdings are spread across all the
+accounts and wallets, with symbols shared between sources like a real portfolio.
+"""
+
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from coinmarketcapapi import CoinMarketCapAPIError
+
+# APIs that have a fake, used as keys of the latency, error rate and page size
+FAKE_APIS = [
+    "binance",
+    "bingx",
+    "bybit",
+    "coinbase",
+    "gate",
+    "ethplorer",
+    "solana_rpc",
+    "dexscreener",
+    "coinmarketcap",
+]
+# APIs faked with a local HTTP server instead of an SDK stub
+HTTP_APIS = ["bingx", "ethplorer", "solana_rpc"]
+# APIs whose page or batch size can be changed. The size is the one requested by the
+# client, since every fake answers pages of any size
+PAGED_APIS = ["binance", "solana_rpc", "dexscreener", "coinmarketcap"]
+# Accounts and wallets in which the holdings are spread evenly
+HOLDING_SLOTS = [
+    "binance_spot",
+    "binance_flexible",
+    "binance_locked",
+    "bingx",
+    "bybit",
+    "coinbase",
+    "gate_spot",
+    "gate_earn",
+    "ethereum",
+    "solana",
+]
+# Distinct symbols per holding, so the same symbol is held in several sources
+SYMBOL_REUSE = 0.8
+# Decimals of the Ethereum and Solana tokens
+TOKEN_DECIMALS = 8
+# CoinMarketCap ids of the native coins, which are always held
+NATIVE_COIN_IDS = {"ETH": 1027, "SOL": 5426}
+# Second of the minute reported by the injected CoinMarketCap rate limit errors. The
+# client waits until the next minute starts, so this keeps the wait around a second
+RATE_LIMIT_SECOND = 59.9
+
+
+class FakeApiError(Exception):
+    """Error injected by a fake SDK client."""
+
+
+@dataclass
+class FakeProfile:
+    """Behaviour of the fakes. Every dictionary is keyed by the names in FAKE_APIS,
+    and the APIs missing in latency and error_rate use the default value.
+
+    Attributes:
+        latency (Dict[str, float]): Seconds every call takes
+        error_rate (Dict[str, float]): Probability of every call failing
+        page_size (Dict[str, int]): Page or batch size requested by the client
+        default_latency (float): Latency of the APIs missing in latency
+        default_error_rate (float): Error rate of the APIs missing in error_rate
+    """
+
+    latency: Dict[str, float] = field(default_factory=dict)
+    error_rate: Dict[str, float] = field(default_factory=dict)
+    page_size: Dict[str, int] = field(default_factory=dict)
+    default_latency: float = 0.0
+    default_error_rate: float = 0.0
+
+    def get_latency(self, api: str) -> float:
+        return self.latency.get(api, self.default_latency)
+
+    def get_error_rate(self, api: str) -> float:
+        return self.error_rate.get(api, self.default_error_rate)
+
+
+class SyntheticPortfolio:
+
+    def __init__(
+        self,
+        holdings: int,
+        addresses: int = 3,
+        unknown_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """Generates the balances served by the fakes. The holdings are split evenly
+        between HOLDING_SLOTS, and every slot holds a random subset of the symbols.
+
+        Args:
+            holdings (int): Number of balances across all the sources, not counting
+                the ETH and SOL of every address
+            addresses (int): Number of Ethereum and of Solana addresses. Defaults to 3.
+            unknown_rate (float): Share of the symbols that CoinMarketCap doesn't
+                know about. Defaults to 0.
+            seed (int): Seed of the random generator. Defaults to 0.
+        """
+        rng = random.Random(seed)
+        self.holdings = holdings
+        self.symbols = [
+            f"TK{i:05d}" for i in range(max(1, round(holdings * SYMBOL_REUSE)))
+        ]
+        self.prices = {
+            symbol: round(rng.uniform(0.001, 1000), 6) for symbol in self.symbols
+        }
+        self.prices.update({"ETH": 3000.0, "SOL": 150.0})
+        self.coin_ids = {symbol: 10_000 + i for i, symbol in enumerate(self.symbols)}
+        self.coin_ids.update(NATIVE_COIN_IDS)
+        self.ranks = {
+            symbol: rank
+            for rank, symbol in enumerate([*NATIVE_COIN_IDS, *self.symbols], start=1)
+        }
+        self.symbols_by_id = {str(id): symbol for symbol, id in self.coin_ids.items()}
+        self.unknown_symbols = {
+            symbol for symbol in self.symbols if rng.random() < unknown_rate
+        }
+
+        # Map of slot: [(symbol, balance)]
+        self.slots: Dict[str, List[Tuple[str, float]]] = {}
+        for i, slot in enumerate(HOLDING_SLOTS):
+            size = holdings // len(HOLDING_SLOTS) + (i < holdings % len(HOLDING_SLOTS))
+            self.slots[slot] = [
+                (symbol, round(rng.uniform(0.01, 1000), 4))
+                for symbol in rng.sample(self.symbols, min(size, len(self.symbols)))
+            ]
+
+        # The tokens of the networks are spread across the addresses
+        self.ethereum_addresses = [f"0x{i:040x}" for i in range(1, addresses + 1)]
+        self.solana_addresses = [f"SoLAddress{i:034d}" for i in range(1, addresses + 1)]
+        self.ethereum_tokens = self._split(
+            self.slots["ethereum"], self.ethereum_addresses
+        )
+        self.solana_tokens = self._split(self.slots["solana"], self.solana_addresses)
+        # Solana balances are read by mint, which Dex Screener maps to its symbol
+        self.mint_symbols = {
+            self.get_mint(symbol): symbol for symbol, _ in self.slots["solana"]
+        }
+
+    @staticmethod
+    def _split(
+        tokens: List[Tuple[str, float]], addresses: List[str]
+    ) -> Dict[str, List[Tuple[str, float]]]:
+        return {
+            address: tokens[i :: len(addresses)] for i, address in enumerate(addresses)
+        }
+
+    @staticmethod
+    def get_mint(symbol: str) -> str:
+        return f"{symbol}Mint1111111111111111111111111111"
+
+    @staticmethod
+    def get_token_amount(balance: float) -> str:
+        return str(int(balance * 10**TOKEN_DECIMALS))
+
+
+class FakeApis:
+
+    def __init__(
+        self, portfolio: SyntheticPortfolio, profile: FakeProfile, seed: int = 0
+    ) -> None:
+        """State shared by all the fakes: the portfolio they serve, how they behave
+        and how many calls they received.
+
+        Args:
+            portfolio (SyntheticPortfolio): Balances served by the fakes
+            profile (FakeProfile): Latency, error rate and page size of every API
+            seed (int): Seed of the injected errors. Defaults to 0.
+        """
+        self.portfolio = portfolio
+        self.profile = profile
+        self._random = {api: random.Random(f"{seed}-{api}") for api in FAKE_APIS}
+        self._lock = threading.Lock()
+        self.calls: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.servers: Dict[str, ThreadingHTTPServer] = {}
+
+    def call(self, api: str, endpoint: str) -> bool:
+        """Records a call to an endpoint and waits for the latency of the API.
+
+        Args:
+            api (str): Name of the API, one of FAKE_APIS
+            endpoint (str): Name of the endpoint, only used in the call counts
+
+        Returns:
+            bool: True if the call must fail
+        """
+        with self._lock:
+            self.calls[api][endpoint] += 1
+            failed = self._random[api].random() < self.profile.get_error_rate(api)
+            if failed:
+                self.errors[api] += 1
+        time.sleep(self.profile.get_latency(api))
+        return failed
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+
+    def get_counts(self) -> Tuple[Dict[str, Dict[str, int]], Dict[str, int]]:
+        """Returns the calls received by every endpoint and the injected errors.
+
+        Returns:
+            Tuple[Dict[str, Dict[str, int]], Dict[str, int]]: Calls by API and
+                endpoint, and injected errors by API
+        """
+        with self._lock:
+            calls = {api: dict(endpoints) for api, endpoints in self.calls.items()}
+            return calls, dict(self.errors)
+
+    def start_servers(self) -> None:
+        """Starts the local HTTP servers of HTTP_APIS on free ports of localhost."""
+        for api in HTTP_APIS:
+            server = ThreadingHTTPServer(("127.0.0.1", 0), _FakeRequestHandler)
+            server.daemon_threads = True
+            server.api = api
+            server.fakes = self
+            threading.Thread(
+                target=server.serve_forever, name=f"fake-{api}", daemon=True
+            ).start()
+            self.servers[api] = server
+
+    def stop_servers(self) -> None:
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+        self.servers.clear()
+
+    def get_url(self, api: str) -> str:
+        host, port = self.servers[api].server_address[:2]
+        return f"http://{host}:{port}"
+
+    def install(self) -> None:
+        """Replaces the SDK clients and API URLs used by the sources with the fakes,
+        and sets the page sizes of the profile. It must be called after
+        start_servers and before the sources are created.
+        """
+        from cryptonaire_reports.exchanges import binance
+        from cryptonaire_reports.exchanges import bing_x
+        from cryptonaire_reports.exchanges import bybit
+        from cryptonaire_reports.exchanges import coinbase
+        from cryptonaire_reports.exchanges import gate
+        from cryptonaire_reports.networks import ethereum
+        from cryptonaire_reports.networks import solana
+        from cryptonaire_reports.utils import coin_market_cap
+
+        global _fakes
+        _fakes = self
+        binance.Spot = FakeBinanceSpot
+        binance.API = FakeBinanceApi
+        bybit.HTTP = FakeBybitHttp
+        coinbase.RESTClient = FakeCoinbaseClient
+        gate.Configuration = FakeGateConfiguration
+        gate.ApiClient = FakeGateApiClient
+        gate.SpotApi = FakeGateSpotApi
+        gate.EarnUniApi = FakeGateEarnUniApi
+        solana.DexscreenerClient = FakeDexscreenerClient
+        coin_market_cap.CoinMarketCapAPI = FakeCoinMarketCapApi
+        bing_x.API_URL = self.get_url("bingx")
+        ethereum.API_URL = self.get_url("ethplorer")
+
+        page_size = self.profile.page_size
+        if "binance" in page_size:
+            binance.EARN_PAGE_SIZE = page_size["binance"]
+        if "dexscreener" in page_size:
+            solana.DEX_BATCH_SIZE = page_size["dexscreener"]
+        if "coinmarketcap" in page_size:
+            coin_market_cap.QUOTES_BATCH_SIZE = page_size["coinmarketcap"]
+
+    def get_config(self) -> str:
+        """Builds a config file with keys for all the exchanges and the addresses of
+        the synthetic portfolio. The Solana RPC batch size is set in the config,
+        like a user would.
+
+        Returns:
+            str: Content of the config file
+        """
+        ethereum_addresses = "\n    ".join(self.portfolio.ethereum_addresses)
+        solana_addresses = "\n    ".join(self.portfolio.solana_addresses)
+        exchanges = "".join(
+            f"[{exchange}]\nAPI_KEY = bench\nSECRET_KEY = bench\n\n"
+            for exchange in ["Binance", "BingX", "ByBit", "Coinbase", "Gate"]
+        )
+        rpc_batch_size = self.profile.page_size.get("solana_rpc", 50)
+        return (
+            "[CoinMarketCap]\n"
+            "API_KEY = bench\n"
+            # The fake has no rate limit, so the client throttling is left out
+            "RATE_LIMIT_PER_MINUTE = 1000000\n\n"
+            f"{exchanges}"
+            "[Networks]\n"
+            f"ETHEREUM = {ethereum_addresses}\n"
+            f"SOLANA = {solana_addresses}\n\n"
+            "[Solana]\n"
+            f"RPC_URL = {self.get_url('solana_rpc')}\n"
+            f"RPC_BATCH_SIZE = {rpc_batch_size}\n"
+        )
+
+
+# Fakes used by the stubs, set by FakeApis.install
+_fakes: Optional[FakeApis] = None
+
+
+def _call_sdk(api: str, endpoint: str) -> SyntheticPortfolio:
+    if _fakes.call(api, endpoint):
+        raise FakeApiError(f"Injected {api} error in {endpoint}")
+    return _fakes.portfolio
+
+
+class FakeBinanceApi:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeBinanceSpot:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def account(self, **kwargs) -> Dict:
+        portfolio = _call_sdk("binance", "account")
+        return {
+            "balances": [
+                {"asset": symbol, "free": str(balance), "locked": "0"}
+                for symbol, balance in portfolio.slots["binance_spot"]
+            ]
+        }
+
+    @staticmethod
+    def _get_position_page(
+        endpoint: str, slot: str, amount_key: str, current: int, size: int
+    ) -> Dict:
+        positions = _call_sdk("binance", endpoint).slots[slot]
+        page = positions[(current - 1) * size : current * size]
+        return {
+            "rows": [
+                {"asset": symbol, amount_key: str(balance)} for symbol, balance in page
+            ],
+            "total": len(positions),
+        }
+
+    def get_flexible_product_position(
+        self, current: int = 1, size: int = 10, **kwargs
+    ) -> Dict:
+        return self._get_position_page(
+            "flexible_position", "binance_flexible", "totalAmount", current, size
+        )
+
+    def get_locked_product_position(
+        self, current: int = 1, size: int = 10, **kwargs
+    ) -> Dict:
+        return self._get_position_page(
+            "locked_position", "binance_locked", "amount", current, size
+        )
+
+
+class FakeBybitHttp:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def get_wallet_balance(self, **kwargs) -> Dict:
+        portfolio = _call_sdk("bybit", "wallet_balance")
+        coins = [
+            {"coin": symbol, "equity": str(balance)}
+            for symbol, balance in portfolio.slots["bybit"]
+        ]
+        return {"retCode": 0, "result": {"list": [{"coin": coins}]}}
+
+
+class FakeCoinbaseClient:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def get_accounts(self, **kwargs) -> Dict:
+        portfolio = _call_sdk("coinbase", "accounts")
+        return {
+            "accounts": [
+                {
+                    "available_balance": {"currency": symbol, "value": str(balance)},
+                    "hold": {"currency": symbol, "value": "0"},
+                }
+                for symbol, balance in portfolio.slots["coinbase"]
+            ]
+        }
+
+
+class FakeGateConfiguration:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeGateApiClient:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+
+class FakeGateSpotApi:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def list_spot_accounts(self, **kwargs) -> List[SimpleNamespace]:
+        portfolio = _call_sdk("gate", "spot_accounts")
+        return [
+            SimpleNamespace(currency=symbol, available=str(balance), locked="0")
+            for symbol, balance in portfolio.slots["gate_spot"]
+        ]
+
+
+class FakeGateEarnUniApi:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def list_user_uni_lends(self, **kwargs) -> List[SimpleNamespace]:
+        portfolio = _call_sdk("gate", "uni_lends")
+        return [
+            SimpleNamespace(currency=symbol, amount=str(balance))
+            for symbol, balance in portfolio.slots["gate_earn"]
+        ]
+
+
+class FakeDexscreenerClient:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    def get_token_pairs(self, address: str) -> List[SimpleNamespace]:
+        portfolio = _call_sdk("dexscreener", "token_pairs")
+        token_pairs = []
+        for mint in address.split(","):
+            symbol = portfolio.mint_symbols.get(mint)
+            if symbol is None:
+                continue
+            token_pairs.append(
+                SimpleNamespace(
+                    base_token=SimpleNamespace(address=mint, symbol=symbol),
+                    price_usd=portfolio.prices[symbol],
+                    fdv=portfolio.prices[symbol] * 1e9,
+                )
+            )
+        return token_pairs
+
+
+class FakeCoinMarketCapResponse:
+    """Same attributes as coinmarketcapapi.Response, without an HTTP response."""
+
+    def __init__(
+        self, data=None, error_code: int = 0, error_message: Optional[str] = None
+    ) -> None:
+        self.data = data
+        self.error_code = error_code
+        self.error_message = error_message
+        self.timestamp = datetime.now(timezone.utc).isoformat()
+
+    def __repr__(self) -> str:
+        return f"FakeCoinMarketCapResponse({self.error_code}, {self.error_message})"
+
+
+class FakeCoinMarketCapApi:
+
+    def __init__(self, *args, **kwargs) -> None:
+        pass
+
+    @staticmethod
+    def _call(endpoint: str) -> SyntheticPortfolio:
+        if _fakes.call("coinmarketcap", endpoint):
+            # Transient errors of CoinMarketCap are rate limits, which the client
+            # retries once the minute of the timestamp is over
+            error = FakeCoinMarketCapResponse(error_code=429, error_message="Injected")
+            error.timestamp = (
+                datetime.now(timezone.utc)
+                .replace(second=int(RATE_LIMIT_SECOND))
+                .replace(microsecond=int(RATE_LIMIT_SECOND % 1 * 1_000_000))
+                .isoformat()
+            )
+            raise CoinMarketCapAPIError(error)
+        return _fakes.portfolio
+
+    def cryptocurrency_map(self, symbol: str, **kwargs) -> FakeCoinMarketCapResponse:
+        portfolio = self._call("cryptocurrency_map")
+        symbols = symbol.split(",")
+        unknown = [
+            symbol
+            for symbol in symbols
+            if symbol not in portfolio.coin_ids or symbol in portfolio.unknown_symbols
+        ]
+        if unknown:
+            raise CoinMarketCapAPIError(
+                FakeCoinMarketCapResponse(
+                    error_code=400,
+                    error_message=f'Invalid value for "symbol": "{",".join(unknown)}"',
+                )
+            )
+        return FakeCoinMarketCapResponse(
+            data=[
+                {
+                    "id": portfolio.coin_ids[symbol],
+                    "name": f"{symbol} Token",
+                    "symbol": symbol,
+                    "rank": portfolio.ranks[symbol],
+                }
+                for symbol in symbols
+            ]
+        )
+
+    def cryptocurrency_quotes_latest(
+        self, id: str, **kwargs
+    ) -> FakeCoinMarketCapResponse:
+        portfolio = self._call("quotes_latest")
+        data = {}
+        for coin_id in id.split(","):
+            symbol = portfolio.symbols_by_id.get(coin_id)
+            if symbol is None:
+                continue
+            price = portfolio.prices[symbol]
+            data[coin_id] = {
+                "max_supply": 21_000_000,
+                "circulating_supply": 19_000_000,
+                "total_supply": 21_000_000,
+                "quote": {"USD": {"price": price, "market_cap": price * 19_000_000}},
+            }
+        return FakeCoinMarketCapResponse(data=data)
+
+
+class _FakeRequestHandler(BaseHTTPRequestHandler):
+    # Keep the connections alive, like the real APIs
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        self._handle()
+
+    def _handle(self) -> None:
+        api = self.server.api
+        fakes: FakeApis = self.server.fakes
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        path = urlsplit(self.path).path
+        endpoints = {
+            "bingx": path,
+            "ethplorer": path.rsplit("/", 2)[-2],
+            "solana_rpc": "batch",
+        }
+        if fakes.call(api, endpoints[api]):
+            self._send(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Injected error"})
+            return
+        portfolio = fakes.portfolio
+        if api == "bingx":
+            self._send(HTTPStatus.OK, self._get_bingx_balances(portfolio))
+        elif api == "ethplorer":
+            address = path.rsplit("/", 1)[-1]
+            self._send(HTTPStatus.OK, self._get_address_info(portfolio, address))
+        else:
+            self._send(
+                HTTPStatus.OK, [self._call_rpc(portfolio, call) for call in body]
+            )
+
+    def _send(self, status: HTTPStatus, body) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    @staticmethod
+    def _get_bingx_balances(portfolio: SyntheticPortfolio) -> Dict:
+        balances = [
+            {"asset": symbol, "free": str(balance), "locked": "0"}
+            for symbol, balance in portfolio.slots["bingx"]
+        ]
+        return {"code": 0, "msg": "", "data": {"balances": balances}}
+
+    @staticmethod
+    def _get_address_info(portfolio: SyntheticPortfolio, address: str) -> Dict:
+        tokens = [
+            {
+                "tokenInfo": {"symbol": symbol, "decimals": str(TOKEN_DECIMALS)},
+                "balance": portfolio.get_token_amount(balance),
+            }
+            for symbol, balance in portfolio.ethereum_tokens.get(address, [])
+        ]
+        return {"address": address, "ETH": {"balance": 1.5}, "tokens": tokens}
+
+    @staticmethod
+    def _call_rpc(portfolio: SyntheticPortfolio, call: Dict) -> Dict:
+        address = call["params"][0]
+        if address not in portfolio.solana_tokens:
+            error = {"code": -32602, "message": f"Invalid param: {address}"}
+            return {"jsonrpc": "2.0", "id": call["id"], "error": error}
+        if call["method"] == "getBalance":
+            value = 2_500_000_000
+        else:
+            value = [
+                {
+                    "account": {
+                        "data": {
+                            "parsed": {
+                                "info": {
+                                    "mint": portfolio.get_mint(symbol),
+                                    "tokenAmount": {
+                                        "amount": portfolio.get_token_amount(balance),
+                                        "decimals": TOKEN_DECIMALS,
+                                    },
+                                }
+                            }
+                        }
+                    }
+                }
+                for symbol, balance in portfolio.solana_tokens[address]
+            ]
+        return {
+            "jsonrpc": "2.0",
+            "id": call["id"],
+            "result": {"context": {"slot": 1}, "value": value},
+        }
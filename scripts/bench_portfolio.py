@@ -0,0 +1,526 @@
+"""Benchmarks Portfolio.report() end to end against local stand-ins of every exchange,
+network and market data API (see bench_fakes.py), with synthetic portfolios of
+different sizes. Every size runs in a fresh interpreter and an empty working
+directory, so the local caches start cold and the peak memory of one size doesn't
+leak into the next one.
+
+For every size it measures the wall time of report(), the time spent in every stage
+and source, the calls received by every API and the peak memory of the process, and
+stores the summary of the built-in timings of the report (see --timings). The
+results are appended to a JSON lines file and compared with the last run that used
+the same parameters, so regressions are visible between commits.
+
+Usage:
+    python scripts/bench_portfolio.py [--holdings 10 100 1000 10000]
+        [--latency 0.02] [--latency binance=0.2] [--error-rate solana_rpc=0.1]
+        [--page-size binance=50] [--format xlsx] [--cycles 1]
+        [--results benchmarks/portfolio.jsonl] [--max-regression 0.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from bench_fakes import FAKE_APIS
+from bench_fakes import PAGED_APIS
+from bench_fakes import FakeApis
+from bench_fakes import FakeProfile
+from bench_fakes import SyntheticPortfolio
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_HOLDINGS = [10, 100, 1_000, 10_000]
+# Results of every run, used as the baselines of the next ones. The benchmarks
+# directory is ignored by git, so the local results are never committed
+DEFAULT_RESULTS = REPO_DIR / "benchmarks" / "portfolio.jsonl"
+# Default latency of every fake API, in seconds
+DEFAULT_LATENCY = 0.02
+# Default share of the symbols that CoinMarketCap doesn't know about. Every unknown
+# symbol costs a few cryptocurrency map calls, since the batch is split to find it
+DEFAULT_UNKNOWN_RATE = 0.001
+# Relative increase of the wall time or peak memory reported as a regression
+DEFAULT_MAX_REGRESSION = 0.2
+# Output formats of the report, plus none to only build the snapshot
+FORMATS = ["xlsx", "csv", "parquet", "arrow", "none"]
+
+
+def parse_api_values(
+    values: List[str], cast: Callable, apis: List[str], option: str
+) -> Dict[str, float]:
+    """Parses the values of an option that is either a single value for every API,
+    or api=value for a single API.
+
+    Args:
+        values (List[str]): Values of the option, e.g. ["0.02", "binance=0.2"]
+        cast (Callable): Type of the values
+        apis (List[str]): APIs accepted by the option
+        option (str): Name of the option, only used in the errors
+
+    Returns:
+        Dict[str, float]: Dictionary where the keys are the APIs, or "default" for
+            the value of every API, and the values the parsed values
+    """
+    parsed = {}
+    for value in values:
+        api, _, number = value.rpartition("=")
+        if api and api not in apis:
+            raise argparse.ArgumentTypeError(
+                f"{option}: unknown API {api}. Use one of {', '.join(apis)}"
+            )
+        try:
+            parsed[api or "default"] = cast(number)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"{option}: invalid value {value}")
+    return parsed
+
+
+def get_peak_memory_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class StageTimer:
+
+    def __init__(self) -> None:
+        """Accumulates the time spent in the stages of the report, by wrapping the
+        methods that implement them. Stages that run in several threads at the same
+        time (sources, CoinMarketCap) add up the time of every thread."""
+        self.seconds: Dict[str, float] = defaultdict(float)
+        self.results: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def wrap(
+        self,
+        owner: type,
+        attribute: str,
+        stage: Callable[..., str],
+        static: bool = False,
+    ) -> None:
+        """Replaces a method so every call adds its time to a stage.
+
+        Args:
+            owner (type): Class of the method
+            attribute (str): Name of the method
+            stage (Callable[..., str]): Function that receives the arguments of the
+                call and returns the name of the stage
+            static (bool): Whether the method is a staticmethod. Defaults to False.
+        """
+        method = getattr(owner, attribute)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self.seconds[stage(*args, **kwargs)] += elapsed
+            self.results[attribute] = result
+            return result
+
+        setattr(owner, attribute, staticmethod(timed) if static else timed)
+
+    def reset(self) -> Dict[str, float]:
+        with self._lock:
+            seconds = {stage: round(value, 4) for stage, value in self.seconds.items()}
+            self.seconds.clear()
+        return seconds
+
+
+def install_stage_timer() -> StageTimer:
+    from cryptonaire_reports.reports.portfolio import Portfolio
+    from cryptonaire_reports.utils.snapshot_store import SnapshotStore
+
+    timer = StageTimer()
+    timer.wrap(Portfolio, "collect_balances", lambda *args, **kwargs: "collect")
+    timer.wrap(
+        Portfolio,
+        "_stream_source",
+        lambda self, source, *args, **kwargs: f"source.{source.name.lower()}",
+    )
+    timer.wrap(
+        Portfolio, "extract_additional_coin_info", lambda *args, **kwargs: "coin_info"
+    )
+    timer.wrap(
+        Portfolio, "enrich_balances", lambda *args, **kwargs: "enrich", static=True
+    )
+    timer.wrap(SnapshotStore, "append", lambda *args, **kwargs: "history")
+    for writer in [
+        "write_excel_report",
+        "write_csv_report",
+        "write_parquet_report",
+        "write_arrow_report",
+    ]:
+        timer.wrap(Portfolio, writer, lambda *args, **kwargs: "write")
+    return timer
+
+
+def run_worker(params: Dict) -> Dict:
+    """Runs the report against the fakes in the current process and working
+    directory.
+
+    Args:
+        params (Dict): Parameters of the benchmark (see build_params)
+
+    Returns:
+        Dict: Metrics of every cycle, and the peak memory of the process
+    """
+    from cryptonaire_reports.reports.portfolio import Portfolio
+    from cryptonaire_reports.utils.config import set_config_path
+    from cryptonaire_reports.utils.logger import LoggerConfig
+    from cryptonaire_reports.utils.parse_functions import parse_refresh
+    from cryptonaire_reports.utils.timings import Timings
+
+    LoggerConfig(params["log_level"])
+    profile = FakeProfile(
+        latency={k: v for k, v in params["latency"].items() if k != "default"},
+        error_rate={k: v for k, v in params["error_rate"].items() if k != "default"},
+        page_size=params["page_size"],
+        default_latency=params["latency"].get("default", DEFAULT_LATENCY),
+        default_error_rate=params["error_rate"].get("default", 0.0),
+    )
+    portfolio_data = SyntheticPortfolio(
+        holdings=params["holdings"],
+        addresses=params["addresses"],
+        unknown_rate=params["unknown_rate"],
+        seed=params["seed"],
+    )
+    fakes = FakeApis(portfolio_data, profile, seed=params["seed"])
+    fakes.start_servers()
+    fakes.install()
+    Path("cryptonaire_reports.config").write_text(fakes.get_config())
+    set_config_path("cryptonaire_reports.config")
+    timer = install_stage_timer()
+    # The built-in spans add the API calls, retries and bytes to the stages
+    Timings().enable()
+
+    baseline_memory = get_peak_memory_mb()
+    cycles = []
+    try:
+        start = time.perf_counter()
+        portfolio = Portfolio(
+            exchanges=["all"],
+            networks=["all"],
+            output_format=None if params["format"] == "none" else params["format"],
+            # Every cycle reads the sources again, like the watch command
+            refresh_sources=parse_refresh("all"),
+        )
+        init_seconds = time.perf_counter() - start
+        for cycle in range(params["cycles"]):
+            fakes.reset_counts()
+            Timings().reset()
+            start = time.perf_counter()
+            portfolio.report()
+            wall_seconds = time.perf_counter() - start
+            calls, errors = fakes.get_counts()
+            report_pdf = timer.results["enrich_balances"]
+            aggregator = timer.results["collect_balances"][0]
+            cycles.append(
+                {
+                    "wall_seconds": round(wall_seconds, 4),
+                    "stages": timer.reset(),
+                    "calls": calls,
+                    "total_calls": sum(sum(c.values()) for c in calls.values()),
+                    "injected_errors": errors,
+                    "balances": aggregator.rows,
+                    "symbols": len(report_pdf),
+                    "priced_symbols": int((report_pdf["price_usd"] > 0).sum()),
+                    "timings": Timings().summary(),
+                }
+            )
+    finally:
+        fakes.stop_servers()
+    return {
+        "init_seconds": round(init_seconds, 4),
+        "cycles": cycles,
+        "baseline_memory_mb": round(baseline_memory, 1),
+        "peak_memory_mb": round(get_peak_memory_mb(), 1),
+    }
+
+
+def run_size(params: Dict) -> Dict:
+    """Runs the benchmark of one size in a fresh interpreter and an empty working
+    directory.
+
+    Args:
+        params (Dict): Parameters of the benchmark (see build_params)
+
+    Returns:
+        Dict: Metrics returned by run_worker, or the error of the worker
+    """
+    with tempfile.TemporaryDirectory(prefix="cryptonaire-bench-") as workdir:
+        env = dict(os.environ)
+        # The fakes are imported from this folder and the package from the repo
+        paths = [str(Path(__file__).resolve().parent), str(REPO_DIR)]
+        if env.get("PYTHONPATH"):
+            paths.append(env["PYTHONPATH"])
+        env["PYTHONPATH"] = os.pathsep.join(paths)
+        # Config values set in the environment would override the fakes
+        env = {k: v for k, v in env.items() if not k.startswith("CRYPTONAIRE_")}
+        result = subprocess.run(
+            [
+                sys.executable,
+                str(Path(__file__).resolve()),
+                "--worker",
+                json.dumps(params),
+            ],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if result.returncode != 0:
+        return {"error": (result.stderr or result.stdout).strip()[-2000:]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def get_commit() -> Dict[str, object]:
+    def git(*args: str) -> str:
+        return subprocess.run(
+            ["git", *args], cwd=REPO_DIR, capture_output=True, text=True
+        ).stdout.strip()
+
+    return {
+        "commit": git("rev-parse", "--short", "HEAD") or None,
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+    }
+
+
+def load_baselines(path: Path) -> Dict[str, Dict]:
+    """Loads the last result of every set of parameters.
+
+    Args:
+        path (Path): JSON lines file with the results
+
+    Returns:
+        Dict[str, Dict]: Dictionary where the keys are the parameters serialized
+            as JSON and the values the last result with those parameters
+    """
+    baselines = {}
+    if not path.exists():
+        return baselines
+    for line in path.read_text().splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        if "error" not in result:
+            baselines[json.dumps(result["params"], sort_keys=True)] = result
+    return baselines
+
+
+def format_change(value: float, baseline: Optional[float]) -> str:
+    if not baseline:
+        return ""
+    return f" ({(value - baseline) / baseline:+.0%})"
+
+
+def print_result(result: Dict, baseline: Optional[Dict], max_regression: float) -> bool:
+    """Prints the metrics of one size next to the baseline.
+
+    Args:
+        result (Dict): Result of the size
+        baseline (Optional[Dict]): Last result with the same parameters
+        max_regression (float): Relative increase reported as a regression
+
+    Returns:
+        bool: True if the wall time or the peak memory regressed
+    """
+    holdings = result["params"]["holdings"]
+    if "error" in result:
+        print(f"{holdings:>7} holdings: failed\n{result['error']}")
+        return False
+
+    regressions = []
+    for cycle_number, cycle in enumerate(result["cycles"]):
+        base_cycle = None
+        if baseline and cycle_number < len(baseline["cycles"]):
+            base_cycle = baseline["cycles"][cycle_number]
+        base_wall = base_cycle["wall_seconds"] if base_cycle else None
+        base_calls = base_cycle["total_calls"] if base_cycle else None
+        if base_wall and cycle["wall_seconds"] > base_wall * (1 + max_regression):
+            regressions.append(f"wall time of cycle {cycle_number + 1}")
+        print(
+            f"{holdings:>7} holdings, cycle {cycle_number + 1}: "
+            f"{cycle['wall_seconds']:.2f}s"
+            f"{format_change(cycle['wall_seconds'], base_wall)}, "
+            f"{cycle['total_calls']} calls"
+            f"{format_change(cycle['total_calls'], base_calls)}, "
+            f"{cycle['symbols']} symbols ({cycle['priced_symbols']} priced)"
+        )
+        stages = ", ".join(
+            f"{stage} {seconds:.2f}s" for stage, seconds in cycle["stages"].items()
+        )
+        print(f"{'':>9}stages: {stages}")
+        calls = ", ".join(
+            f"{api} {sum(endpoints.values())}"
+            for api, endpoints in sorted(cycle["calls"].items())
+        )
+        print(f"{'':>9}calls: {calls}")
+        if cycle["injected_errors"]:
+            errors = ", ".join(
+                f"{api} {count}"
+                for api, count in sorted(cycle["injected_errors"].items())
+            )
+            print(f"{'':>9}injected errors: {errors}")
+
+    base_memory = baseline["peak_memory_mb"] if baseline else None
+    if base_memory and result["peak_memory_mb"] > base_memory * (1 + max_regression):
+        regressions.append("peak memory")
+    print(
+        f"{'':>9}peak memory: {result['peak_memory_mb']:.0f} MB"
+        f"{format_change(result['peak_memory_mb'], base_memory)} "
+        f"({result['baseline_memory_mb']:.0f} MB before the report)"
+    )
+    if baseline:
+        print(f"{'':>9}compared with {baseline['commit']} ({baseline['timestamp']})")
+    if regressions:
+        print(f"{'':>9}REGRESSION: {', '.join(regressions)}")
+    return bool(regressions)
+
+
+def build_params(args: argparse.Namespace, holdings: int) -> Dict:
+    return {
+        "holdings": holdings,
+        "addresses": args.addresses,
+        "unknown_rate": args.unknown_rate,
+        "latency": args.latency,
+        "error_rate": args.error_rate,
+        "page_size": args.page_size,
+        "format": args.format,
+        "cycles": args.cycles,
+        "seed": args.seed,
+        "log_level": args.log_level,
+    }
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--holdings", type=int, nargs="+", default=DEFAULT_HOLDINGS, metavar="N"
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="[API=]SECONDS",
+        help=f"Latency of every call, for all the APIs or one of them. Defaults to "
+        f"{DEFAULT_LATENCY}s. APIs: {', '.join(FAKE_APIS)}",
+    )
+    parser.add_argument(
+        "--error-rate",
+        action="append",
+        default=[],
+        metavar="[API=]RATE",
+        help="Probability of a call failing, for all the APIs or one of them. "
+        "Defaults to 0",
+    )
+    parser.add_argument(
+        "--page-size",
+        action="append",
+        default=[],
+        metavar="API=SIZE",
+        help=f"Page or batch size requested by the client. APIs: "
+        f"{', '.join(PAGED_APIS)}",
+    )
+    parser.add_argument(
+        "--unknown-rate",
+        type=float,
+        default=DEFAULT_UNKNOWN_RATE,
+        help="Share of the symbols that CoinMarketCap doesn't know about",
+    )
+    parser.add_argument(
+        "--addresses",
+        type=int,
+        default=3,
+        help="Number of Ethereum and of Solana addresses",
+    )
+    parser.add_argument("--format", choices=FORMATS, default="xlsx")
+    parser.add_argument(
+        "--cycles",
+        type=int,
+        default=1,
+        help="Reports generated by the same process. The first one starts with cold "
+        "caches and clients",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--log-level", choices=["debug", "info", "warning", "error"], default="error"
+    )
+    parser.add_argument("--results", type=Path, default=DEFAULT_RESULTS)
+    parser.add_argument(
+        "--no-save", action="store_true", help="Don't append the results"
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=DEFAULT_MAX_REGRESSION,
+        help="Relative increase of the wall time or peak memory reported as a "
+        "regression",
+    )
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Exit with an error if any size regressed",
+    )
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return 0
+
+    try:
+        args.latency = parse_api_values(args.latency, float, FAKE_APIS, "--latency")
+        args.error_rate = parse_api_values(
+            args.error_rate, float, FAKE_APIS, "--error-rate"
+        )
+        args.page_size = parse_api_values(
+            args.page_size, int, PAGED_APIS, "--page-size"
+        )
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if "default" in args.page_size:
+        parser.error("--page-size: use API=SIZE")
+
+    baselines = load_baselines(args.results)
+    environment = {
+        **get_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+    regressed = False
+    for holdings in args.holdings:
+        params = build_params(args, holdings)
+        result = {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            **environment,
+            "params": params,
+            **run_size(params),
+        }
+        baseline = baselines.get(json.dumps(params, sort_keys=True))
+        regressed |= print_result(result, baseline, args.max_regression)
+        if not args.no_save:
+            args.results.parent.mkdir(parents=True, exist_ok=True)
+            with args.results.open("a") as results_file:
+                results_file.write(json.dumps(result) + "\n")
+    if not args.no_save:
+        print(f"Results appended to {args.results}")
+    return 1 if regressed and args.fail_on_regression else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+"""Measures the import time of the crypto-report entry point and fails if it goes over
+the budget, or if any of the heavy SDKs are imported at startup.
+
+Usage:
+    python scripts/check_import_time.py [--budget-ms 300] [--runs 5]
+"""
+
+import argparse
+import subprocess
+import sys
+from typing import Dict, List
+
+ENTRY_POINT = "cryptonaire_reports.cli"
+# Modules that must only be imported when the source or report that needs them runs
+LAZY_MODULES = [
+    "pandas",
+    "binance",
+    "coinbase",
+    "pybit",
+    "gate_api",
+    "dexscreener",
+    "coinmarketcapapi",
+    "xlsxwriter",
+]
+DEFAULT_BUDGET_MS = 300
+
+
+def measure_import_time() -> Dict[str, int]:
+    """Imports the entry point in a fresh interpreter with -X importtime.
+
+    Returns:
+        Dict[str, int]: Dictionary where the keys are the imported modules and the
+            values their cumulative import time in microseconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {ENTRY_POINT}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative_times = {}
+    for line in result.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <module>"
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        if cumulative.strip().isdigit():
+            cumulative_times[module.strip()] = int(cumulative)
+    return cumulative_times
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    runs = [measure_import_time() for _ in range(args.runs)]
+    # The best run is the least affected by the noise of the machine
+    best_ms = min(run[ENTRY_POINT] for run in runs) / 1000
+    eager_modules = sorted(module for module in runs[0] if module in LAZY_MODULES)
+    print(f"{ENTRY_POINT} import time: {best_ms:.1f} ms (budget {args.budget_ms} ms)")
+
+    failed = False
+    if eager_modules:
+        print(f"Modules that should be imported lazily: {', '.join(eager_modules)}")
+        failed = True
+    if best_ms > args.budget_ms:
+        print("Import time budget exceeded")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))